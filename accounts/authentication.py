@@ -0,0 +1,96 @@
+"""
+JWT authentication that resolves users from a small in-process cache.
+
+The access token is verified statelessly (signature and expiry), so the
+only database work simplejwt does per request is loading the user row.
+CachedJWTAuthentication keeps recently seen users for
+AUTH_USER_CACHE_TTL_SECONDS in a bounded LRU, so a burst of requests from
+one client costs one query. Saving or deleting a user and blacklisting one
+of their tokens evict the entry in this process (see accounts/signals.py);
+other processes notice within the TTL.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    A thread-safe LRU of user instances with a per-entry time to live.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ttl() -> float:
+        return getattr(settings, 'AUTH_USER_CACHE_TTL_SECONDS', 60)
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, user):
+        if self._ttl() <= 0:
+            return
+        with self._lock:
+            self._entries[str(user.pk)] = (user, time.monotonic() + self._ttl())
+            self._entries.move_to_end(str(user.pk))
+            while len(self._entries) > getattr(settings, 'AUTH_USER_CACHE_SIZE', 1024):
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    simplejwt's JWTAuthentication with the user lookup served from
+    `user_cache`. Every request gets its own copy of the cached instance.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        cached = user_cache.get(user_id)
+        if cached is None:
+            # Raises for unknown, inactive and (optionally) revoked users.
+            user = super().get_user(validated_token)
+            user_cache.put(user)
+            return copy.copy(user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not cached.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(cached.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return copy.copy(cached)
@@ -0,0 +1,96 @@
+"""
+Buffered `last_login_at` updates.
+
+Logins only record their timestamp in this process's buffer. The buffer is
+written with a single UPDATE for all buffered users at most
+LOGIN_TRACKER_FLUSH_SECONDS after the first unflushed login (or as soon as
+LOGIN_TRACKER_MAX_BATCH users are waiting), so a login storm costs one write
+per batch instead of a full-row save per login.
+"""
+import atexit
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import User
+
+
+class LoginTracker:
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @staticmethod
+    def _flush_seconds() -> float:
+        return getattr(settings, 'LOGIN_TRACKER_FLUSH_SECONDS', 30)
+
+    def record(self, user, when=None):
+        """
+        Notes a login of `user`. The instance is updated right away; the
+        database at most LOGIN_TRACKER_FLUSH_SECONDS later.
+        """
+        when = when or timezone.now()
+        user.last_login_at = when
+        if self._flush_seconds() <= 0:
+            self._write({user.pk: when})
+            return
+
+        with self._lock:
+            self._pending[user.pk] = max(when, self._pending.get(user.pk, when))
+            full = len(self._pending) >= getattr(settings, 'LOGIN_TRACKER_MAX_BATCH', 500)
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self._flush_seconds(), self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes every buffered timestamp. Returns the number of users written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if pending:
+            self._write(pending)
+        return len(pending)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error flushing login timestamps: {e}")
+        finally:
+            # The timer thread has its own DB connection; don't leak it.
+            connection.close()
+
+    @staticmethod
+    def _write(pending: dict):
+        """
+        One UPDATE ... SET last_login_at = CASE id WHEN ... for all users.
+        GREATEST keeps a newer timestamp written by another process.
+        """
+        latest = Case(
+            *[When(pk=pk, then=Value(when)) for pk, when in pending.items()],
+            output_field=DateTimeField(),
+        )
+        # Only last_login_at is written; updated_at is left alone.
+        User.objects.filter(pk__in=list(pending)).update(
+            last_login_at=Greatest(Coalesce(F('last_login_at'), latest), latest)
+        )
+
+
+tracker = LoginTracker()
+atexit.register(tracker.flush)
+
+
+def record_login(user):
+    tracker.record(user)
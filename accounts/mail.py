@@ -0,0 +1,169 @@
+"""
+Outgoing email spool.
+
+Account flows call `enqueue_email`, which only inserts an OutgoingEmail row,
+so no request waits on an SMTP handshake. `manage.py send_queued_mail`
+claims batches of due messages and sends each batch over a single SMTP
+connection. Transient failures (connection problems, 4xx replies) are
+retried with backoff; permanent ones (5xx replies) fail the message.
+"""
+import random
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+
+def enqueue_email(to: str, subject: str, body: str) -> OutgoingEmail:
+    return OutgoingEmail.objects.create(
+        to=to,
+        subject=subject,
+        body=body,
+        max_attempts=getattr(settings, 'OUTGOING_EMAIL_MAX_ATTEMPTS', 5),
+    )
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    # Disconnects, timeouts, refused connections.
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    base = getattr(settings, 'OUTGOING_EMAIL_RETRY_BASE_SECONDS', 30)
+    delay = min(3600, base * (2 ** max(attempts - 1, 0)))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def requeue_expired_leases() -> int:
+    """
+    Puts back messages whose sender died mid-batch, or fails them if that
+    was their last attempt. Returns the number of messages put back.
+    """
+    expired = OutgoingEmail.objects.filter(
+        state=OutgoingEmail.MailState.SENDING, leased_until__lt=timezone.now()
+    )
+    expired.filter(attempts__gte=F('max_attempts')).update(
+        state=OutgoingEmail.MailState.FAILED,
+        leased_until=None,
+        last_error="Lease expired on the last attempt.",
+    )
+    return expired.update(state=OutgoingEmail.MailState.QUEUED, leased_until=None)
+
+
+def claim_emails(limit: int) -> list:
+    """
+    Leases up to `limit` due messages, with SKIP LOCKED where the database
+    supports it and a conditional UPDATE per message elsewhere.
+    """
+    now = timezone.now()
+    due = OutgoingEmail.objects.filter(
+        state=OutgoingEmail.MailState.QUEUED, available_at__lte=now
+    ).order_by('available_at', 'id')
+    lease = {
+        'state': OutgoingEmail.MailState.SENDING,
+        'leased_until': now + timedelta(seconds=getattr(settings, 'OUTGOING_EMAIL_LEASE_SECONDS', 120)),
+        'attempts': F('attempts') + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            OutgoingEmail.objects.filter(id__in=ids).update(**lease)
+    else:
+        ids = [
+            email_id for email_id in due.values_list('id', flat=True)[:limit]
+            if OutgoingEmail.objects.filter(id=email_id, state=OutgoingEmail.MailState.QUEUED).update(**lease)
+        ]
+    return list(OutgoingEmail.objects.filter(id__in=ids).order_by('available_at', 'id'))
+
+
+def _finish(email, **fields) -> bool:
+    """
+    Records the outcome of a send, but only while we still hold the lease:
+    once it expired, the message may have been requeued and leased by
+    another sender, whose outcome wins.
+    """
+    fields['leased_until'] = None
+    updated = OutgoingEmail.objects.filter(
+        pk=email.pk, state=OutgoingEmail.MailState.SENDING, leased_until=email.leased_until
+    ).update(**fields)
+    if not updated:
+        print(f"Lease on email {email.pk} expired before it was marked {fields['state']}.")
+        return False
+    for name, value in fields.items():
+        setattr(email, name, value)
+    return True
+
+
+def _mark_sent(email) -> bool:
+    return _finish(email, state=OutgoingEmail.MailState.SENT, sent_at=timezone.now(), last_error='')
+
+
+def _mark_failed(email, error: Exception) -> bool:
+    fields = {'last_error': f"{type(error).__name__}: {error}"}
+    if is_transient(error) and email.attempts < email.max_attempts:
+        fields['state'] = OutgoingEmail.MailState.QUEUED
+        fields['available_at'] = timezone.now() + _retry_delay(email.attempts)
+    else:
+        fields['state'] = OutgoingEmail.MailState.FAILED
+    return _finish(email, **fields)
+
+
+def deliver(emails) -> int:
+    """
+    Sends the claimed messages over one SMTP connection, reconnecting once
+    if the server drops it mid-batch. Returns the number sent.
+    """
+    if not emails:
+        return 0
+    smtp = get_connection(fail_silently=False)
+    sent = 0
+    try:
+        try:
+            smtp.open()
+        except Exception as e:
+            for email in emails:
+                _mark_failed(email, e)
+            return 0
+
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, to=[email.to], connection=smtp)
+            try:
+                smtp.send_messages([message])
+            except smtplib.SMTPServerDisconnected as e:
+                _mark_failed(email, e)
+                smtp.close()
+                try:
+                    smtp.open()
+                except Exception:
+                    # The rest of the batch is retried later.
+                    for remaining in emails[emails.index(email) + 1:]:
+                        _mark_failed(remaining, e)
+                    return sent
+            except Exception as e:
+                _mark_failed(email, e)
+            else:
+                _mark_sent(email)
+                sent += 1
+    finally:
+        smtp.close()
+    return sent
+
+
+def send_queued_mail(batch_size: int = None) -> tuple:
+    """
+    Claims and sends one batch. Returns (claimed, sent).
+    """
+    requeue_expired_leases()
+    emails = claim_emails(batch_size or getattr(settings, 'OUTGOING_EMAIL_BATCH_SIZE', 50))
+    return len(emails), deliver(emails)
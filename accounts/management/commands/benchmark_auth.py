@@ -0,0 +1,75 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from accounts.authentication import CachedJWTAuthentication, user_cache
+from accounts.models import User
+from accounts.views import get_tokens_for_user
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _whoami_view(authentication_class):
+    class WhoAmI(APIView):
+        authentication_classes = [authentication_class]
+        permission_classes = [IsAuthenticated]
+
+        def get(self, request):
+            return Response({'id': str(request.user.pk)})
+
+    return WhoAmI.as_view()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures authenticated requests per second with simplejwt's "
+        "JWTAuthentication and with the cached CachedJWTAuthentication. "
+        "The benchmark user is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help="Requests per run.")
+
+    def run(self, view, request_factory, token, count):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(count):
+                response = view(request_factory.get('/whoami/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+                assert response.status_code == 200, response.status_code
+            elapsed = time.perf_counter() - started
+        return count / elapsed, len(queries) / count
+
+    def handle(self, *args, **options):
+        count = max(1, options['requests'])
+        request_factory = APIRequestFactory()
+        try:
+            with transaction.atomic():
+                suffix = uuid.uuid4().hex[:8]
+                user = User.objects.create_user(
+                    email=f'benchmark-{suffix}@example.invalid', username=f'benchmark-{suffix}',
+                    password=None, first_name='Benchmark', last_name='User',
+                )
+                token = get_tokens_for_user(user)['access']
+                user_cache.clear()
+
+                for label, authentication_class in (
+                    ('JWTAuthentication', JWTAuthentication),
+                    ('CachedJWTAuthentication', CachedJWTAuthentication),
+                ):
+                    rate, queries = self.run(_whoami_view(authentication_class), request_factory, token, count)
+                    self.stdout.write(f"{label:<25} {rate:8.0f} req/s  {queries:.3f} queries/request")
+                raise _Rollback()
+        except _Rollback:
+            pass
+        finally:
+            user_cache.clear()
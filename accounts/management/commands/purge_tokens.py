@@ -0,0 +1,56 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts.tokens import purge_all_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes expired or used password reset and email verification "
+        "tokens in small batches, optionally archiving them first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=getattr(settings, 'TOKEN_PURGE_BATCH_SIZE', 1000),
+            help="Rows deleted per statement.",
+        )
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument('--archive', help="Append the deleted rows to this JSON lines file.")
+        parser.add_argument(
+            '--every', type=float, default=0,
+            help="Keep running and purge every this many seconds, as the one sweeping process.",
+        )
+
+    def handle(self, *args, **options):
+        if options['every'] <= 0:
+            self.purge(options)
+            return
+
+        stopping = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Shutting down...")
+            stopping.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        while not stopping.is_set():
+            close_old_connections()
+            self.purge(options)
+            stopping.wait(options['every'])
+
+    def purge(self, options):
+        purge_options = {'batch_size': max(1, options['batch_size']), 'pause': options['pause']}
+        if options['archive']:
+            with open(options['archive'], 'a') as archive:
+                purged = purge_all_tokens(archive=archive, **purge_options)
+        else:
+            purged = purge_all_tokens(**purge_options)
+        for table, count in purged.items():
+            self.stdout.write(f"Purged {count} token(s) from {table}.")
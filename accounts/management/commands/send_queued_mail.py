@@ -0,0 +1,40 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts.mail import send_queued_mail
+
+
+class Command(BaseCommand):
+    help = "Sends spooled outgoing emails in batches, one SMTP connection per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=getattr(settings, 'OUTGOING_EMAIL_BATCH_SIZE', 50),
+            help="Messages sent over one SMTP connection.",
+        )
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the spool is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the spool is drained.")
+
+    def handle(self, *args, **options):
+        stopping = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Shutting down after the current batch...")
+            stopping.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        while not stopping.is_set():
+            close_old_connections()
+            claimed, sent = send_queued_mail(max(1, options['batch_size']))
+            if claimed:
+                self.stdout.write(f"Sent {sent} of {claimed} email(s).")
+                continue
+            if options['once']:
+                break
+            stopping.wait(options['poll_interval'])
@@ -29,6 +29,13 @@ class PasswordResetToken(models.Model):
 
     class Meta:
         db_table = 'password_reset_tokens'
+        indexes = [
+            # Lookups only ever want tokens that haven't been used yet.
+            models.Index(fields=['token', 'expires_at'], name='pwd_reset_token_unused_idx', condition=models.Q(is_used=False)),
+            # Used by purge_tokens to find spent tokens without a scan.
+            models.Index(fields=['expires_at'], name='pwd_reset_token_expiry_idx'),
+            models.Index(fields=['created_at'], name='pwd_reset_token_used_idx', condition=models.Q(is_used=True)),
+        ]
 
 class EmailVerificationToken(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -40,3 +47,40 @@ class EmailVerificationToken(models.Model):
 
     class Meta:
         db_table = 'email_verification_tokens'
+        indexes = [
+            models.Index(fields=['token', 'expires_at'], name='email_token_unused_idx', condition=models.Q(is_used=False)),
+            models.Index(fields=['expires_at'], name='email_token_expiry_idx'),
+            models.Index(fields=['created_at'], name='email_token_used_idx', condition=models.Q(is_used=True)),
+        ]
+
+class OutgoingEmail(models.Model):
+    """
+    A spooled email. Views enqueue these instead of talking SMTP inline;
+    `manage.py send_queued_mail` delivers them in batches over one
+    connection (see accounts/mail.py).
+    """
+    class MailState(models.TextChoices):
+        QUEUED = 'QUEUED', 'Queued'
+        SENDING = 'SENDING', 'Sending'
+        SENT = 'SENT', 'Sent'
+        FAILED = 'FAILED', 'Failed'
+
+    id = models.BigAutoField(primary_key=True)
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    state = models.CharField(max_length=20, choices=MailState.choices, default=MailState.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    available_at = models.DateTimeField(default=timezone.now, help_text="Not sent before this time")
+    leased_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'outgoing_emails'
+        indexes = [
+            models.Index(fields=['state', 'available_at'], name='outgoing_email_claim_idx'),
+            models.Index(fields=['state', 'leased_until'], name='outgoing_email_lease_idx'),
+        ]
@@ -89,3 +89,6 @@ class PasswordResetSerializer(serializers.Serializer):
         if attrs['new_password'] != attrs['new_password_confirm']:
             raise serializers.ValidationError("Passwords don't match")
         return attrs
+
+class EmailVerificationSerializer(serializers.Serializer):
+    token = serializers.CharField()
@@ -0,0 +1,119 @@
+"""
+A local debugging SMTP server that keeps the messages it receives.
+
+Point the EMAIL_* settings at it to exercise the mail spool without a real
+mail server, optionally making it reject some messages with a transient
+error to see the retries:
+
+    python -m accounts.smtp_debug --port 1025 --fail-every 3
+    EMAIL_HOST=127.0.0.1 EMAIL_PORT=1025 EMAIL_USE_TLS=False python manage.py send_queued_mail
+"""
+import argparse
+import socketserver
+import threading
+from email import message_from_bytes
+
+
+class DebugSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Accepts every message and stores it in `messages`. Every `fail_every`-th
+    message is answered with a 451, which senders must treat as temporary.
+    `connection_count` counts SMTP sessions, so reuse can be checked.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), fail_every=0, verbose=False):
+        super().__init__(address, DebugSMTPHandler)
+        self.fail_every = fail_every
+        self.verbose = verbose
+        self.messages = []
+        self.connection_count = 0
+        self.rejected_count = 0
+        self._lock = threading.Lock()
+
+    def accept_message(self, envelope_from, recipients, data: bytes) -> bool:
+        with self._lock:
+            attempt = len(self.messages) + self.rejected_count + 1
+            if self.fail_every and attempt % self.fail_every == 0:
+                self.rejected_count += 1
+                return False
+            message = message_from_bytes(data)
+            self.messages.append({'from': envelope_from, 'to': recipients, 'message': message})
+        if self.verbose:
+            print(f"--- {envelope_from} -> {', '.join(recipients)}\n{data.decode('utf-8', 'replace')}")
+        return True
+
+
+class DebugSMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        with self.server._lock:
+            self.server.connection_count += 1
+        self.reply("220 debug-smtp ready")
+        envelope_from, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b"250-debug-smtp\r\n")
+                self.reply("250 8BITMIME")
+            elif verb == 'HELO':
+                self.reply("250 debug-smtp")
+            elif verb == 'MAIL':
+                envelope_from, recipients = command.split(':', 1)[1].strip(), []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip())
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    # Undo dot-stuffing.
+                    data.append(line[1:] if line.startswith(b"..") else line)
+                if self.server.accept_message(envelope_from, recipients, b"".join(data)):
+                    self.reply("250 OK queued")
+                else:
+                    self.reply("451 Temporary failure, try again later")
+                envelope_from, recipients = None, []
+            elif verb == 'RSET':
+                envelope_from, recipients = None, []
+                self.reply("250 OK")
+            elif verb == 'NOOP':
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+def start_debug_server(port=0, **options) -> DebugSMTPServer:
+    """
+    Starts the server in a background thread and returns it; call
+    `shutdown()` on it when done.
+    """
+    server = DebugSMTPServer(('127.0.0.1', port), **options)
+    threading.Thread(target=server.serve_forever, name='debug-smtp', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--fail-every', type=int, default=0)
+    args = parser.parse_args()
+
+    server = DebugSMTPServer(('127.0.0.1', args.port), args.fail_every, verbose=True)
+    print(f"Debugging SMTP server listening on 127.0.0.1:{args.port}")
+    server.serve_forever()
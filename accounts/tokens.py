@@ -0,0 +1,113 @@
+"""
+Purging of spent password reset and email verification tokens.
+
+Tokens are deleted once expired or used, in small batches that each commit
+on their own, so neither table is locked for long and the unique index on
+`token` stays small. Deleted rows can be archived as JSON lines; the token
+value itself is only kept as a SHA-256 digest.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EmailVerificationToken, PasswordResetToken
+
+TOKEN_MODELS = (PasswordResetToken, EmailVerificationToken)
+
+
+def _archive_record(model, row) -> dict:
+    return {
+        'table': model._meta.db_table,
+        'id': str(row['id']),
+        'user_id': str(row['user_id']),
+        'token_sha256': hashlib.sha256(row['token'].encode('utf-8')).hexdigest(),
+        'created_at': row['created_at'].isoformat(),
+        'expires_at': row['expires_at'].isoformat(),
+        'is_used': row['is_used'],
+    }
+
+
+def purge_tokens(model, batch_size: int = 1000, pause: float = 0.0, archive=None, now=None) -> int:
+    """
+    Deletes the expired or used tokens of `model`, `batch_size` rows per
+    statement, sleeping `pause` seconds between batches. `archive` is an
+    optional text file the deleted rows are written to. Returns the number
+    of rows deleted.
+    """
+    now = now or timezone.now()
+    # Expired tokens are found through the expires_at index, used ones
+    # through the small partial index on is_used.
+    conditions = (Q(expires_at__lt=now), Q(is_used=True))
+    deleted = 0
+    for condition in conditions:
+        while True:
+            rows = list(
+                model.objects.filter(condition)
+                .values('id', 'user_id', 'token', 'created_at', 'expires_at', 'is_used')[:batch_size]
+            )
+            if not rows:
+                break
+            if archive is not None:
+                for row in rows:
+                    archive.write(json.dumps(_archive_record(model, row)) + "\n")
+            deleted += model.objects.filter(pk__in=[row['id'] for row in rows]).delete()[0]
+            if len(rows) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return deleted
+
+
+def purge_all_tokens(**options) -> dict:
+    return {model._meta.db_table: purge_tokens(model, **options) for model in TOKEN_MODELS}
+
+
+class TokenSweeper(threading.Thread):
+    """
+    Purges spent tokens every TOKEN_SWEEP_INTERVAL_SECONDS from inside a web
+    server process; the WSGI/ASGI entrypoints start it. Each web process
+    sweeps independently, which is harmless: batches that find nothing cost
+    one indexed query. `manage.py purge_tokens --every` sweeps from a single
+    dedicated process instead.
+    """
+    daemon = True
+
+    def __init__(self, interval: float):
+        super().__init__(name='token-sweeper')
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                purged = purge_all_tokens(batch_size=getattr(settings, 'TOKEN_PURGE_BATCH_SIZE', 1000))
+                if any(purged.values()):
+                    print(f"Token sweeper purged {purged}.")
+            except Exception as e:
+                print(f"Token sweeper error: {e}")
+            finally:
+                connection.close()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def start_sweeper():
+    """
+    Starts the in-process sweeper once, if TOKEN_SWEEP_INTERVAL_SECONDS is set.
+    """
+    global _sweeper
+    interval = getattr(settings, 'TOKEN_SWEEP_INTERVAL_SECONDS', 0)
+    if interval <= 0 or _sweeper is not None:
+        return
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = TokenSweeper(interval)
+            _sweeper.start()
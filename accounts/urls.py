@@ -11,4 +11,5 @@ urlpatterns = [
     path('change-password/', views.change_password_view, name='change_password'),
     path('password-reset-request/', views.password_reset_request_view, name='password_reset_request'),
     path('password-reset/', views.password_reset_view, name='password_reset'),
+    path('verify-email/', views.verify_email_view, name='verify_email'),
 ]
@@ -4,14 +4,16 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import login, logout
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
 import secrets
 from datetime import timedelta
+from .login_tracker import record_login
+from .mail import enqueue_email
 from .models import User, PasswordResetToken, EmailVerificationToken
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer,
-    PasswordChangeSerializer, PasswordResetRequestSerializer, PasswordResetSerializer
+    PasswordChangeSerializer, PasswordResetRequestSerializer, PasswordResetSerializer,
+    EmailVerificationSerializer
 )
 
 def get_tokens_for_user(user):
@@ -21,12 +23,31 @@ def get_tokens_for_user(user):
         'access': str(refresh.access_token),
     }
 
+def queue_verification_email(user):
+    """
+    Creates an email verification token and spools the message; it is sent
+    by `manage.py send_queued_mail`, not during the request.
+    """
+    token = EmailVerificationToken.objects.create(
+        user=user,
+        token=secrets.token_urlsafe(32),
+        expires_at=timezone.now() + timedelta(hours=24)
+    )
+    enqueue_email(
+        user.email,
+        "Verify your email address",
+        f"Hi {user.first_name},\n\n"
+        f"Confirm your email address by opening this link within 24 hours:\n"
+        f"{settings.FRONTEND_URL}/verify-email?token={token.token}\n",
+    )
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def register_view(request):
     serializer = UserRegistrationSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
+        queue_verification_email(user)
         tokens = get_tokens_for_user(user)
         return Response({
             'message': 'Registration successful',
@@ -41,8 +62,8 @@ def login_view(request):
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']
-        user.last_login_at = timezone.now()
-        user.save()
+        # Buffered and written in batches; see login_tracker.py.
+        record_login(user)
         tokens = get_tokens_for_user(user)
         return Response({
             'message': 'Login successful',
@@ -76,7 +97,7 @@ def change_password_view(request):
     if serializer.is_valid():
         user = request.user
         user.set_password(serializer.validated_data['new_password'])
-        user.save()
+        user.save(update_fields=['password', 'updated_at'])
         return Response({'message': 'Password changed successfully'})
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -93,6 +114,15 @@ def password_reset_request_view(request):
             token=token,
             expires_at=timezone.now() + timedelta(hours=1)
         )
+        # Spooled; `manage.py send_queued_mail` delivers it.
+        enqueue_email(
+            user.email,
+            "Reset your password",
+            f"Hi {user.first_name},\n\n"
+            f"Reset your password by opening this link within one hour:\n"
+            f"{settings.FRONTEND_URL}/reset-password?token={reset_token.token}\n\n"
+            f"If you did not ask for this, you can ignore this email.\n",
+        )
         return Response({'message': 'Password reset email sent'})
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -110,10 +140,31 @@ def password_reset_view(request):
             )
             user = reset_token.user
             user.set_password(serializer.validated_data['new_password'])
-            user.save()
+            user.save(update_fields=['password', 'updated_at'])
             reset_token.is_used = True
-            reset_token.save()
+            reset_token.save(update_fields=['is_used'])
             return Response({'message': 'Password reset successful'})
         except PasswordResetToken.DoesNotExist:
             return Response({'error': 'Invalid or expired token'}, status=status.HTTP_400_BAD_REQUEST)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def verify_email_view(request):
+    serializer = EmailVerificationSerializer(data=request.data)
+    if serializer.is_valid():
+        try:
+            verification_token = EmailVerificationToken.objects.get(
+                token=serializer.validated_data['token'],
+                is_used=False,
+                expires_at__gt=timezone.now()
+            )
+        except EmailVerificationToken.DoesNotExist:
+            return Response({'error': 'Invalid or expired token'}, status=status.HTTP_400_BAD_REQUEST)
+        user = verification_token.user
+        user.is_email_verified = True
+        user.save(update_fields=['is_email_verified', 'updated_at'])
+        verification_token.is_used = True
+        verification_token.save(update_fields=['is_used'])
+        return Response({'message': 'Email verified successfully'})
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -3,6 +3,7 @@ Django settings for your project, configured to use environment variables.
 """
 
 import os
+from datetime import timedelta
 from pathlib import Path
 import environ
 
@@ -38,7 +39,10 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
+    'rest_framework',
+    'rest_framework_simplejwt.token_blacklist',
     'accounts',
     'uploads',
     'services',
@@ -47,6 +51,8 @@ INSTALLED_APPS = [
 
 # --- Middleware ---
 MIDDLEWARE = [
+    # First, so the latency it records covers the whole stack.
+    'services.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +93,8 @@ TEMPLATES = [
 
 # --- WSGI Application ---
 WSGI_APPLICATION = 'irs.wsgi.application' # <-- CHANGE 'your_project_name'
+# The document event stream is async; serve it with irs.asgi:application.
+ASGI_APPLICATION = 'irs.asgi.application'
 
 
 # --- Database Configuration ---
@@ -127,8 +135,163 @@ EMAIL_PORT = env.int('EMAIL_PORT')
 EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS')
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
+EMAIL_TIMEOUT = env.int('EMAIL_TIMEOUT', default=10)
+DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='no-reply@localhost')
+# Links in account emails point here.
+FRONTEND_URL = env('FRONTEND_URL', default='http://localhost:3000')
+# Account emails are spooled in the outgoing_emails table and sent by
+# `manage.py send_queued_mail`, one SMTP connection per batch.
+OUTGOING_EMAIL_BATCH_SIZE = env.int('OUTGOING_EMAIL_BATCH_SIZE', default=50)
+OUTGOING_EMAIL_MAX_ATTEMPTS = env.int('OUTGOING_EMAIL_MAX_ATTEMPTS', default=5)
+OUTGOING_EMAIL_RETRY_BASE_SECONDS = env.int('OUTGOING_EMAIL_RETRY_BASE_SECONDS', default=30)
+OUTGOING_EMAIL_LEASE_SECONDS = env.int('OUTGOING_EMAIL_LEASE_SECONDS', default=120)
+
+
+# --- API Authentication ---
+# JWT access tokens for API clients, sessions for the browsable API and admin.
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'accounts.authentication.CachedJWTAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+    ],
+}
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=env.int('JWT_ACCESS_TOKEN_MINUTES', default=5)),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=env.int('JWT_REFRESH_TOKEN_DAYS', default=1)),
+    # Reject tokens issued before the user's last password change.
+    'CHECK_REVOKE_TOKEN': env.bool('JWT_CHECK_REVOKE_TOKEN', default=False),
+}
+# Users resolved from access tokens are cached per process for this long
+# (0 disables the cache). Other processes see a deactivation within the TTL.
+AUTH_USER_CACHE_TTL_SECONDS = env.int('AUTH_USER_CACHE_TTL_SECONDS', default=60)
+AUTH_USER_CACHE_SIZE = env.int('AUTH_USER_CACHE_SIZE', default=1024)
+
+
+# --- Token Purging ---
+# Expired or used password reset / email verification tokens are deleted by
+# `manage.py purge_tokens` (`--every N` to keep sweeping), or by a sweeper
+# thread in each web server process every this many seconds (0 disables it).
+TOKEN_SWEEP_INTERVAL_SECONDS = env.int('TOKEN_SWEEP_INTERVAL_SECONDS', default=0)
+TOKEN_PURGE_BATCH_SIZE = env.int('TOKEN_PURGE_BATCH_SIZE', default=1000)
+
+
+# --- Login Tracking ---
+# last_login_at is buffered per process and written in one UPDATE per batch,
+# at most this many seconds after a login (0 writes on every login).
+LOGIN_TRACKER_FLUSH_SECONDS = env.int('LOGIN_TRACKER_FLUSH_SECONDS', default=30)
+LOGIN_TRACKER_MAX_BATCH = env.int('LOGIN_TRACKER_MAX_BATCH', default=500)
 
 
 # --- Custom App Settings ---
 # You can add your own settings from the .env file here
-OPENAI_API_KEY = env('OPENAI_API_KEY')
\ No newline at end of file
+OPENAI_API_KEY = env('OPENAI_API_KEY')
+# Point this at a compatible server (e.g. `python -m services.openai_stub`) for local testing.
+OPENAI_BASE_URL = env('OPENAI_BASE_URL', default=None)
+OPENAI_TIMEOUT_SECONDS = env.float('OPENAI_TIMEOUT_SECONDS', default=60)
+OPENAI_MAX_CONCURRENCY = env.int('OPENAI_MAX_CONCURRENCY', default=8)
+OPENAI_REQUESTS_PER_MINUTE = env.int('OPENAI_REQUESTS_PER_MINUTE', default=500)
+OPENAI_TOKENS_PER_MINUTE = env.int('OPENAI_TOKENS_PER_MINUTE', default=200000)
+OPENAI_MAX_RETRIES = env.int('OPENAI_MAX_RETRIES', default=6)
+OPENAI_RETRY_BASE_SECONDS = env.float('OPENAI_RETRY_BASE_SECONDS', default=1.0)
+OPENAI_RETRY_MAX_SECONDS = env.float('OPENAI_RETRY_MAX_SECONDS', default=60.0)
+# USD per million tokens, used for cost estimates (`reanalyze --dry-run`).
+OPENAI_INPUT_PRICE_PER_MILLION = env.float('OPENAI_INPUT_PRICE_PER_MILLION', default=0.15)
+OPENAI_OUTPUT_PRICE_PER_MILLION = env.float('OPENAI_OUTPUT_PRICE_PER_MILLION', default=0.60)
+
+# --- Uploads ---
+# Request bodies larger than this are rejected while they are being read.
+MAX_UPLOAD_SIZE = env.int('MAX_UPLOAD_SIZE', default=25 * 1024 * 1024)  # 25 MB in bytes
+# Uploads are spooled here (by default MEDIA_ROOT/.upload-staging); keep it on
+# the same filesystem as the media storage so saving is a rename.
+UPLOAD_STAGING_DIR = env('UPLOAD_STAGING_DIR', default=None)
+# Resumable uploads (api/upload/sessions/) are purged by `manage.py purge_upload_sessions`
+# once they have been idle for UPLOAD_SESSION_TTL_SECONDS.
+MAX_RESUMABLE_UPLOAD_SIZE = env.int('MAX_RESUMABLE_UPLOAD_SIZE', default=2 * 1024 * 1024 * 1024)  # 2 GB
+UPLOAD_SESSION_TTL_SECONDS = env.int('UPLOAD_SESSION_TTL_SECONDS', default=24 * 60 * 60)
+# Downloads (api/upload/<id>/download/) are sent by Django unless a reverse proxy
+# takes over: 'x-accel-redirect' (nginx, with an internal location at
+# DOWNLOAD_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile'.
+DOWNLOAD_OFFLOAD = env('DOWNLOAD_OFFLOAD', default='')
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = env('DOWNLOAD_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+# Header metadata of new uploads is extracted by this many background threads
+# (0 leaves it to `manage.py extract_media_metadata`). Uploads beyond
+# MEDIA_METADATA_MAX_PENDING waiting for a thread are left to the command too.
+MEDIA_METADATA_WORKERS = env.int('MEDIA_METADATA_WORKERS', default=2)
+MEDIA_METADATA_MAX_PENDING = env.int('MEDIA_METADATA_MAX_PENDING', default=100)
+
+
+# --- File Storage ---
+# Media uploads are stored content-addressed (uploads/storage.py): identical
+# files share one blob and every upload name is a hard link to it.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'media': {'BACKEND': env('MEDIA_STORAGE_BACKEND', default='uploads.storage.ContentAddressedStorage')},
+}
+
+
+# --- Cache ---
+# Use a shared backend (e.g. CACHE_URL=rediscache://redis:6379/1) when running
+# more than one web process.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+
+
+# --- Document API ---
+DOCUMENT_PAGE_SIZE = env.int('DOCUMENT_PAGE_SIZE', default=50)
+DOCUMENT_MAX_PAGE_SIZE = env.int('DOCUMENT_MAX_PAGE_SIZE', default=200)
+# Rendered list/detail responses are cached per user and version for this long.
+DOCUMENT_CACHE_TIMEOUT = env.int('DOCUMENT_CACHE_TIMEOUT', default=300)
+# Days covered by the analytics endpoint when no range is given.
+ANALYTICS_DEFAULT_DAYS = env.int('ANALYTICS_DEFAULT_DAYS', default=30)
+
+
+# --- Document Status Events (Server-Sent Events) ---
+# 'postgres' fans out through LISTEN/NOTIFY across processes, 'inprocess' only
+# within one process. Defaults to 'postgres' when the database is PostgreSQL.
+DOCUMENT_EVENTS_BACKEND = env('DOCUMENT_EVENTS_BACKEND', default=None)
+DOCUMENT_EVENTS_HEARTBEAT_SECONDS = env.int('DOCUMENT_EVENTS_HEARTBEAT_SECONDS', default=15)
+
+
+# --- Semantic Search ---
+# Per-user memory-mapped vector indexes, updated as analyses are saved.
+SEARCH_INDEX_ENABLED = env.bool('SEARCH_INDEX_ENABLED', default=True)
+SEARCH_INDEX_DIR = env('SEARCH_INDEX_DIR', default=os.path.join(BASE_DIR, 'search_index'))
+# Changing the dimension requires rebuilding the indexes.
+SEARCH_INDEX_DIM = env.int('SEARCH_INDEX_DIM', default=1024)
+# Text search configuration of the keyword search vectors (PostgreSQL).
+SEARCH_TEXT_CONFIG = env('SEARCH_TEXT_CONFIG', default='english')
+
+
+# --- Analysis Job Queue ---
+# Used by `manage.py run_analysis_workers`.
+ANALYSIS_WORKER_CONCURRENCY = env.int('ANALYSIS_WORKER_CONCURRENCY', default=4)
+ANALYSIS_JOB_LEASE_SECONDS = env.int('ANALYSIS_JOB_LEASE_SECONDS', default=300)
+ANALYSIS_JOB_MAX_ATTEMPTS = env.int('ANALYSIS_JOB_MAX_ATTEMPTS', default=5)
+ANALYSIS_JOB_RETRY_BASE_SECONDS = env.int('ANALYSIS_JOB_RETRY_BASE_SECONDS', default=10)
+ANALYSIS_JOB_RETRY_MAX_SECONDS = env.int('ANALYSIS_JOB_RETRY_MAX_SECONDS', default=600)
+
+# --- Metrics ---
+# /metrics serves Prometheus metrics of the web process; set METRICS_TOKEN to
+# require `Authorization: Bearer <token>`. Analysis workers serve theirs on
+# ANALYSIS_WORKER_METRICS_PORT (0 disables it).
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+ANALYSIS_WORKER_METRICS_PORT = env.int('ANALYSIS_WORKER_METRICS_PORT', default=0)
+
+
+# --- Document Analysis ---
+# Long documents are split into chunks of ANALYSIS_CHUNK_TOKENS that are
+# analyzed in parallel and merged. Set ANALYSIS_CHUNKED_MODE=False to only
+# analyze the beginning of each document.
+ANALYSIS_CHUNKED_MODE = env.bool('ANALYSIS_CHUNKED_MODE', default=True)
+ANALYSIS_CHUNK_TOKENS = env.int('ANALYSIS_CHUNK_TOKENS', default=2000)
+ANALYSIS_CHUNK_CONCURRENCY = env.int('ANALYSIS_CHUNK_CONCURRENCY', default=4)
+ANALYSIS_MAX_CHUNKS = env.int('ANALYSIS_MAX_CHUNKS', default=100)
+# Text extraction runs in a pool of EXTRACTION_PROCESSES processes.
+EXTRACTION_USE_PROCESS_POOL = env.bool('EXTRACTION_USE_PROCESS_POOL', default=True)
+EXTRACTION_PROCESSES = env.int('EXTRACTION_PROCESSES', default=2)
+EXTRACTION_QUEUE_SIZE = env.int('EXTRACTION_QUEUE_SIZE', default=8)
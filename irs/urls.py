@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
+from services.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/accounts/', include('accounts.urls')),
     path('api/upload/', include('uploads.urls')),
     path('api/services/', include('services.urls')),
+    path('metrics', metrics_view, name='metrics'),
     ]
\ No newline at end of file
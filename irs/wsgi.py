@@ -3,3 +3,9 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'irs.settings')
 application = get_wsgi_application()
+
+# Only web server processes sweep tokens in the background, not management
+# commands or the analysis workers (see TOKEN_SWEEP_INTERVAL_SECONDS).
+from accounts.tokens import start_sweeper  # noqa: E402
+
+start_sweeper()
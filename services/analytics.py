@@ -0,0 +1,166 @@
+"""
+Per-user analytics served from DailyUserRollup rows.
+
+Every upload and every analysis outcome applies a small delta to the
+rollup row of the document's owner and upload day, so the analytics
+endpoint never aggregates the document tables. A re-analysis first takes
+back the contribution of the previous outcome, and a deleted document
+takes back everything it contributed, which keeps the counters exact. `manage.py backfill_rollups` rebuilds the rows from history.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DailyUserRollup, Document
+
+# Only the most frequent key phrases of a day are kept, which bounds the
+# row size; phrases beyond that are dropped from the day's counts.
+MAX_KEY_PHRASES_PER_DAY = 100
+
+
+def normalize_phrase(phrase) -> str:
+    return str(phrase).strip().lower()
+
+
+def outcome_contribution(status, sentiment, key_phrases) -> dict:
+    """
+    What one analysis outcome adds to its day's rollup.
+    """
+    contribution = {
+        'completed': int(status == Document.UploadStatus.COMPLETED),
+        'failed': int(status == Document.UploadStatus.FAILED),
+        'sentiments': Counter(),
+        'key_phrases': Counter(),
+    }
+    if contribution['completed']:
+        if sentiment:
+            contribution['sentiments'][str(sentiment).strip().lower()] += 1
+        contribution['key_phrases'].update(
+            {normalize_phrase(phrase) for phrase in key_phrases or [] if normalize_phrase(phrase)}
+        )
+    return contribution
+
+
+def _merge_counts(current: dict, added: Counter, removed: Counter, limit: int = None) -> dict:
+    counts = Counter(current)
+    counts.update(added)
+    counts.subtract(removed)
+    counts = +counts  # drops zero and negative entries
+    return dict(counts.most_common(limit))
+
+
+def _apply(user_id, day, documents=0, bytes_uploaded=0, added=None, removed=None, create=True):
+    empty = outcome_contribution(None, None, None)
+    added, removed = added or empty, removed or empty
+    with transaction.atomic():
+        rollups = DailyUserRollup.objects.select_for_update()
+        if create:
+            rollup, _ = rollups.get_or_create(user_id=user_id, day=day)
+        else:
+            rollup = rollups.filter(user_id=user_id, day=day).first()
+            if rollup is None:
+                return
+        rollup.documents = max(0, rollup.documents + documents)
+        rollup.bytes_uploaded = max(0, rollup.bytes_uploaded + bytes_uploaded)
+        rollup.completed = max(0, rollup.completed + added['completed'] - removed['completed'])
+        rollup.failed = max(0, rollup.failed + added['failed'] - removed['failed'])
+        rollup.sentiments = _merge_counts(rollup.sentiments, added['sentiments'], removed['sentiments'])
+        rollup.key_phrases = _merge_counts(
+            rollup.key_phrases, added['key_phrases'], removed['key_phrases'], MAX_KEY_PHRASES_PER_DAY
+        )
+        if create or rollup.documents:
+            rollup.save()
+        else:
+            # The day's last document is gone; a rebuild would not have a row either.
+            rollup.delete()
+
+
+def _day(document):
+    return timezone.localdate(document.uploaded_at)
+
+
+def record_upload(document):
+    if document.user_id:
+        _apply(document.user_id, _day(document), documents=1, bytes_uploaded=document.filesize)
+
+
+def record_outcome(document, analysis, previous=None):
+    """
+    Adds the document's new analysis outcome to its rollup. `previous` is
+    the (status, sentiment, key_phrases) the document had before this
+    analysis started, whose contribution is taken back.
+    """
+    if not document.user_id:
+        return
+    added = outcome_contribution(
+        document.status,
+        analysis.get('sentiment') if analysis else None,
+        analysis.get('key_phrases') if analysis else None,
+    )
+    removed = outcome_contribution(*previous) if previous else None
+    _apply(document.user_id, _day(document), added=added, removed=removed)
+
+
+def record_deletion(document, outcome=None):
+    """
+    Takes back everything a deleted document contributed: its upload and
+    `outcome`, the (status, sentiment, key_phrases) it had when deleted.
+    The rollup row is left alone if it is already gone, e.g. because the
+    owner is being deleted too.
+    """
+    if document.user_id:
+        _apply(
+            document.user_id,
+            _day(document),
+            documents=-1,
+            bytes_uploaded=-document.filesize,
+            removed=outcome_contribution(*outcome) if outcome else None,
+            create=False,
+        )
+
+
+def get_user_analytics(user, since=None, until=None, top_phrases: int = 20) -> dict:
+    """
+    Daily series and totals for `user` between two dates (inclusive),
+    read only from the rollup table.
+    """
+    until = until or timezone.localdate()
+    since = since or until - timedelta(days=getattr(settings, 'ANALYTICS_DEFAULT_DAYS', 30) - 1)
+    rollups = list(
+        DailyUserRollup.objects
+        .filter(user=user, day__gte=since, day__lte=until)
+        .order_by('day')
+    )
+
+    sentiments, key_phrases = Counter(), Counter()
+    days = []
+    for rollup in rollups:
+        sentiments.update(rollup.sentiments)
+        key_phrases.update(rollup.key_phrases)
+        days.append({
+            'day': rollup.day,
+            'documents': rollup.documents,
+            'bytes_uploaded': rollup.bytes_uploaded,
+            'completed': rollup.completed,
+            'failed': rollup.failed,
+            'sentiments': rollup.sentiments,
+        })
+
+    totals = {
+        'documents': sum(day['documents'] for day in days),
+        'bytes_uploaded': sum(day['bytes_uploaded'] for day in days),
+        'completed': sum(day['completed'] for day in days),
+        'failed': sum(day['failed'] for day in days),
+    }
+    totals['in_progress'] = max(0, totals['documents'] - totals['completed'] - totals['failed'])
+    return {
+        'since': since,
+        'until': until,
+        'totals': totals,
+        'sentiments': dict(sentiments.most_common()),
+        'top_key_phrases': [{'phrase': phrase, 'count': count} for phrase, count in key_phrases.most_common(top_phrases)],
+        'days': days,
+    }
@@ -0,0 +1,28 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_search_indexes(sender, using, **kwargs):
+    """
+    Adds the full-text and trigram indexes, which have no SQLite equivalent
+    and so are not part of the models' Meta.
+    """
+    from django.db import connections
+
+    from .keyword_search import backfill_search_vectors, create_indexes
+
+    if connections[using].vendor != 'postgresql':
+        return
+    create_indexes()
+    backfilled = backfill_search_vectors()
+    if backfilled:
+        print(f"Built the search vector of {backfilled} existing analyses.")
+
+
+class ServicesConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'services'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(create_search_indexes, sender=self)
@@ -0,0 +1,177 @@
+"""
+Fan-out of document status changes to Server-Sent Events subscribers.
+
+Every process keeps an in-memory registry of open event streams. On
+PostgreSQL, events are published with NOTIFY, so a change made by the
+analysis workers reaches streams held by any web process: each web process
+LISTENs on one dedicated connection and dispatches locally. Without
+PostgreSQL, events are only dispatched within the publishing process.
+"""
+import asyncio
+import json
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+
+from .models import DocumentAnalysis
+from .serializer import DocumentAnalysisSerializer
+
+CHANNEL = 'document_events'
+# NOTIFY payloads must stay below 8000 bytes.
+MAX_NOTIFY_PAYLOAD = 7500
+
+
+class EventBroker:
+    """
+    Maps user ids to the asyncio queues of their open event streams.
+    `dispatch` may be called from any thread.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=getattr(settings, 'DOCUMENT_EVENTS_QUEUE_SIZE', 100))
+        with self._lock:
+            self._subscribers.setdefault(str(user_id), set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(str(user_id), set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(str(user_id), None)
+
+    def dispatch(self, user_id, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(str(user_id), ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, event)
+
+    @staticmethod
+    def _offer(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A stalled client loses events rather than growing memory.
+            pass
+
+
+broker = EventBroker()
+
+
+def _backend() -> str:
+    backend = getattr(settings, 'DOCUMENT_EVENTS_BACKEND', None)
+    if backend:
+        return backend
+    return 'postgres' if connection.vendor == 'postgresql' else 'inprocess'
+
+
+def build_document_event(document) -> dict:
+    event = {
+        'id': str(document.id),
+        'user_id': str(document.user_id),
+        'status': document.status,
+        'processed_at': document.processed_at,
+    }
+    if document.status == document.UploadStatus.COMPLETED:
+        analysis = getattr(document, 'analysis', None)
+        if analysis is not None:
+            event['analysis'] = DocumentAnalysisSerializer(analysis).data
+    return event
+
+
+def publish_document_event(document):
+    """
+    Announces the document's current status once the surrounding
+    transaction (if any) commits.
+    """
+    if not document.user_id:
+        return
+    event = build_document_event(document)
+
+    if _backend() == 'postgres':
+        payload = json.dumps(event, cls=DjangoJSONEncoder)
+        if len(payload.encode('utf-8')) > MAX_NOTIFY_PAYLOAD:
+            # Listeners load the analysis themselves.
+            event.pop('analysis', None)
+            event['analysis_omitted'] = True
+            payload = json.dumps(event, cls=DjangoJSONEncoder)
+        with connection.cursor() as cursor:
+            # NOTIFY is only delivered when the transaction commits.
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+    else:
+        event = json.loads(json.dumps(event, cls=DjangoJSONEncoder))
+        transaction.on_commit(lambda: broker.dispatch(event['user_id'], event))
+
+
+class PostgresListener(threading.Thread):
+    """
+    LISTENs for document events on a dedicated connection and dispatches
+    them to this process's subscribers. Reconnects when the connection drops.
+    """
+    daemon = True
+
+    def __init__(self):
+        super().__init__(name='document-events-listener')
+
+    def _connect(self):
+        import psycopg2
+
+        params = connections['default'].get_connection_params()
+        conn = psycopg2.connect(**params)
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return conn
+
+    def _complete(self, event):
+        if event.pop('analysis_omitted', False):
+            analysis = DocumentAnalysis.objects.filter(document_id=event['id']).first()
+            if analysis is not None:
+                event['analysis'] = DocumentAnalysisSerializer(analysis).data
+            connections['default'].close()
+        return event
+
+    def run(self):
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        event = self._complete(json.loads(notify.payload))
+                        broker.dispatch(event['user_id'], event)
+            except Exception as e:
+                print(f"Document event listener error: {e}; reconnecting...")
+                if conn is not None:
+                    conn.close()
+                time.sleep(1)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def ensure_listener():
+    """
+    Starts the LISTEN thread the first time a stream is opened in a process
+    that uses the postgres backend.
+    """
+    global _listener
+    if _backend() != 'postgres' or _listener is not None:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = PostgresListener()
+            _listener.start()
@@ -0,0 +1,183 @@
+"""
+Streaming text extraction for uploaded documents.
+
+Extractors are generators registered per file extension. They yield the text
+a page or a group of paragraphs at a time, so a large upload is never held in
+memory as one string. `iter_document_text` runs the extractor in a process
+pool (CPU-heavy PDF parsing then doesn't hold the worker's GIL) and streams
+the chunks back through a bounded queue.
+"""
+import io
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+# Roughly how much text an extractor collects before yielding it.
+CHUNK_CHARS = 64 * 1024
+
+_EXTRACTORS = {}
+
+
+def register_extractor(*extensions):
+    """
+    Registers a generator `extractor(fileobj)` for the given extensions.
+    """
+    def decorator(func):
+        for extension in extensions:
+            _EXTRACTORS[extension.lower()] = func
+        return func
+    return decorator
+
+
+def get_extractor(filename: str):
+    return _EXTRACTORS.get(os.path.splitext(filename)[1].lower())
+
+
+@register_extractor('.txt', '.md', '.csv')
+def extract_plain_text(fileobj):
+    """
+    Yields paragraphs of a UTF-8 text file, reading it line by line.
+    """
+    reader = io.TextIOWrapper(fileobj, encoding='utf-8', errors='replace')
+    buffer, size = [], 0
+    for line in reader:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_CHARS or (not line.strip() and size >= CHUNK_CHARS // 4):
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+@register_extractor('.pdf')
+def extract_pdf(fileobj):
+    """
+    Yields the text of a PDF one page at a time. Requires `pypdf`.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(fileobj)
+    for page in reader.pages:
+        text = page.extract_text() or ''
+        if text.strip():
+            yield text
+
+
+@register_extractor('.docx')
+def extract_docx(fileobj):
+    """
+    Yields the paragraphs of a Word document in groups. Requires `python-docx`.
+    """
+    import docx
+
+    buffer, size = [], 0
+    for paragraph in docx.Document(fileobj).paragraphs:
+        if not paragraph.text.strip():
+            continue
+        buffer.append(paragraph.text)
+        size += len(paragraph.text)
+        if size >= CHUNK_CHARS:
+            yield '\n\n'.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield '\n\n'.join(buffer)
+
+
+def _extract_to_queue(path: str, out, cancelled):
+    """
+    Runs in a pool process: streams the extractor's output into `out`,
+    followed by None when done or an ('error', message) tuple on failure.
+    """
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                out.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        extractor = get_extractor(path)
+        with open(path, 'rb') as f:
+            for chunk in extractor(f):
+                if not put(chunk):
+                    return
+    except Exception as e:
+        put(('error', f"{e.__class__.__name__}: {e}"))
+        return
+    put(None)
+
+
+_pool = None
+_manager = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _manager
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: the analysis workers are multi-threaded.
+                context = multiprocessing.get_context('spawn')
+                _manager = context.Manager()
+                _pool = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'EXTRACTION_PROCESSES', 2),
+                    mp_context=context,
+                )
+    return _pool, _manager
+
+
+def _iter_in_pool(path: str):
+    pool, manager = _get_pool()
+    out = manager.Queue(maxsize=getattr(settings, 'EXTRACTION_QUEUE_SIZE', 8))
+    cancelled = manager.Event()
+    future = pool.submit(_extract_to_queue, path, out, cancelled)
+    try:
+        while True:
+            try:
+                item = out.get(timeout=1)
+            except queue.Empty:
+                if future.done():
+                    # The process died without saying goodbye.
+                    future.result()
+                    raise RuntimeError("Text extraction process exited unexpectedly.")
+                continue
+            if item is None:
+                return
+            if isinstance(item, tuple):
+                raise ValueError(item[1])
+            yield item
+    finally:
+        cancelled.set()
+
+
+def iter_document_text(fieldfile):
+    """
+    Yields the text of a stored document chunk by chunk.
+
+    Files on local storage are parsed in the extraction process pool; for
+    storages without a filesystem path the extractor runs in this process on
+    the storage's file object.
+    """
+    name = fieldfile.name
+    if get_extractor(name) is None:
+        raise ValueError(f"Unsupported file type: {os.path.splitext(name)[1] or name}")
+
+    try:
+        path = fieldfile.path
+    except NotImplementedError:
+        path = None
+
+    if path and getattr(settings, 'EXTRACTION_USE_PROCESS_POOL', True):
+        yield from _iter_in_pool(path)
+        return
+
+    with fieldfile.open('rb') as f:
+        yield from get_extractor(name)(f)
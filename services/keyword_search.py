@@ -0,0 +1,224 @@
+"""
+Keyword search over analysis summaries, key phrases and filenames.
+
+On PostgreSQL, every analysis keeps a weighted `tsvector` (summary A, key
+phrases B, filename C) in `DocumentAnalysis.search_vector`, backed by a GIN
+index, and filenames additionally have a `pg_trgm` GIN index for fuzzy
+matches. Elsewhere (SQLite in local development) a plain substring scan
+stands in, with the same response shape.
+"""
+import html
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank, SearchVector, TrigramSimilarity,
+)
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery, TextField
+from django.db.models.functions import Cast
+
+from .models import Document, DocumentAnalysis
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+# What ts_headline marks matches with: private use characters that survive
+# html.escape() and are then swapped for the <mark> tags.
+HEADLINE_START = '\ue000'
+HEADLINE_STOP = '\ue001'
+
+# Created after migrations (see ServicesConfig) because neither the GIN
+# operator classes nor the extension exist on SQLite.
+POSTGRES_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS document_analysis_search_idx '
+    'ON services_documentanalysis USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS document_filename_trgm_idx '
+    'ON services_document USING gin (original_filename gin_trgm_ops)',
+]
+
+
+def is_supported() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def _config() -> str:
+    return getattr(settings, 'SEARCH_TEXT_CONFIG', 'english')
+
+
+def search_vector_expression():
+    """
+    The weighted tsvector of an analysis row, for use in an UPDATE.
+    """
+    # SearchVector casts each part to text and coalesces NULLs itself.
+    filename = Subquery(Document.objects.filter(pk=OuterRef('document_id')).order_by().values('original_filename')[:1])
+    return (
+        SearchVector('summary', weight='A', config=_config())
+        + SearchVector('key_phrases', weight='B', config=_config())
+        + SearchVector(filename, weight='C', config=_config())
+    )
+
+
+def update_search_vector(analysis_id):
+    if is_supported():
+        DocumentAnalysis.objects.filter(pk=analysis_id).update(search_vector=search_vector_expression())
+
+
+def backfill_search_vectors() -> int:
+    """
+    Fills in the search vector of analyses saved before it existed.
+    """
+    if not is_supported():
+        return 0
+    return DocumentAnalysis.objects.filter(search_vector__isnull=True).update(search_vector=search_vector_expression())
+
+
+def create_indexes():
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        for statement in POSTGRES_INDEXES:
+            cursor.execute(statement)
+
+
+def _terms(query: str):
+    return [term for term in re.findall(r'\w+', query.lower()) if len(term) > 1]
+
+
+def _matching_phrases(key_phrases, terms):
+    return [
+        phrase for phrase in key_phrases or []
+        if any(term in str(phrase).lower() for term in terms)
+    ]
+
+
+def _search_postgres(user, query: str, k: int):
+    search_query = SearchQuery(query, search_type='websearch', config=_config())
+    # Two index-backed candidate lists, merged here, rather than one OR across
+    # a join that neither index can serve.
+    text_hits = (
+        DocumentAnalysis.objects
+        .filter(document__user=user, search_vector=search_query)
+        .annotate(rank=SearchRank(F('search_vector'), search_query))
+        .order_by('-rank')
+        .values_list('document_id', 'rank')[:k]
+    )
+    # `trigram_similar` is the index-backed `%` operator, which applies
+    # pg_trgm.similarity_threshold (0.3 by default).
+    name_hits = (
+        Document.objects
+        .filter(user=user, original_filename__trigram_similar=query)
+        .annotate(similarity=TrigramSimilarity('original_filename', query))
+        .order_by('-similarity')
+        .values_list('id', 'similarity')[:k]
+    )
+    scores = {}
+    for document_id, score in list(text_hits) + list(name_hits):
+        scores[document_id] = scores.get(document_id, 0.0) + float(score)
+    top = sorted(scores, key=scores.get, reverse=True)[:k]
+
+    documents = (
+        Document.objects
+        .filter(pk__in=top)
+        .select_related('analysis', 'user')
+        .annotate(summary_headline=SearchHeadline(
+            'analysis__summary', search_query, config=_config(),
+            start_sel=HEADLINE_START, stop_sel=HEADLINE_STOP, max_fragments=2,
+        ))
+        .in_bulk()
+    )
+    terms = _terms(query)
+    results = []
+    for document_id in top:
+        document = documents.get(document_id)
+        if document is None:
+            continue
+        analysis = getattr(document, 'analysis', None)
+        highlights = {
+            'summary': headline_html(document.summary_headline),
+            'key_phrases': [_highlight(phrase, terms) for phrase in _matching_phrases(analysis.key_phrases if analysis else None, terms)],
+            'filename': _highlight(document.original_filename, terms),
+        }
+        results.append((document, scores[document_id], highlights))
+    return results
+
+
+def headline_html(headline) -> str:
+    """
+    The HTML of a ts_headline result: the text escaped, then its match
+    markers turned into <mark> tags.
+    """
+    escaped = html.escape(headline or '')
+    return escaped.replace(HEADLINE_START, HIGHLIGHT_START).replace(HEADLINE_STOP, HIGHLIGHT_STOP)
+
+
+def _highlight(text, terms) -> str:
+    """
+    `text` as HTML, with case-insensitive occurrences of the terms wrapped
+    in <mark>. The text is escaped piece by piece, so terms never match
+    inside an entity.
+    """
+    text = str(text or '')
+    if not terms:
+        return html.escape(text)
+    pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    parts, position = [], 0
+    for match in pattern.finditer(text):
+        parts.append(html.escape(text[position:match.start()]))
+        parts.append(f"{HIGHLIGHT_START}{html.escape(match.group())}{HIGHLIGHT_STOP}")
+        position = match.end()
+    parts.append(html.escape(text[position:]))
+    return ''.join(parts)
+
+
+def _search_fallback(user, query: str, k: int):
+    terms = _terms(query)
+    if not terms:
+        return []
+    condition = Q()
+    for term in terms:
+        condition |= (
+            Q(analysis__summary__icontains=term)
+            | Q(key_phrases_text__icontains=term)
+            | Q(original_filename__icontains=term)
+        )
+    candidates = (
+        Document.objects
+        .filter(user=user)
+        .annotate(key_phrases_text=Cast('analysis__key_phrases', TextField()))
+        .filter(condition)
+        .select_related('analysis', 'user')
+    )
+
+    results = []
+    for document in candidates:
+        analysis = getattr(document, 'analysis', None)
+        summary = (analysis.summary if analysis else None) or ''
+        phrases = _matching_phrases(analysis.key_phrases if analysis else None, terms)
+        lowered = (summary.lower(), [str(phrase).lower() for phrase in phrases], document.original_filename.lower())
+        # Roughly the A/B/C weighting of the PostgreSQL vector.
+        score = sum(
+            1.0 * lowered[0].count(term)
+            + 0.4 * sum(phrase.count(term) for phrase in lowered[1])
+            + 0.2 * lowered[2].count(term)
+            for term in terms
+        )
+        highlights = {
+            'summary': _highlight(summary, terms),
+            'key_phrases': [_highlight(phrase, terms) for phrase in phrases],
+            'filename': _highlight(document.original_filename, terms),
+        }
+        results.append((document, score, highlights))
+    results.sort(key=lambda result: result[1], reverse=True)
+    return results[:k]
+
+
+def search_documents(user, query: str, k: int = 10):
+    """
+    Returns up to k (document, score, highlights) tuples, best first.
+    Highlights are safe HTML: the escaped text with matches wrapped in
+    <mark>.
+    """
+    if is_supported():
+        return _search_postgres(user, query, k)
+    return _search_fallback(user, query, k)
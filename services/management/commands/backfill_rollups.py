@@ -0,0 +1,126 @@
+from collections import defaultdict
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from services.analytics import MAX_KEY_PHRASES_PER_DAY
+from services.models import DailyUserRollup, Document
+
+COLUMNS = ['id', 'user_id', 'uploaded_at', 'filesize', 'status', 'analysis__sentiment', 'analysis__key_phrases']
+
+
+def aggregate_batch(rows, tz):
+    """
+    Aggregates one batch of document rows per (user, day) with vectorized
+    pandas operations. Returns (totals, sentiment counts, key phrase counts).
+    """
+    df = pd.DataFrame.from_records(rows, columns=COLUMNS)
+    df['day'] = pd.to_datetime(df['uploaded_at'], utc=True).dt.tz_convert(tz).dt.date
+    df['completed'] = (df['status'] == Document.UploadStatus.COMPLETED).astype('int64')
+    df['failed'] = (df['status'] == Document.UploadStatus.FAILED).astype('int64')
+    keys = ['user_id', 'day']
+
+    totals = df.groupby(keys).agg(
+        documents=('id', 'size'),
+        bytes_uploaded=('filesize', 'sum'),
+        completed=('completed', 'sum'),
+        failed=('failed', 'sum'),
+    )
+
+    done = df[df['completed'] == 1]
+    sentiments = (
+        done.assign(sentiment=done['analysis__sentiment'].astype('string').str.strip().str.lower())
+        .dropna(subset=['sentiment'])
+        .query("sentiment != ''")
+        .groupby(keys + ['sentiment']).size()
+    )
+
+    phrases = done[['id'] + keys + ['analysis__key_phrases']].explode('analysis__key_phrases')
+    phrases['phrase'] = phrases['analysis__key_phrases'].astype('string').str.strip().str.lower()
+    phrase_counts = (
+        phrases.dropna(subset=['phrase'])
+        .query("phrase != ''")
+        # A phrase counts once per document, as in the live updates.
+        .drop_duplicates(['id', 'phrase'])
+        .groupby(keys + ['phrase']).size()
+    )
+    return totals, sentiments, phrase_counts
+
+
+def _combine(frames):
+    if not frames:
+        return None
+    return pd.concat(frames).groupby(level=list(range(frames[0].index.nlevels))).sum()
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the per-user daily analytics rollups from the document "
+        "history. Run it once after deploying the rollups, or to repair them; "
+        "uploads and analyses that happen during the rebuild may be missed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only rebuild this user's rollups (email or id).")
+        parser.add_argument('--batch-size', type=int, default=50000, help="Documents aggregated per batch.")
+
+    def handle(self, *args, **options):
+        documents = Document.objects.filter(user__isnull=False)
+        rollups = DailyUserRollup.objects.all()
+        if options['user']:
+            user = options['user']
+            field = 'user__email' if '@' in user else 'user_id'
+            documents = documents.filter(**{field: user})
+            rollups = rollups.filter(**{field: user})
+
+        tz = timezone.get_current_timezone()
+        batch_size = max(1, options['batch_size'])
+        totals, sentiments, phrases = [], [], []
+        last_id, seen = None, 0
+        while True:
+            batch = documents.order_by('id')
+            if last_id is not None:
+                batch = batch.filter(id__gt=last_id)
+            rows = list(batch.values_list(*COLUMNS)[:batch_size])
+            if not rows:
+                break
+            batch_totals, batch_sentiments, batch_phrases = aggregate_batch(rows, tz)
+            totals.append(batch_totals)
+            sentiments.append(batch_sentiments)
+            phrases.append(batch_phrases)
+            # Keep the accumulated aggregates small between batches.
+            totals, sentiments, phrases = [_combine(totals)], [_combine(sentiments)], [_combine(phrases)]
+            last_id = rows[-1][0]
+            seen += len(rows)
+            self.stdout.write(f"{seen} documents aggregated...")
+
+        sentiment_maps = defaultdict(dict)
+        phrase_maps = defaultdict(dict)
+        if seen:
+            for (user_id, day, sentiment), count in _combine(sentiments).items():
+                sentiment_maps[(user_id, day)][sentiment] = int(count)
+            for (user_id, day), counts in _combine(phrases).groupby(level=[0, 1]):
+                top = counts.droplevel([0, 1]).nlargest(MAX_KEY_PHRASES_PER_DAY)
+                phrase_maps[(user_id, day)] = {phrase: int(count) for phrase, count in top.items()}
+
+        new_rollups = [
+            DailyUserRollup(
+                user_id=user_id,
+                day=day,
+                documents=int(row.documents),
+                bytes_uploaded=int(row.bytes_uploaded),
+                completed=int(row.completed),
+                failed=int(row.failed),
+                sentiments=sentiment_maps.get((user_id, day), {}),
+                key_phrases=phrase_maps.get((user_id, day), {}),
+            )
+            for (user_id, day), row in (_combine(totals).iterrows() if seen else [])
+        ]
+        with transaction.atomic():
+            deleted, _ = rollups.delete()
+            DailyUserRollup.objects.bulk_create(new_rollups, batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(new_rollups)} daily rollups from {seen} documents (replaced {deleted})."
+        ))
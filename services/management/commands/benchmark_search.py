@@ -0,0 +1,56 @@
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from services.search_index import UserSearchIndex
+
+
+class Command(BaseCommand):
+    help = "Benchmarks semantic search query latency on a synthetic per-user index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--docs', type=int, default=100000, help="Documents in the index.")
+        parser.add_argument('--queries', type=int, default=200, help="Queries to time.")
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--terms', type=int, default=200, help="Distinct terms per synthetic document.")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        vocabulary = [f"term{i}" for i in range(50000)]
+
+        with tempfile.TemporaryDirectory() as root:
+            index = UserSearchIndex('benchmark', root=root)
+            self.stdout.write(f"Building an index of {options['docs']} documents (dim {index.dim})...")
+            started = time.perf_counter()
+            batch = 10000
+            for start in range(0, options['docs'], batch):
+                size = min(batch, options['docs'] - start)
+                # Random sparse unit vectors stand in for real documents.
+                vectors = np.zeros((size, index.dim), dtype=np.float32)
+                columns = rng.integers(0, index.dim, size=(size, options['terms']))
+                np.put_along_axis(vectors, columns, rng.normal(size=columns.shape).astype(np.float32), axis=1)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                index.add_vectors([uuid.uuid4() for _ in range(size)], vectors)
+            self.stdout.write(f"Built in {time.perf_counter() - started:.1f}s.")
+
+            queries = [
+                " ".join(rng.choice(vocabulary, size=5))
+                for _ in range(options['queries'])
+            ]
+            # Warm the page cache once so we time queries, not the first disk read.
+            index.query(queries[0], options['k'])
+
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                index.query(query, options['k'])
+                timings.append((time.perf_counter() - started) * 1000)
+
+        p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+        self.stdout.write(
+            f"{options['queries']} queries over {options['docs']} documents: "
+            f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms"
+        )
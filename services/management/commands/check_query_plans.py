@@ -0,0 +1,47 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from services.query_plans import hot_queries, is_sequential_scan, seed_plan_fixtures
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds large fixture tables inside a transaction, EXPLAINs the hot "
+        "queries and fails if any of them falls back to a sequential scan. "
+        "Everything is rolled back afterwards. The same checks run in the test "
+        "suite (services/tests/test_query_plans.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help="Rows to seed per table.")
+        parser.add_argument('--users', type=int, default=200, help="Users to spread the rows over.")
+        parser.add_argument('--verbose-plans', action='store_true', help="Print every plan.")
+
+    def handle(self, *args, **options):
+        regressions = []
+        try:
+            with transaction.atomic():
+                self.stdout.write(f"Seeding {options['rows']} rows per table...")
+                user = seed_plan_fixtures(options['rows'], options['users'])
+                for label, table, queryset in hot_queries(user, uuid.uuid4().hex):
+                    plan = queryset.explain()
+                    if options['verbose_plans']:
+                        self.stdout.write(f"--- {label}\n{plan}")
+                    if is_sequential_scan(plan, table):
+                        regressions.append((label, plan))
+                        self.stdout.write(self.style.ERROR(f"SEQ SCAN  {label}"))
+                    else:
+                        self.stdout.write(self.style.SUCCESS(f"ok        {label}"))
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        if regressions:
+            details = "\n\n".join(f"{label}:\n{plan}" for label, plan in regressions)
+            raise CommandError(f"{len(regressions)} hot quer(y/ies) use a sequential scan:\n\n{details}")
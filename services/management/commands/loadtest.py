@@ -0,0 +1,300 @@
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from accounts.views import get_tokens_for_user
+from services.models import Document, document_status_changed
+from services.openai_client import reset_clients
+from services.openai_stub import start_stub_server
+from services.queue import claim_jobs, run_job
+from services.search_index import UserSearchIndex
+
+WORDS = (
+    "revenue quarter growth customer contract delivery risk forecast margin team product launch "
+    "market supplier invoice audit compliance strategy pipeline hiring budget review outcome"
+).split()
+
+
+def _percentiles(values) -> dict:
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    if len(values) == 1:
+        return {'p50': values[0], 'p95': values[0], 'p99': values[0], 'max': values[0]}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98], 'max': max(values)}
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _document_text(size: int, rng: random.Random) -> bytes:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    # A unique tag keeps identical documents from reusing each other's analysis.
+    return (f"{uuid.uuid4().hex} " + " ".join(words))[:size].encode('utf-8')
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests the document pipeline end to end against a local OpenAI stand-in: concurrent "
+        "authenticated uploads through DocumentViewSet.create, analysis by in-process workers, "
+        "and the time until each document is COMPLETED. Creates (and afterwards deletes) its own "
+        "users and documents in the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=200)
+        parser.add_argument('--users', type=int, default=4)
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent upload clients.")
+        parser.add_argument('--workers', type=int, default=4, help="Analysis worker threads.")
+        parser.add_argument('--size', type=int, default=20000, help="Bytes of text per document.")
+        parser.add_argument('--stub-latency', type=float, default=0.5, help="Seconds per completion.")
+        parser.add_argument('--stub-jitter', type=float, default=0.2)
+        parser.add_argument('--stub-error-rate', type=float, default=0.0, help="Share of completions failing with a 500.")
+        parser.add_argument('--stub-rate-limit-every', type=int, default=0)
+        parser.add_argument('--timeout', type=float, default=600, help="Seconds to wait for the analyses.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', help="Also write the results as JSON to this file ('-' for stdout).")
+        parser.add_argument('--keep', action='store_true', help="Keep the users and documents afterwards.")
+
+    def handle(self, *args, **options):
+        stub = start_stub_server(
+            rate_limit_every=options['stub_rate_limit_every'],
+            latency=options['stub_latency'],
+            jitter=options['stub_jitter'],
+            error_rate=options['stub_error_rate'],
+        )
+        overrides = {
+            'OPENAI_BASE_URL': stub.base_url,
+            'OPENAI_API_KEY': 'loadtest',
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+        }
+        users = []
+        try:
+            with override_settings(**overrides):
+                reset_clients()
+                users = self.create_users(options['users'])
+                results = self.run(users, stub, options)
+        finally:
+            stub.shutdown()
+            reset_clients()
+            if not options['keep']:
+                self.clean_up(users)
+
+        self.report(results)
+        if options['json_path']:
+            payload = json.dumps(results, indent=2)
+            if options['json_path'] == '-':
+                self.stdout.write(payload)
+            else:
+                with open(options['json_path'], 'w') as f:
+                    f.write(payload + "\n")
+
+    def create_users(self, count: int) -> list:
+        suffix = uuid.uuid4().hex[:8]
+        return [
+            User.objects.create_user(
+                email=f'loadtest-{suffix}-{i}@example.invalid', username=f'loadtest-{suffix}-{i}',
+                password=None, first_name='Load', last_name='Test',
+            )
+            for i in range(max(1, count))
+        ]
+
+    def clean_up(self, users):
+        for document in Document.objects.filter(user__in=users):
+            document.file.delete(save=False)
+            document.delete()
+        for user in users:
+            shutil.rmtree(UserSearchIndex(user.id).root, ignore_errors=True)
+            user.delete()
+
+    def run(self, users, stub, options) -> dict:
+        total = max(1, options['documents'])
+        rng = random.Random(options['seed'])
+        payloads = [_document_text(options['size'], rng) for _ in range(total)]
+        tokens = [get_tokens_for_user(user)['access'] for user in users]
+
+        lock = threading.Lock()
+        next_index = iter(range(total))
+        submitted = {}    # document id -> monotonic time the upload started
+        finished = {}     # document id -> monotonic time it reached COMPLETED
+        upload_latencies, upload_queries, upload_errors = [], [], []
+        stop_workers = threading.Event()
+
+        user_ids = {user.id for user in users}
+
+        def on_status_changed(sender, instance, **kwargs):
+            # A document can complete before its upload thread has recorded
+            # it, so match on the load test's users.
+            if instance.status == Document.UploadStatus.COMPLETED and instance.user_id in user_ids:
+                now = time.monotonic()
+                with lock:
+                    finished.setdefault(instance.id, now)
+
+        def upload_client():
+            client = Client(raise_request_exception=False)
+            try:
+                while True:
+                    with lock:
+                        index = next(next_index, None)
+                    if index is None:
+                        return
+                    token = tokens[index % len(tokens)]
+                    upload = SimpleUploadedFile(f'loadtest-{index}.txt', payloads[index], content_type='text/plain')
+                    started = time.monotonic()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.post(
+                            '/api/services/documents/', {'file': upload}, HTTP_AUTHORIZATION=f'Bearer {token}'
+                        )
+                    elapsed = time.monotonic() - started
+                    with lock:
+                        upload_latencies.append(elapsed)
+                        upload_queries.append(len(queries))
+                        if response.status_code == 201:
+                            submitted[uuid.UUID(response.json()['id'])] = started
+                        else:
+                            upload_errors.append(response.status_code)
+            finally:
+                connection.close()
+
+        def analysis_worker(number: int):
+            worker_id = f"loadtest:{os.getpid()}:{number}"
+            try:
+                while not stop_workers.is_set():
+                    close_old_connections()
+                    jobs = claim_jobs(worker_id, 1)
+                    if not jobs:
+                        stop_workers.wait(0.05)
+                        continue
+                    run_job(jobs[0])
+            finally:
+                connection.close()
+
+        document_status_changed.connect(on_status_changed, sender=Document, weak=False, dispatch_uid='loadtest')
+        workers = [
+            threading.Thread(target=analysis_worker, args=(n,), name=f'loadtest-worker-{n}', daemon=True)
+            for n in range(max(1, options['workers']))
+        ]
+        clients = [
+            threading.Thread(target=upload_client, name=f'loadtest-client-{n}', daemon=True)
+            for n in range(max(1, options['concurrency']))
+        ]
+        if connection.vendor == 'sqlite':
+            self.stderr.write("SQLite serializes writes: expect 'database is locked' errors above --concurrency 1.")
+        self.stdout.write(
+            f"Uploading {total} documents with {len(clients)} clients, analyzing with {len(workers)} workers..."
+        )
+        try:
+            started = time.monotonic()
+            for thread in workers + clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            upload_seconds = time.monotonic() - started
+
+            # Only uploads that were accepted are waited for.
+            deadline = time.monotonic() + options['timeout']
+            while time.monotonic() < deadline:
+                with lock:
+                    if submitted.keys() <= finished.keys():
+                        break
+                time.sleep(0.05)
+            run_seconds = time.monotonic() - started
+        finally:
+            stop_workers.set()
+            for thread in workers:
+                thread.join()
+            document_status_changed.disconnect(sender=Document, dispatch_uid='loadtest')
+
+        statuses = dict.fromkeys(Document.UploadStatus.values, 0)
+        for value in Document.objects.filter(id__in=list(submitted)).values_list('status', flat=True):
+            statuses[value] += 1
+        to_completed = [
+            finished[document_id] - submitted[document_id] for document_id in finished if document_id in submitted
+        ]
+
+        return {
+            'started_at': datetime.now(dt_timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'config': {
+                key: options[key] for key in (
+                    'documents', 'users', 'concurrency', 'workers', 'size', 'stub_latency',
+                    'stub_jitter', 'stub_error_rate', 'stub_rate_limit_every', 'seed',
+                )
+            },
+            'uploads': {
+                'count': len(upload_latencies),
+                'errors': len(upload_errors),
+                'error_statuses': {str(code): upload_errors.count(code) for code in sorted(set(upload_errors))},
+                'seconds': upload_seconds,
+                'per_second': len(upload_latencies) / upload_seconds if upload_seconds else None,
+                'latency_seconds': _percentiles(upload_latencies),
+                'queries_per_request': {
+                    'mean': statistics.mean(upload_queries) if upload_queries else None,
+                    'max': max(upload_queries, default=None),
+                },
+            },
+            'analysis': {
+                'completed': len(to_completed),
+                'statuses': statuses,
+                'timed_out': len(submitted.keys() - finished.keys()),
+                'seconds': run_seconds,
+                'completed_per_second': len(finished) / run_seconds if run_seconds else None,
+                'time_to_completed_seconds': _percentiles(to_completed),
+            },
+            'stub': {
+                'requests': stub.request_count,
+                'rate_limited': stub.rate_limited_count,
+                'errors': stub.error_count,
+            },
+            'peak_rss_bytes': _peak_rss_bytes(),
+        }
+
+    def report(self, results: dict):
+        uploads, analysis = results['uploads'], results['analysis']
+        latency, to_completed = uploads['latency_seconds'], analysis['time_to_completed_seconds']
+
+        def ms(value):
+            return "-" if value is None else f"{value * 1000:.0f} ms"
+
+        self.stdout.write(
+            f"Uploads:   {uploads['count']} in {uploads['seconds']:.1f}s "
+            f"({uploads['per_second']:.1f}/s, {uploads['errors']} errors); "
+            f"latency p50 {ms(latency['p50'])}, p95 {ms(latency['p95'])}, p99 {ms(latency['p99'])}; "
+            f"{uploads['queries_per_request']['mean'] or 0:.1f} queries/request "
+            f"(max {uploads['queries_per_request']['max']})"
+        )
+        self.stdout.write(
+            f"Analysis:  {analysis['completed']} completed in {analysis['seconds']:.1f}s "
+            f"({analysis['completed_per_second']:.1f}/s), {analysis['timed_out']} not completed; "
+            f"time to COMPLETED p50 {ms(to_completed['p50'])}, p95 {ms(to_completed['p95'])}, "
+            f"p99 {ms(to_completed['p99'])}, max {ms(to_completed['max'])}"
+        )
+        stub = results['stub']
+        self.stdout.write(
+            f"Stub:      {stub['requests']} requests, {stub['rate_limited']} rate limited, {stub['errors']} errors"
+        )
+        self.stdout.write(f"Peak RSS:  {results['peak_rss_bytes'] / 1024 / 1024:.0f} MB")
@@ -0,0 +1,244 @@
+import json
+import os
+import signal
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from services.models import Document
+from services.services import DocumentAnalysisService
+
+
+def _parse_when(value: str, end_of_day: bool = False) -> datetime:
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date: {value!r} (use YYYY-MM-DD or an ISO 8601 datetime).")
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _analyze(document_id, dry_run: bool):
+    """
+    Runs in a pool thread. Returns (succeeded, prompt tokens, completion tokens).
+    """
+    try:
+        document = Document.objects.get(pk=document_id)
+        service = DocumentAnalysisService(document)
+        if dry_run:
+            return (True, *service.estimate_tokens())
+        # Copying an identical document's analysis would defeat the point.
+        succeeded, _ = service.analyze(reuse_existing=False)
+        return succeeded, 0, 0
+    finally:
+        connection.close()
+
+
+def _after(queryset, position):
+    if position is None:
+        return queryset
+    uploaded_at, document_id = position
+    return queryset.filter(Q(uploaded_at__gt=uploaded_at) | Q(uploaded_at=uploaded_at, id__gt=document_id))
+
+
+def _keyset_batches(queryset, position, batch_size: int, limit: int = None):
+    """
+    Yields the (uploaded_at, id) of every document after `position`, one
+    short query per batch. Unlike one long-running cursor, this neither pins
+    a PostgreSQL snapshot for the whole run nor blocks the workers' writes
+    on SQLite.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        batch = list(_after(queryset, position).values_list('uploaded_at', 'id')[:size])
+        yield from batch
+        if len(batch) < size:
+            return
+        position = batch[-1]
+        if remaining is not None:
+            remaining -= len(batch)
+
+
+class Checkpoint:
+    """
+    The (uploaded_at, id) low-water mark of a run: every matching document
+    up to and including it has been processed. Documents finish out of
+    order, so the mark only advances over a contiguous prefix of them.
+    """
+
+    def __init__(self, path, filters):
+        self.path = path
+        self.filters = filters
+        self.position = None
+        self.counts = {'succeeded': 0, 'failed': 0}
+        self._pending = OrderedDict()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get('filters') != self.filters:
+            raise CommandError(
+                f"Checkpoint {self.path} was written for different filters; "
+                f"pass --restart to start over."
+            )
+        if data.get('uploaded_at'):
+            self.position = (datetime.fromisoformat(data['uploaded_at']), data['id'])
+        self.counts = data.get('counts', self.counts)
+
+    def save(self):
+        if not self.path:
+            return
+        data = {'filters': self.filters, 'counts': self.counts, 'uploaded_at': None, 'id': None}
+        if self.position is not None:
+            data['uploaded_at'] = self.position[0].isoformat()
+            data['id'] = str(self.position[1])
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def started(self, key):
+        self._pending[key] = False
+
+    def finished(self, key, succeeded: bool):
+        self.counts['succeeded' if succeeded else 'failed'] += 1
+        self._pending[key] = True
+        advanced = False
+        while self._pending:
+            first_key, done = next(iter(self._pending.items()))
+            if not done:
+                break
+            self._pending.popitem(last=False)
+            self.position = first_key
+            advanced = True
+        if advanced:
+            self.save()
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-runs the analysis of many documents, e.g. after a prompt or model "
+        "change or an outage. Progress is checkpointed so an interrupted run "
+        "can be resumed; --dry-run only estimates the token cost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status', nargs='+', choices=Document.UploadStatus.values,
+            default=[Document.UploadStatus.FAILED],
+            help="Only documents in these statuses (default: FAILED).",
+        )
+        parser.add_argument('--since', help="Only documents uploaded at or after this date/datetime.")
+        parser.add_argument('--until', help="Only documents uploaded at or before this date/datetime.")
+        parser.add_argument('--user', help="Only documents of this user (email or id).")
+        parser.add_argument('--limit', type=int, help="Stop after this many documents.")
+        parser.add_argument('--batch-size', type=int, default=200, help="Rows fetched per database round trip.")
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'ANALYSIS_WORKER_CONCURRENCY', 4),
+            help="Maximum number of documents analyzed at the same time.",
+        )
+        parser.add_argument('--checkpoint', help="File recording progress; an existing one is resumed.")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint.")
+        parser.add_argument('--dry-run', action='store_true', help="Estimate tokens and cost without calling OpenAI.")
+
+    def get_queryset(self, options):
+        queryset = Document.objects.filter(status__in=options['status'])
+        if options['since']:
+            queryset = queryset.filter(uploaded_at__gte=_parse_when(options['since']))
+        if options['until']:
+            queryset = queryset.filter(uploaded_at__lte=_parse_when(options['until'], end_of_day=True))
+        if options['user']:
+            user = options['user']
+            queryset = queryset.filter(user__email=user) if '@' in user else queryset.filter(user_id=user)
+        # The checkpoint is a position in this order.
+        return queryset.order_by('uploaded_at', 'id')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        dry_run = options['dry_run']
+        filters = {name: options[name] for name in ('status', 'since', 'until', 'user')}
+
+        checkpoint = Checkpoint(options['checkpoint'], filters)
+        if not options['restart']:
+            checkpoint.load()
+            if checkpoint.position is not None:
+                self.stdout.write(f"Resuming after document {checkpoint.position[1]} ({checkpoint.position[0]}).")
+        if dry_run:
+            # Estimating must not move a real run's checkpoint.
+            checkpoint.path = None
+
+        queryset = self.get_queryset(options)
+        rows = _keyset_batches(queryset, checkpoint.position, max(1, options['batch_size']), options['limit'])
+
+        stopping = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Stopping after in-flight documents finish...")
+            stopping.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        prompt_tokens = completion_tokens = processed = 0
+        in_flight = {}
+
+        def collect(done):
+            nonlocal prompt_tokens, completion_tokens, processed
+            for future in done:
+                key = in_flight.pop(future)
+                try:
+                    succeeded, prompt, completion = future.result()
+                except Exception as e:
+                    self.stderr.write(f"Document {key[1]} failed: {e}")
+                    succeeded, prompt, completion = False, 0, 0
+                prompt_tokens += prompt
+                completion_tokens += completion
+                processed += 1
+                checkpoint.finished(key, succeeded)
+                if processed % 100 == 0:
+                    self.stdout.write(f"{processed} documents processed...")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reanalyze') as pool:
+            for key in rows:
+                if stopping.is_set():
+                    break
+                # Bounded: never more rows in memory than workers running.
+                while len(in_flight) >= workers:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                checkpoint.started(key)
+                in_flight[pool.submit(_analyze, key[1], dry_run)] = key
+            collect(wait(in_flight).done)
+
+        if dry_run:
+            input_price = getattr(settings, 'OPENAI_INPUT_PRICE_PER_MILLION', 0.15)
+            output_price = getattr(settings, 'OPENAI_OUTPUT_PRICE_PER_MILLION', 0.60)
+            cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+            self.stdout.write(
+                f"{processed} documents would be re-analyzed: ~{prompt_tokens} prompt and "
+                f"~{completion_tokens} completion tokens, about ${cost:.2f}."
+            )
+            return
+
+        summary = (
+            f"{checkpoint.counts['succeeded']} succeeded, {checkpoint.counts['failed']} failed "
+            f"({processed} in this run)."
+        )
+        if stopping.is_set():
+            self.stdout.write(f"Interrupted: {summary} Run again with the same --checkpoint to resume.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Done: {summary}"))
@@ -0,0 +1,101 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from services.metrics import start_metrics_server
+from services.queue import claim_jobs, extend_leases, requeue_expired_leases, run_job
+
+
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        # Each pool thread has its own DB connection; don't leak it.
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Runs a bounded pool of workers that process queued document analysis jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=getattr(settings, 'ANALYSIS_WORKER_CONCURRENCY', 4),
+            help="Maximum number of documents analyzed at the same time.",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help="Seconds to sleep when the queue is empty.",
+        )
+        parser.add_argument(
+            '--metrics-port', type=int,
+            default=getattr(settings, 'ANALYSIS_WORKER_METRICS_PORT', 0),
+            help="Serve Prometheus metrics on this port (0 to disable).",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit as soon as the queue is drained instead of polling forever.",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        lease_seconds = getattr(settings, 'ANALYSIS_JOB_LEASE_SECONDS', 300)
+
+        stopping = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Shutting down after in-flight jobs finish...")
+            stopping.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        self.stdout.write(f"Worker {worker_id} started with concurrency {concurrency}.")
+        if options['metrics_port']:
+            start_metrics_server(options['metrics_port'])
+            self.stdout.write(f"Serving metrics on port {options['metrics_port']}.")
+        in_flight = {}
+        last_heartbeat = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='analysis') as pool:
+            while not stopping.is_set():
+                close_old_connections()
+                requeue_expired_leases()
+
+                free_slots = concurrency - len(in_flight)
+                for job in claim_jobs(worker_id, free_slots):
+                    in_flight[pool.submit(_run_in_thread, job)] = job
+
+                if not in_flight:
+                    if options['once']:
+                        break
+                    stopping.wait(poll_interval)
+                    continue
+
+                done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = in_flight.pop(future)
+                    try:
+                        outcome = 'succeeded' if future.result() else 'failed'
+                    except Exception as e:
+                        # The lease expires and the job is retried by whoever claims it next.
+                        outcome = f'crashed ({e})'
+                    self.stdout.write(f"Job {job.id} for document {job.document_id} {outcome}.")
+
+                if in_flight and time.monotonic() - last_heartbeat > lease_seconds / 3:
+                    extend_leases(worker_id, [job.id for job in in_flight.values()])
+                    last_heartbeat = time.monotonic()
+
+            # Let the jobs we already hold finish so their leases are released cleanly.
+            wait(in_flight)
+
+        self.stdout.write(f"Worker {worker_id} stopped.")
@@ -0,0 +1,62 @@
+import json
+import statistics
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from services.models import DocumentStatusEvent
+
+
+def status_durations(since, until=None) -> dict:
+    """
+    Seconds documents spent in each status, from consecutive journal rows
+    of the same document: UPLOADED is the time queued for analysis,
+    PROCESSING the time the analysis took. Only stays that began at or
+    after `since` are counted.
+    """
+    events = DocumentStatusEvent.objects.filter(at__gte=since)
+    if until is not None:
+        events = events.filter(at__lt=until)
+    rows = events.order_by('document_id', 'at', 'id').values_list('document_id', 'to_status', 'at')
+
+    durations = {}
+    previous = None
+    for document_id, status, at in rows.iterator(chunk_size=5000):
+        if previous is not None and previous[0] == document_id:
+            durations.setdefault(previous[1], []).append((at - previous[2]).total_seconds())
+        previous = (document_id, status, at)
+    return durations
+
+
+def _summary(values) -> dict:
+    values = sorted(values)
+    cuts = statistics.quantiles(values, n=100, method='inclusive') if len(values) > 1 else values * 99
+    return {'count': len(values), 'p50': cuts[49], 'p95': cuts[94], 'max': values[-1]}
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports how long documents stayed in each status (queue time in UPLOADED, "
+        "analysis time in PROCESSING) from the document status journal."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=7, help="Look back this many days (default: 7).")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        summary = {status: _summary(values) for status, values in sorted(status_durations(since).items())}
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        if not summary:
+            self.stdout.write("No status changes in the period.")
+            return
+        self.stdout.write(f"{'status':<11} {'count':>7} {'p50':>10} {'p95':>10} {'max':>10}")
+        for status, row in summary.items():
+            self.stdout.write(
+                f"{status:<11} {row['count']:>7} {row['p50']:>9.1f}s {row['p95']:>9.1f}s {row['max']:>9.1f}s"
+            )
@@ -0,0 +1,298 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Each process keeps its own counters and histograms: web processes expose
+theirs (request latency and DB queries per view, and any analyses run
+in-process) at `/metrics`, analysis workers on their own port with
+`run_analysis_workers --metrics-port`. Prometheus scrapes every process and
+sums across them.
+
+The analysis pipeline records its spans through AnalysisTrace, which also
+keeps the per-document timings and token counts stored on DocumentAnalysis.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_format_number(value)}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}_total", _format_labels(self.label_names, key), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=SECONDS_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", _format_labels(self.label_names, key, [('le', _format_number(bound))]), count
+            yield f"{self.name}_sum", _format_labels(self.label_names, key), total
+            yield f"{self.name}_count", _format_labels(self.label_names, key), counts[-1]
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.register(Histogram(
+    'http_request_duration_seconds', "Time to produce a response, by view.",
+    labels=('view', 'method', 'status'),
+))
+http_request_queries = registry.register(Histogram(
+    'http_request_db_queries', "Database queries per request, by view.",
+    labels=('view', 'method'), buckets=QUERY_BUCKETS,
+))
+analysis_stage_seconds = registry.register(Histogram(
+    'document_analysis_stage_seconds',
+    "Time spent per analysis stage: queue_wait, extract, prompt_build, llm, persist.",
+    labels=('stage',),
+))
+analysis_tokens = registry.register(Counter(
+    'document_analysis_tokens', "OpenAI tokens used by analyses, as reported by the API.",
+    labels=('kind',),
+))
+analyses = registry.register(Counter(
+    'document_analyses',
+    "Finished analyses by outcome: completed, reused, failed, retried (a failed attempt with retries left), "
+    "or superseded by another analysis of the document.",
+    labels=('outcome',),
+))
+
+
+class AnalysisTrace:
+    """
+    Timings and token usage of one document analysis. Spans of the same
+    name add up; token usage may be added from several threads.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.timings[stage] = round(self.timings.get(stage, 0.0) + seconds, 6)
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def add_usage(self, response):
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return
+        with self._lock:
+            self.prompt_tokens += getattr(usage, 'prompt_tokens', 0) or 0
+            self.completion_tokens += getattr(usage, 'completion_tokens', 0) or 0
+
+    def publish(self, outcome: str):
+        """
+        Adds this analysis to the process's metrics.
+        """
+        for stage, seconds in self.timings.items():
+            analysis_stage_seconds.observe(seconds, stage=stage)
+        analysis_tokens.inc(self.prompt_tokens, kind='prompt')
+        analysis_tokens.inc(self.completion_tokens, kind='completion')
+        analyses.inc(outcome=outcome)
+
+
+# The query count of the current request. Every connection counts into it
+# through _count_query; a context variable also reaches the threads that
+# async views run their queries in, which a wrapper on the connection of
+# the request's own thread would miss.
+_request_queries = ContextVar('request_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(sender=None, connection=None, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+connection_created.connect(_install_query_counter, dispatch_uid='metrics_query_counter')
+
+
+class MetricsMiddleware:
+    """
+    Records the latency and the number of database queries of every request,
+    labelled with the matched URL pattern rather than the raw path. Runs
+    natively under both WSGI and ASGI, so async views (such as the event
+    stream) are not adapted to sync because of it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(connection=connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        queries = [0]
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        queries = [0]
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    @staticmethod
+    def record(request, response, elapsed: float, queries: int):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match.route) if match else 'unmatched'
+        http_request_seconds.observe(elapsed, view=view, method=request.method, status=f"{response.status_code // 100}xx")
+        http_request_queries.observe(queries, view=view, method=request.method)
+
+
+def metrics_view(request):
+    """
+    Serves the metrics of this process. With METRICS_TOKEN set, scrapers
+    must send it as a bearer token.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and request.META.get('HTTP_AUTHORIZATION', '') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """
+    Serves this process's metrics on `port` from a background thread, for
+    processes without a web server such as the analysis workers.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
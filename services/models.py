@@ -1,6 +1,9 @@
 import uuid
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.dispatch import Signal
 from django.conf import settings
+from django.utils import timezone
 
 # It's good practice to get the User model from settings
 # in case it has been customized.
@@ -23,17 +26,116 @@ class Document(models.Model):
     file = models.FileField(upload_to='uploaded_documents/')
     original_filename = models.CharField(max_length=255)
     filesize = models.PositiveIntegerField(help_text="Size in bytes")
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True, help_text="SHA-256 of the file content")
     status = models.CharField(max_length=20, choices=UploadStatus.choices, default=UploadStatus.PENDING)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
+    # Identifies the analysis that moved the document to PROCESSING; only
+    # that analysis can move it on (see transition).
+    processing_token = models.CharField(max_length=64, blank=True, default='', editable=False)
 
     def __str__(self):
         return f"Document {self.original_filename} by {self.user.username if self.user else 'Anonymous'}"
 
+    def transition(self, status, expected=None, token=None) -> bool:
+        """
+        Moves the document to `status` if it is still in `expected` (by
+        default the status this instance holds), with a single conditional
+        UPDATE of status and processed_at. The change is appended to the
+        status journal and announced with `document_status_changed` once
+        the surrounding transaction (if any) commits. Returns False, leaving
+        the instance as it was, if another process changed the status first.
+
+        Moving to PROCESSING stores `token` (a new one if not given) as the
+        processing_token. Leaving PROCESSING with a `token` only succeeds if
+        it is still the stored one, so an analysis that was taken over, e.g.
+        after its lease expired, cannot finish the document.
+        """
+        expected = self.status if expected is None else expected
+        if status not in STATUS_TRANSITIONS.get(expected, ()):
+            raise ValueError(f"A document cannot go from {expected} to {status}.")
+        now = timezone.now()
+        fields = {'status': status}
+        current = Document.objects.filter(pk=self.pk, status=expected)
+        if status == self.UploadStatus.PROCESSING:
+            fields['processing_token'] = token or uuid.uuid4().hex
+        elif expected == self.UploadStatus.PROCESSING:
+            fields['processing_token'] = ''
+            if token is not None:
+                current = current.filter(processing_token=token)
+        if status in (self.UploadStatus.COMPLETED, self.UploadStatus.FAILED):
+            fields['processed_at'] = now
+        with transaction.atomic():
+            if not current.update(**fields):
+                return False
+            DocumentStatusEvent.objects.create(document_id=self.pk, from_status=expected, to_status=status, at=now)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        transaction.on_commit(
+            lambda: document_status_changed.send(sender=Document, instance=self, previous=expected)
+        )
+        return True
+
     class Meta:
         ordering = ['-uploaded_at']
         verbose_name = "Document"
         verbose_name_plural = "Documents"
+        indexes = [
+            # A user's documents, newest first (the list endpoint and its cursor).
+            models.Index(fields=['user', '-uploaded_at', '-id'], name='document_user_recent_idx'),
+            # Only the small set of unfinished documents, looked up per user.
+            models.Index(
+                fields=['user', 'status'],
+                name='document_user_active_idx',
+                condition=models.Q(status__in=['PENDING', 'UPLOADING', 'UPLOADED', 'PROCESSING']),
+            ),
+        ]
+
+_Status = Document.UploadStatus
+
+# The status changes Document.transition allows. A document can be analyzed
+# again once finished. PROCESSING -> UPLOADED hands a document back to the
+# queue, after a failed attempt that will be retried or when the lease of a
+# dead worker's job expires (see queue.requeue_expired_leases); only one
+# analysis can then take it from UPLOADED.
+STATUS_TRANSITIONS = {
+    _Status.PENDING: {_Status.UPLOADING, _Status.UPLOADED, _Status.FAILED},
+    _Status.UPLOADING: {_Status.UPLOADED, _Status.FAILED},
+    _Status.UPLOADED: {_Status.PROCESSING, _Status.FAILED},
+    _Status.PROCESSING: {_Status.UPLOADED, _Status.COMPLETED, _Status.FAILED},
+    _Status.COMPLETED: {_Status.PROCESSING},
+    _Status.FAILED: {_Status.PROCESSING},
+}
+
+# Sent when a successful Document.transition commits, with `instance` and
+# the `previous` status. Transitions do not send post_save.
+document_status_changed = Signal()
+
+class DocumentStatusEvent(models.Model):
+    """
+    An append-only journal of document status changes: one row when a
+    document is created and one per Document.transition. Queue and
+    processing times are read from here (see `manage.py status_durations`)
+    instead of from the documents table.
+    """
+    id = models.BigAutoField(primary_key=True)
+    # A plain column rather than a foreign key: inserts check no constraint
+    # and the history outlives deleted documents.
+    document_id = models.UUIDField()
+    from_status = models.CharField(max_length=20, choices=Document.UploadStatus.choices, blank=True, default='')
+    to_status = models.CharField(max_length=20, choices=Document.UploadStatus.choices)
+    at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Document {self.document_id}: {self.from_status or '-'} -> {self.to_status} at {self.at}"
+
+    class Meta:
+        db_table = 'document_status_events'
+        ordering = ['at', 'id']
+        indexes = [
+            models.Index(fields=['at'], name='document_status_event_at_idx'),
+            models.Index(fields=['document_id', 'at'], name='document_status_history_idx'),
+        ]
 
 class DocumentAnalysis(models.Model):
     """
@@ -44,6 +146,15 @@ class DocumentAnalysis(models.Model):
     summary = models.TextField(blank=True, null=True)
     key_phrases = models.JSONField(blank=True, null=True) # Requires PostgreSQL or modern SQLite
     sentiment = models.CharField(max_length=50, blank=True, null=True)
+    # Set when the results were copied from an earlier upload with identical content.
+    reused_from = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Maintained on PostgreSQL only; see services/keyword_search.py.
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+    # Seconds per pipeline stage ({"queue_wait": 1.2, "extract": 0.3, "llm": 4.1, ...})
+    # and the tokens the OpenAI API reported for this analysis.
+    timings = models.JSONField(default=dict, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -52,3 +163,76 @@ class DocumentAnalysis(models.Model):
     class Meta:
         verbose_name = "Document Analysis"
         verbose_name_plural = "Document Analyses"
+
+class AnalysisJob(models.Model):
+    """
+    A durable unit of work for the analysis workers.
+
+    Jobs are claimed with a lease; a worker that dies mid-job simply lets the
+    lease expire and the job is picked up again by another worker.
+    """
+    class JobState(models.TextChoices):
+        QUEUED = 'QUEUED', 'Queued'
+        RUNNING = 'RUNNING', 'Running'
+        SUCCEEDED = 'SUCCEEDED', 'Succeeded'
+        FAILED = 'FAILED', 'Failed'
+
+    id = models.BigAutoField(primary_key=True)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='analysis_jobs')
+    state = models.CharField(max_length=20, choices=JobState.choices, default=JobState.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    available_at = models.DateTimeField(help_text="The job is not claimed before this time")
+    leased_until = models.DateTimeField(null=True, blank=True)
+    leased_by = models.CharField(max_length=255, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"AnalysisJob {self.id} ({self.state}) for document {self.document_id}"
+
+    class Meta:
+        db_table = 'analysis_jobs'
+        ordering = ['available_at', 'id']
+        indexes = [
+            models.Index(fields=['state', 'available_at'], name='analysis_job_claim_idx'),
+            models.Index(fields=['state', 'leased_until'], name='analysis_job_lease_idx'),
+        ]
+
+class DocumentListVersion(models.Model):
+    """
+    A per-user counter bumped whenever one of the user's documents or
+    analyses changes. It drives ETags and cache keys for the document API,
+    so unchanged polls never touch the document tables.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'document_list_versions'
+
+class DailyUserRollup(models.Model):
+    """
+    Per-user, per-day totals behind the analytics endpoint, kept up to date
+    as documents are uploaded and analyzed (see services/analytics.py).
+    A document counts towards the day it was uploaded.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    documents = models.PositiveIntegerField(default=0)
+    bytes_uploaded = models.BigIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # {"positive": 3, ...} and {"key phrase": 2, ...} over completed analyses.
+    sentiments = models.JSONField(default=dict)
+    key_phrases = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'daily_user_rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='daily_user_rollup_unique'),
+        ]
@@ -0,0 +1,351 @@
+"""
+Process-wide OpenAI clients shared by every DocumentAnalysisService.
+
+All chat completion calls go through `chat_completion` / `achat_completion`,
+which reuse one pooled HTTP client, cap the number of in-flight requests,
+throttle on requests and tokens per minute, and retry rate-limited or
+transient failures with jittered exponential backoff.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import openai
+from django.conf import settings
+
+CHARS_PER_TOKEN = 4
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled continuously at `per_minute`.
+
+    `reserve` takes the tokens immediately (the balance may go negative) and
+    returns how long the caller has to wait before using them, so the same
+    bucket works for blocking and asyncio callers.
+    """
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount: float):
+        """Gives back tokens that were reserved but not used (may be negative)."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Combines a requests-per-minute and a tokens-per-minute bucket.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def reserve(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        self.tokens.refund(estimated_tokens - actual_tokens)
+
+    def refund_tokens(self, tokens: int):
+        """
+        Gives back the tokens of an attempt that failed. The request itself
+        was sent and still counts against the request limit.
+        """
+        self.tokens.refund(tokens)
+
+
+class ConcurrencyLimit:
+    """
+    Caps the requests in flight across blocking callers and the shared event
+    loop alike (`with limit:` / `async with limit:`). A released slot is
+    handed to the longest waiting caller.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _take(self) -> bool:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._lock:
+            if self._take():
+                return
+            event = threading.Event()
+            self._waiters.append(event.set)
+        event.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._take():
+                return
+            future = loop.create_future()
+            self._waiters.append(lambda: loop.call_soon_threadsafe(self._hand_over, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Cancelled after the slot was handed over but before we resumed.
+                self.release()
+            raise
+
+    def _hand_over(self, future):
+        if future.cancelled():
+            # The waiter gave up; the slot goes to the next one.
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # The slot passes straight on, so `active` stays the same.
+                self._waiters.popleft()()
+            else:
+                self.active -= 1
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+_lock = threading.Lock()
+_client = None
+_async_client = None
+_loop = None
+_limiter = None
+_concurrency = None
+
+
+def _client_options() -> dict:
+    return {
+        'api_key': settings.OPENAI_API_KEY,
+        'base_url': getattr(settings, 'OPENAI_BASE_URL', None) or None,
+        'timeout': getattr(settings, 'OPENAI_TIMEOUT_SECONDS', 60),
+        # Retries are handled here so they are throttled like any other call.
+        'max_retries': 0,
+    }
+
+
+def get_client() -> openai.OpenAI:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = openai.OpenAI(**_client_options())
+    return _client
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the event loop that owns the shared AsyncOpenAI client. It runs
+    forever in a daemon thread so the connection pool outlives any one call.
+    """
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='openai-client', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_async(coro):
+    """
+    Runs a coroutine on the shared client loop and blocks until it is done.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+def get_async_client() -> openai.AsyncOpenAI:
+    """
+    Returns the shared AsyncOpenAI client. Only use it on the shared loop
+    (see `run_async`); `achat_completion` takes care of that.
+    """
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = openai.AsyncOpenAI(**_client_options())
+    return _async_client
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                _limiter = RateLimiter(
+                    getattr(settings, 'OPENAI_REQUESTS_PER_MINUTE', 500),
+                    getattr(settings, 'OPENAI_TOKENS_PER_MINUTE', 200000),
+                )
+    return _limiter
+
+
+def get_concurrency_limit() -> ConcurrencyLimit:
+    """
+    The one OPENAI_MAX_CONCURRENCY limit shared by `chat_completion` and
+    `achat_completion`.
+    """
+    global _concurrency
+    if _concurrency is None:
+        with _lock:
+            if _concurrency is None:
+                _concurrency = ConcurrencyLimit(getattr(settings, 'OPENAI_MAX_CONCURRENCY', 8))
+    return _concurrency
+
+
+def reset_clients():
+    """
+    Drops the shared clients and limiters, e.g. after changing OPENAI_BASE_URL.
+    """
+    global _client, _async_client, _limiter, _concurrency
+    with _lock:
+        _client = None
+        _async_client = None
+        _limiter = None
+        _concurrency = None
+
+
+def estimate_tokens(messages, max_tokens: int = None) -> int:
+    prompt_chars = sum(len(message.get('content') or '') for message in messages)
+    completion = max_tokens or getattr(settings, 'OPENAI_COMPLETION_TOKEN_ESTIMATE', 500)
+    return prompt_chars // CHARS_PER_TOKEN + completion
+
+
+def _retry_after(error) -> float:
+    """
+    Reads the server's requested delay from `retry-after-ms` or `retry-after`
+    (seconds or an HTTP date). Returns 0 if there is none.
+    """
+    response = getattr(error, 'response', None)
+    if response is None:
+        return 0.0
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return 0.0
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _backoff_delay(attempt: int, error) -> float:
+    base = getattr(settings, 'OPENAI_RETRY_BASE_SECONDS', 1.0)
+    cap = getattr(settings, 'OPENAI_RETRY_MAX_SECONDS', 60.0)
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    return max(delay, _retry_after(error))
+
+
+def _usage_tokens(response, default: int) -> int:
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', None) or default
+
+
+def chat_completion(**kwargs):
+    """
+    Blocking `chat.completions.create` through the shared client.
+    """
+    limiter = get_rate_limiter()
+    estimated = estimate_tokens(kwargs.get('messages', []), kwargs.get('max_tokens'))
+    max_retries = getattr(settings, 'OPENAI_MAX_RETRIES', 6)
+
+    for attempt in range(max_retries + 1):
+        time.sleep(limiter.reserve(estimated))
+        try:
+            with get_concurrency_limit():
+                response = get_client().chat.completions.create(**kwargs)
+        except RETRYABLE_ERRORS as e:
+            # The next attempt reserves again.
+            limiter.refund_tokens(estimated)
+            if attempt == max_retries:
+                raise
+            delay = _backoff_delay(attempt, e)
+            print(f"OpenAI call failed ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            continue
+        limiter.reconcile(estimated, _usage_tokens(response, estimated))
+        return response
+
+
+async def achat_completion(**kwargs):
+    """
+    asyncio version of `chat_completion` using the shared AsyncOpenAI client.
+    Can be awaited from any event loop; the request itself always runs on the
+    shared loop.
+    """
+    loop = _get_loop()
+    if asyncio.get_running_loop() is not loop:
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(achat_completion(**kwargs), loop))
+
+    limiter = get_rate_limiter()
+    estimated = estimate_tokens(kwargs.get('messages', []), kwargs.get('max_tokens'))
+    max_retries = getattr(settings, 'OPENAI_MAX_RETRIES', 6)
+
+    for attempt in range(max_retries + 1):
+        await asyncio.sleep(limiter.reserve(estimated))
+        try:
+            async with get_concurrency_limit():
+                response = await get_async_client().chat.completions.create(**kwargs)
+        except RETRYABLE_ERRORS as e:
+            # The next attempt reserves again.
+            limiter.refund_tokens(estimated)
+            if attempt == max_retries:
+                raise
+            delay = _backoff_delay(attempt, e)
+            print(f"OpenAI call failed ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+            continue
+        limiter.reconcile(estimated, _usage_tokens(response, estimated))
+        return response
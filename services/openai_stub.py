@@ -0,0 +1,159 @@
+"""
+A local stand-in for the OpenAI chat completions endpoint.
+
+Point OPENAI_BASE_URL at it to exercise the analysis pipeline, the rate
+limiter and the retry logic without calling (or paying for) the real API:
+
+    python -m services.openai_stub --port 8089 --rate-limit-every 5
+    python -m services.openai_stub --latency 0.8 --jitter 0.4 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python manage.py run_analysis_workers
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    """
+    Serves canned JSON analyses. Every `rate_limit_every`-th request is
+    answered with a 429 and a `Retry-After` of `retry_after` seconds, and a
+    random `error_rate` share with a 500. Completions take `latency`
+    seconds, give or take up to `jitter`, like a real model call.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), rate_limit_every=0, retry_after=1,
+                 latency=0.0, jitter=0.0, error_rate=0.0):
+        super().__init__(address, StubOpenAIHandler)
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self.error_count = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def next_request(self) -> bool:
+        """Counts a request and returns True if it should be rate limited."""
+        with self._count_lock:
+            self.request_count += 1
+            limited = bool(self.rate_limit_every) and self.request_count % self.rate_limit_every == 0
+            if limited:
+                self.rate_limited_count += 1
+            return limited
+
+    def next_error(self) -> bool:
+        """Returns True if this request should fail with a server error."""
+        if not self.error_rate or random.random() >= self.error_rate:
+            return False
+        with self._count_lock:
+            self.error_count += 1
+        return True
+
+    def response_delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        if self.server.next_request():
+            self._send_json(
+                429,
+                {'error': {'message': 'Rate limit reached', 'type': 'rate_limit_error', 'code': 'rate_limit_exceeded'}},
+                headers={'Retry-After': str(self.server.retry_after)},
+            )
+            return
+
+        time.sleep(self.server.response_delay())
+        if self.server.next_error():
+            self._send_json(500, {'error': {'message': 'The server had an error', 'type': 'server_error'}})
+            return
+        self._send_json(200, self.build_completion(request))
+
+    def build_completion(self, request: dict) -> dict:
+        prompt_chars = sum(len(m.get('content') or '') for m in request.get('messages', []))
+        content = json.dumps({
+            'summary': 'Stub summary of the document.',
+            'key_phrases': ['stub', 'document', 'analysis'],
+            'sentiment': 'neutral',
+        })
+        prompt_tokens = prompt_chars // CHARS_PER_TOKEN
+        completion_tokens = len(content) // CHARS_PER_TOKEN
+        return {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'gpt-4o-mini'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        }
+
+
+def start_stub_server(port=0, **options) -> StubOpenAIServer:
+    """
+    Starts the stub in a background thread and returns the server; call
+    `shutdown()` on it when done.
+    """
+    server = StubOpenAIServer(('127.0.0.1', port), **options)
+    threading.Thread(target=server.serve_forever, name='openai-stub', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--rate-limit-every', type=int, default=0)
+    parser.add_argument('--retry-after', type=float, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds per completion.")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random +/- seconds added to the latency.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 500.")
+    args = parser.parse_args()
+
+    server = StubOpenAIServer(
+        ('127.0.0.1', args.port), args.rate_limit_every, args.retry_after,
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+    )
+    print(f"Stub OpenAI API listening on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,95 @@
+import base64
+import binascii
+import uuid
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class DocumentCursorPagination(BasePagination):
+    """
+    Keyset pagination over (uploaded_at, id), newest first.
+
+    The cursor encodes the last row of the previous page, so every page is a
+    single indexed range scan no matter how deep the client has paged.
+    The queryset must be ordered by ('-uploaded_at', '-id').
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'DOCUMENT_PAGE_SIZE', 50)
+        self.max_page_size = getattr(settings, 'DOCUMENT_MAX_PAGE_SIZE', 200)
+        self.next_position = None
+
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(requested, self.max_page_size))
+
+    @staticmethod
+    def encode_cursor(uploaded_at, pk) -> str:
+        raw = f"{uploaded_at.isoformat()}|{pk}".encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def decode_cursor(self, cursor: str):
+        try:
+            uploaded_at, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+            uploaded_at = parse_datetime(uploaded_at)
+            pk = uuid.UUID(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if uploaded_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return uploaded_at, pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            uploaded_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=pk)
+            )
+
+        # Fetch one extra row to know whether there is a next page.
+        rows = list(queryset[:page_size + 1])
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            self.next_position = (last.uploaded_at, last.pk)
+        else:
+            self.next_position = None
+        return rows
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(*self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,104 @@
+"""
+The queries that run on every request or worker poll, and the fixtures
+to EXPLAIN them against. Used by `manage.py check_query_plans` and by
+services/tests/test_query_plans.py.
+"""
+import re
+import uuid
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from accounts.models import EmailVerificationToken, PasswordResetToken, User
+from uploads.models import media
+
+from .models import AnalysisJob, Document
+
+
+def hot_queries(user, token):
+    """
+    The lookups that run on every request or every worker poll, with the
+    table each one must not scan sequentially.
+    """
+    now = timezone.now()
+    return [
+        ('document list', Document._meta.db_table,
+         Document.objects.filter(user=user).order_by('-uploaded_at', '-id')[:50]),
+        ('unfinished documents', Document._meta.db_table,
+         Document.objects.filter(user=user, status__in=[Document.UploadStatus.PENDING, Document.UploadStatus.PROCESSING])),
+        ('media list', media._meta.db_table,
+         media.objects.filter(user=user).order_by('-uploaded_at')[:50]),
+        ('password reset token', PasswordResetToken._meta.db_table,
+         PasswordResetToken.objects.filter(token=token, is_used=False, expires_at__gt=now)),
+        ('email verification token', EmailVerificationToken._meta.db_table,
+         EmailVerificationToken.objects.filter(token=token, is_used=False, expires_at__gt=now)),
+        ('expired token purge', PasswordResetToken._meta.db_table,
+         PasswordResetToken.objects.filter(expires_at__lt=now - timedelta(days=1)).values('id')[:1000]),
+        ('used token purge', EmailVerificationToken._meta.db_table,
+         EmailVerificationToken.objects.filter(is_used=True).values('id')[:1000]),
+        ('job claim', AnalysisJob._meta.db_table,
+         AnalysisJob.objects.filter(state=AnalysisJob.JobState.QUEUED, available_at__lte=now).order_by('available_at', 'id')[:10]),
+    ]
+
+
+def is_sequential_scan(plan: str, table: str) -> bool:
+    if connection.vendor == 'postgresql':
+        return re.search(rf'Seq Scan on {re.escape(table)}\b', plan) is not None
+    if connection.vendor == 'sqlite':
+        return re.search(rf'\bSCAN {re.escape(table)}\b(?! USING)', plan) is not None
+    return False
+
+
+def seed_plan_fixtures(rows: int, user_count: int):
+    """
+    Fills the hot tables with `rows` rows each, spread over `user_count`
+    users, and refreshes the planner statistics. Returns one of the users.
+    """
+    now = timezone.now()
+    users = User.objects.bulk_create([
+        User(
+            username=f'plan-check-{i}-{uuid.uuid4().hex[:8]}',
+            email=f'plan-check-{i}-{uuid.uuid4().hex[:8]}@example.invalid',
+            password='!',
+        )
+        for i in range(user_count)
+    ])
+    statuses = list(Document.UploadStatus.values)
+    documents = Document.objects.bulk_create([
+        Document(
+            user=users[i % user_count],
+            file='uploaded_documents/plan-check.txt',
+            original_filename=f'plan-check-{i}.txt',
+            filesize=i,
+            # Mostly finished documents, like a real table.
+            status=statuses[i % len(statuses)] if i % 10 == 0 else Document.UploadStatus.COMPLETED,
+        )
+        for i in range(rows)
+    ], batch_size=2000)
+    media.objects.bulk_create([
+        media(user=users[i % user_count], file='uploads/plan-check.mp4')
+        for i in range(rows)
+    ], batch_size=2000)
+    for model in (PasswordResetToken, EmailVerificationToken):
+        model.objects.bulk_create([
+            model(
+                user=users[i % user_count],
+                token=uuid.uuid4().hex,
+                expires_at=now + timedelta(hours=1 if i % 2 else -1),
+                is_used=i % 3 == 0,
+            )
+            for i in range(rows)
+        ], batch_size=2000)
+    AnalysisJob.objects.bulk_create([
+        AnalysisJob(
+            document=documents[i],
+            state=AnalysisJob.JobState.SUCCEEDED if i % 20 else AnalysisJob.JobState.QUEUED,
+            available_at=now,
+        )
+        for i in range(rows)
+    ], batch_size=2000)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return users[0]
@@ -0,0 +1,225 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analytics import record_outcome
+from .models import AnalysisJob, Document
+
+
+def _lease_duration() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'ANALYSIS_JOB_LEASE_SECONDS', 300))
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    """
+    Exponential backoff with full jitter, capped so a flapping job is still
+    retried within a reasonable time.
+    """
+    base = getattr(settings, 'ANALYSIS_JOB_RETRY_BASE_SECONDS', 10)
+    cap = getattr(settings, 'ANALYSIS_JOB_RETRY_MAX_SECONDS', 600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def enqueue_document_analysis(document_id, delay_seconds: int = 0) -> AnalysisJob:
+    """
+    Adds an analysis job for the given document to the queue.
+    This is the only thing the upload request does; the workers started with
+    `manage.py run_analysis_workers` pick the job up.
+    """
+    return AnalysisJob.objects.create(
+        document_id=document_id,
+        max_attempts=getattr(settings, 'ANALYSIS_JOB_MAX_ATTEMPTS', 5),
+        available_at=timezone.now() + timedelta(seconds=delay_seconds),
+    )
+
+
+def claim_jobs(worker_id: str, limit: int) -> list:
+    """
+    Leases up to `limit` runnable jobs for `worker_id`.
+
+    On databases with SKIP LOCKED (PostgreSQL) concurrent workers never wait on
+    each other's rows. Elsewhere (SQLite) every candidate is claimed with a
+    conditional UPDATE so that only one worker can win a given job.
+    """
+    if limit <= 0:
+        return []
+
+    now = timezone.now()
+    runnable = AnalysisJob.objects.filter(
+        state=AnalysisJob.JobState.QUEUED,
+        available_at__lte=now,
+    ).order_by('available_at', 'id')
+    lease = {
+        'state': AnalysisJob.JobState.RUNNING,
+        'leased_until': now + _lease_duration(),
+        'leased_by': worker_id,
+        'attempts': F('attempts') + 1,
+        'updated_at': now,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job_ids = list(
+                runnable.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit]
+            )
+            AnalysisJob.objects.filter(id__in=job_ids).update(**lease)
+    else:
+        job_ids = []
+        for job_id in runnable.values_list('id', flat=True)[:limit]:
+            claimed = AnalysisJob.objects.filter(
+                id=job_id, state=AnalysisJob.JobState.QUEUED
+            ).update(**lease)
+            if claimed:
+                job_ids.append(job_id)
+
+    return list(AnalysisJob.objects.filter(id__in=job_ids).order_by('available_at', 'id'))
+
+
+def extend_leases(worker_id: str, job_ids) -> int:
+    """
+    Pushes the lease of jobs still being worked on further into the future.
+    """
+    return AnalysisJob.objects.filter(
+        id__in=list(job_ids),
+        state=AnalysisJob.JobState.RUNNING,
+        leased_by=worker_id,
+    ).update(leased_until=timezone.now() + _lease_duration())
+
+
+def complete_job(job: AnalysisJob) -> bool:
+    return bool(AnalysisJob.objects.filter(
+        id=job.id,
+        state=AnalysisJob.JobState.RUNNING,
+        leased_by=job.leased_by,
+    ).update(
+        state=AnalysisJob.JobState.SUCCEEDED,
+        leased_until=None,
+        last_error='',
+        updated_at=timezone.now(),
+    ))
+
+
+def fail_job(job: AnalysisJob, error: str) -> bool:
+    """
+    Records a failed attempt. The job goes back to the queue with a backoff
+    delay until it runs out of attempts.
+    """
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        changes = {
+            'state': AnalysisJob.JobState.QUEUED,
+            'available_at': now + _retry_delay(job.attempts),
+        }
+    else:
+        changes = {'state': AnalysisJob.JobState.FAILED}
+
+    return bool(AnalysisJob.objects.filter(
+        id=job.id,
+        state=AnalysisJob.JobState.RUNNING,
+        leased_by=job.leased_by,
+    ).update(
+        leased_until=None,
+        leased_by='',
+        last_error=error[:10000],
+        updated_at=now,
+        **changes,
+    ))
+
+
+def job_token(job: AnalysisJob) -> str:
+    """
+    The processing token of a job's current attempt, which its analysis
+    holds the document with (see Document.transition).
+    """
+    return f"job-{job.id}-{job.attempts}"
+
+
+def _release_document(job: AnalysisJob, exhausted: bool):
+    """
+    Takes a document away from the dead worker of an expired job: it goes
+    back to UPLOADED for the next attempt, or to FAILED if none is left.
+    A document another analysis has taken over in the meantime is left
+    alone; one without a token (processed before tokens existed) is not.
+    """
+    document = Document.objects.filter(
+        pk=job.document_id, status=Document.UploadStatus.PROCESSING, processing_token__in=[job_token(job), '']
+    ).first()
+    if document is None:
+        return
+    status = Document.UploadStatus.FAILED if exhausted else Document.UploadStatus.UPLOADED
+    released = document.transition(
+        status, expected=Document.UploadStatus.PROCESSING, token=document.processing_token
+    )
+    if released and exhausted:
+        record_outcome(document, None)
+
+
+def requeue_expired_leases() -> int:
+    """
+    Puts jobs whose worker stopped renewing the lease (crash, restart, OOM)
+    back on the queue. Jobs that already used all their attempts are failed.
+    The documents those workers left in PROCESSING are released with them,
+    in the same transaction, so the next attempt finds the document UPLOADED.
+    """
+    now = timezone.now()
+    expired = AnalysisJob.objects.filter(
+        state=AnalysisJob.JobState.RUNNING,
+        leased_until__lt=now,
+    )
+    count = 0
+    for job in expired.only('id', 'document_id', 'attempts', 'max_attempts'):
+        exhausted = job.attempts >= job.max_attempts
+        if exhausted:
+            changes = {'state': AnalysisJob.JobState.FAILED}
+        else:
+            changes = {'state': AnalysisJob.JobState.QUEUED, 'available_at': now}
+        with transaction.atomic():
+            # The condition is repeated, as the worker may have renewed the
+            # lease or finished since the query.
+            released = AnalysisJob.objects.filter(
+                id=job.id,
+                state=AnalysisJob.JobState.RUNNING,
+                leased_until__lt=now,
+            ).update(
+                leased_until=None,
+                leased_by='',
+                last_error='Lease expired',
+                updated_at=now,
+                **changes,
+            )
+            if released:
+                count += 1
+                _release_document(job, exhausted)
+    return count
+
+
+def run_job(job: AnalysisJob) -> bool:
+    """
+    Runs the analysis for a claimed job and records the outcome on the job.
+    """
+    from .services import DocumentAnalysisService
+
+    service = None
+    try:
+        document = Document.objects.get(id=job.document_id)
+        service = DocumentAnalysisService(document)
+        # How long the job waited for a worker once it became runnable.
+        service.trace.record('queue_wait', max(0.0, (timezone.now() - job.available_at).total_seconds()))
+        # The document only becomes FAILED once the job has no attempts left.
+        success, message = service.analyze(
+            final_attempt=job.attempts >= job.max_attempts, token=job_token(job)
+        )
+    except Exception as e:
+        success, message = False, f"An error occurred: {e}"
+
+    if success or (service is not None and service.superseded):
+        # Nothing to retry when another analysis of the document won.
+        complete_job(job)
+    else:
+        fail_job(job, message)
+    return success
@@ -0,0 +1,247 @@
+"""
+Per-user semantic search index over analyzed documents.
+
+Each document becomes a hashed term-frequency vector over its summary, key
+phrases and extracted text (signed feature hashing, so no vocabulary has to
+be kept). Vectors are stored in a memory-mapped float32 matrix per user
+together with the document-frequency counts needed for IDF weighting.
+A query is one matrix-vector product over that matrix plus a top-k
+selection.
+
+Layout of SEARCH_INDEX_DIR/<user id>/:
+    meta.json    {"rows": n, "capacity": c, "dim": d, "documents": live rows}
+    vectors.f32  float32[c, d], L2-normalized sublinear TF rows
+    ids.u8       uint8[c, 16], document UUID bytes (zeros for deleted rows)
+    df.f64       float64[d], number of live documents containing each feature
+"""
+import fcntl
+import json
+import math
+import os
+import re
+import uuid
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+TOKEN_RE = re.compile(r'[a-z0-9]{2,}')
+STOP_WORDS = frozenset(
+    'the and for are but not you all any can had her was one our out has have '
+    'this that with from they will would there their what which when were been '
+    'into more than then them these some such only also its of to in is it on '
+    'as at by be or an if no so do we he'.split()
+)
+# Key phrases describe the whole document, so they count more than body text.
+KEY_PHRASE_WEIGHT = 3
+INITIAL_CAPACITY = 1024
+
+
+def _dim() -> int:
+    return getattr(settings, 'SEARCH_INDEX_DIM', 1024)
+
+
+def tokenize(text: str):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def vectorize(texts, dim: int = None) -> np.ndarray:
+    """
+    Hashes an iterable of texts into one L2-normalized float32 vector with
+    sublinear term frequencies.
+    """
+    dim = dim or _dim()
+    counts = Counter()
+    for text in texts:
+        counts.update(tokenize(text))
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for token, count in counts.items():
+        h = zlib.crc32(token.encode('utf-8'))
+        sign = 1.0 if h & 0x80000000 else -1.0
+        vector[h % dim] += sign * (1.0 + math.log(count))
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+class UserSearchIndex:
+    """
+    The on-disk index of one user. Writers take an exclusive file lock;
+    readers map the files read-only.
+    """
+
+    def __init__(self, user_id, root: str = None):
+        self.root = os.path.join(root or settings.SEARCH_INDEX_DIR, str(user_id))
+        self.dim = _dim()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self._path('meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'rows': 0, 'capacity': 0, 'dim': self.dim, 'documents': 0}
+
+    def _write_meta(self, meta: dict):
+        tmp = self._path('meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path('meta.json'))
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._path('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _ensure_capacity(self, meta: dict, needed: int):
+        if needed <= meta['capacity']:
+            return
+        capacity = max(INITIAL_CAPACITY, meta['capacity'])
+        while capacity < needed:
+            capacity *= 2
+        # Growing the files keeps existing rows in place; new rows read as zeros.
+        for name, row_bytes in (('vectors.f32', 4 * meta['dim']), ('ids.u8', 16)):
+            with open(self._path(name), 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        if not os.path.exists(self._path('df.f64')):
+            np.zeros(meta['dim'], dtype=np.float64).tofile(self._path('df.f64'))
+        meta['capacity'] = capacity
+
+    def _maps(self, meta: dict, mode: str):
+        vectors = np.memmap(self._path('vectors.f32'), dtype=np.float32, mode=mode, shape=(meta['capacity'], meta['dim']))
+        ids = np.memmap(self._path('ids.u8'), dtype=np.uint8, mode=mode, shape=(meta['capacity'], 16))
+        return vectors, ids
+
+    @staticmethod
+    def _find_row(ids: np.ndarray, rows: int, document_id) -> int:
+        key = np.frombuffer(uuid.UUID(str(document_id)).bytes, dtype=np.uint8)
+        matches = np.flatnonzero((ids[:rows] == key).all(axis=1))
+        return int(matches[0]) if len(matches) else -1
+
+    def add_vectors(self, document_ids, vectors: np.ndarray):
+        """
+        Inserts or replaces the vectors of the given documents.
+        """
+        with self._write_lock():
+            meta = self._read_meta()
+            if meta['dim'] != self.dim:
+                raise ValueError(f"Index dimension is {meta['dim']}, expected {self.dim}; rebuild the index.")
+            self._ensure_capacity(meta, meta['rows'] + len(document_ids))
+            matrix, ids = self._maps(meta, 'r+')
+            df = np.fromfile(self._path('df.f64'), dtype=np.float64)
+            # One pass over the ids for a batch, instead of one scan per document.
+            existing = (
+                {ids[row].tobytes(): row for row in range(meta['rows'])}
+                if len(document_ids) > 1 else None
+            )
+
+            for document_id, vector in zip(document_ids, vectors):
+                key = uuid.UUID(str(document_id)).bytes
+                if existing is not None:
+                    row = existing.get(key, -1)
+                else:
+                    row = self._find_row(ids, meta['rows'], document_id)
+                if row >= 0:
+                    df -= matrix[row] != 0
+                else:
+                    row = meta['rows']
+                    meta['rows'] += 1
+                    meta['documents'] += 1
+                    ids[row] = np.frombuffer(key, dtype=np.uint8)
+                    if existing is not None:
+                        existing[key] = row
+                matrix[row] = vector
+                df += vector != 0
+
+            matrix.flush()
+            ids.flush()
+            df.tofile(self._path('df.f64'))
+            self._write_meta(meta)
+
+    def add(self, document_id, texts):
+        self.add_vectors([document_id], vectorize(texts, self.dim)[np.newaxis, :])
+
+    def remove(self, document_id):
+        with self._write_lock():
+            meta = self._read_meta()
+            if not meta['rows']:
+                return
+            matrix, ids = self._maps(meta, 'r+')
+            row = self._find_row(ids, meta['rows'], document_id)
+            if row < 0:
+                return
+            df = np.fromfile(self._path('df.f64'), dtype=np.float64)
+            df -= matrix[row] != 0
+            matrix[row] = 0
+            ids[row] = 0
+            matrix.flush()
+            ids.flush()
+            df.tofile(self._path('df.f64'))
+            meta['documents'] -= 1
+            self._write_meta(meta)
+
+    def query(self, text: str, k: int = 10):
+        """
+        Returns up to k (document UUID, score) pairs, best first.
+        """
+        meta = self._read_meta()
+        rows = meta['rows']
+        if not rows or meta['dim'] != self.dim:
+            return []
+
+        query = vectorize([text], self.dim)
+        if not query.any():
+            return []
+        df = np.fromfile(self._path('df.f64'), dtype=np.float64)
+        idf = (np.log((meta['documents'] + 1) / (df + 1)) + 1).astype(np.float32)
+        # IDF weighs the query and the (stored, unweighted) document side alike.
+        weighted = query * idf * idf
+
+        matrix, ids = self._maps(meta, 'r')
+        # Only the query's few non-zero features contribute to the product,
+        # so multiply just those columns.
+        features = np.flatnonzero(weighted)
+        scores = matrix[:rows, features] @ weighted[features]
+
+        k = min(k, rows)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (uuid.UUID(bytes=ids[row].tobytes()), float(scores[row]))
+            for row in top
+            if scores[row] > 0 and ids[row].any()
+        ]
+
+
+def document_texts(analysis, extracted_chunks=()):
+    """
+    The texts a document is indexed under: summary, key phrases and body.
+    """
+    yield analysis.get('summary') or ''
+    for phrase in analysis.get('key_phrases') or []:
+        for _ in range(KEY_PHRASE_WEIGHT):
+            yield str(phrase)
+    yield from extracted_chunks
+
+
+def index_document(document, analysis: dict, extracted_chunks=()):
+    if not getattr(settings, 'SEARCH_INDEX_ENABLED', True) or not document.user_id:
+        return
+    UserSearchIndex(document.user_id).add(document.id, document_texts(analysis, extracted_chunks))
+
+
+def remove_document(document):
+    if not getattr(settings, 'SEARCH_INDEX_ENABLED', True) or not document.user_id:
+        return
+    UserSearchIndex(document.user_id).remove(document.id)
@@ -1,11 +1,12 @@
 from rest_framework import serializers
 from .models import Document, DocumentAnalysis
+import hashlib
 
 class DocumentAnalysisSerializer(serializers.ModelSerializer):
     """Serializer for the DocumentAnalysis results."""
     class Meta:
         model = DocumentAnalysis
-        fields = ['id', 'summary', 'key_phrases', 'sentiment', 'created_at']
+        fields = ['id', 'summary', 'key_phrases', 'sentiment', 'timings', 'prompt_tokens', 'completion_tokens', 'created_at']
 
 
 class DocumentSerializer(serializers.ModelSerializer):
@@ -42,12 +43,23 @@ class DocumentSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         file_obj = validated_data['file']
 
+        # Hash the content so identical uploads can reuse an existing analysis.
+        # The streaming upload handler has usually done this already.
+        content_hash = getattr(file_obj, 'content_hash', '')
+        if not content_hash:
+            sha256 = hashlib.sha256()
+            for chunk in file_obj.chunks():
+                sha256.update(chunk)
+            file_obj.seek(0)
+            content_hash = sha256.hexdigest()
+
         # Create the document instance
         document = Document.objects.create(
             user=user,
             file=file_obj,
             original_filename=file_obj.name,
             filesize=file_obj.size,
+            content_hash=content_hash,
             status=Document.UploadStatus.UPLOADED # Set status after upload
         )
         return document
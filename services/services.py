@@ -1,11 +1,22 @@
 from django.conf import settings
-from .models import Document, DocumentAnalysis
-import openai
+from django.db import transaction
+from django.db.models import Count, Q
+from .models import STATUS_TRANSITIONS, Document, DocumentAnalysis
+from .extractors import iter_document_text
+from .analytics import record_outcome
+from .search_index import index_document
+from .openai_client import CHARS_PER_TOKEN, chat_completion, achat_completion, run_async
+from .metrics import AnalysisTrace
+from collections import Counter
+import asyncio
 import json
+import re
+import uuid
 
-# To handle different file types, you'll need to install specific libraries.
-# For PDFs: pip install pypdf2
-# For DOCX: pip install python-docx
+# Rough sizes of the model's answers, for cost estimates.
+ESTIMATED_RESPONSE_TOKENS = 300
+ESTIMATED_SUMMARY_TOKENS = 150
+ESTIMATED_REDUCE_PROMPT_TOKENS = 100
 
 
 class DocumentAnalysisService:
@@ -18,101 +29,434 @@ class DocumentAnalysisService:
         if not isinstance(document, Document):
             raise TypeError("A valid Document object must be provided.")
         self.document = document
+        # Stage timings and token usage, stored with the analysis.
+        self.trace = AnalysisTrace()
+        # Set when another analysis of the document started or finished first.
+        self.superseded = False
+        # Identifies this analysis while it holds the document (see analyze).
+        self.token = None
 
-        # Configure OpenAI client
+        # The OpenAI clients themselves are shared process-wide (see openai_client.py)
         if not hasattr(settings, 'OPENAI_API_KEY'):
             raise ValueError("OPENAI_API_KEY is not configured in your project settings.")
-        self.openai_client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
 
-    def _extract_text(self) -> str:
+    def _extract_text(self):
         """
-        Extracts text content from the document file based on its extension.
-        This supports .txt, .pdf, and .docx files.
+        Yields the text content of the document file in page or paragraph
+        sized pieces, using the extractor registered for its extension
+        (.txt, .pdf, .docx, ... see extractors.py).
+        """
+        return iter_document_text(self.document.file)
+
+    @staticmethod
+    def _completion_request(prompt: str) -> dict:
+        return {
+            'model': "gpt-4o-mini", # A cost-effective and powerful model
+            'response_format': {"type": "json_object"},
+            'messages': [
+                {"role": "system", "content": "You are an expert document analyst that always responds with valid JSON."},
+                {"role": "user", "content": prompt}
+            ],
+        }
+
+    def _complete_json(self, prompt: str) -> dict:
+        response = chat_completion(**self._completion_request(prompt))
+        self.trace.add_usage(response)
+        return json.loads(response.choices[0].message.content)
+
+    async def _acomplete_json(self, prompt: str) -> dict:
+        response = await achat_completion(**self._completion_request(prompt))
+        self.trace.add_usage(response)
+        return json.loads(response.choices[0].message.content)
+
+    @staticmethod
+    def _chunk_prompt(chunk: str, index: int = 0, total: int = 1) -> str:
+        part = f" (part {index + 1} of {total})" if total > 1 else ""
+        return f"""
+        Analyze the following document text{part} and provide a structured JSON response.
+        The JSON object must contain three keys:
+        1. "summary": A concise summary of the document.
+        2. "key_phrases": A list of 5-10 important keywords or phrases.
+        3. "sentiment": The overall sentiment of the text (e.g., "positive", "negative", "neutral").
+
+        Document Text:
+        ---
+        {chunk}
+        ---
+
+        Provide only the raw JSON object as your response.
+        """
+
+    async def _analyze_chunks(self, prompts: list) -> list:
+        """
+        Map step: sends every chunk prompt, with at most
+        ANALYSIS_CHUNK_CONCURRENCY requests in flight for this document.
+        """
+        semaphore = asyncio.Semaphore(max(1, getattr(settings, 'ANALYSIS_CHUNK_CONCURRENCY', 4)))
+
+        async def analyze_chunk(prompt):
+            async with semaphore:
+                return await self._acomplete_json(prompt)
+
+        return await asyncio.gather(*(analyze_chunk(prompt) for prompt in prompts))
+
+    def _reduce(self, partials: list) -> dict:
+        """
+        Reduce step: merges the per-chunk results into one analysis.
+        Summaries are combined by the model; key phrases and sentiment are
+        merged locally by frequency.
+        """
+        phrase_counts = Counter()
+        display_phrase = {}
+        for partial in partials:
+            for phrase in partial.get("key_phrases") or []:
+                key = str(phrase).strip().lower()
+                if key:
+                    phrase_counts[key] += 1
+                    display_phrase.setdefault(key, str(phrase).strip())
+        key_phrases = [display_phrase[key] for key, _ in phrase_counts.most_common(10)]
+
+        sentiments = Counter(
+            str(partial.get("sentiment", "")).strip().lower() for partial in partials
+        )
+        sentiments.pop("", None)
+        ranked = sentiments.most_common(2)
+        if not ranked:
+            sentiment = "unknown"
+        elif len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+            sentiment = "mixed"
+        else:
+            sentiment = ranked[0][0]
+
+        section_summaries = "\n".join(
+            f"{i + 1}. {partial.get('summary', '')}" for i, partial in enumerate(partials)
+        )
+        prompt = f"""
+        The following are summaries of consecutive sections of one document.
+        Combine them into a single structured JSON response with one key:
+        1. "summary": A concise summary of the whole document.
+
+        Section Summaries:
+        ---
+        {section_summaries}
+        ---
+
+        Provide only the raw JSON object as your response.
+        """
+        merged = self._complete_json(prompt)
+        return {
+            "summary": merged.get("summary", "No summary generated."),
+            "key_phrases": key_phrases,
+            "sentiment": sentiment,
+        }
+
+    def _map_reduce(self, chunks: list) -> dict:
+        """
+        Analyzes the chunks concurrently with a bounded number of in-flight
+        requests, then merges the results. A single chunk skips the reduce.
+        """
+        with self.trace.span('prompt_build'):
+            prompts = [self._chunk_prompt(chunk, i, len(chunks)) for i, chunk in enumerate(chunks)]
+
+        with self.trace.span('llm'):
+            if len(prompts) == 1:
+                return self._complete_json(prompts[0])
+            partials = run_async(self._analyze_chunks(prompts))
+            return self._reduce(partials)
+
+    def _chunks(self) -> list:
+        """
+        Extracts the document text and splits it into the pieces sent to
+        OpenAI, one request each.
+        """
+        if getattr(settings, 'ANALYSIS_CHUNKED_MODE', True):
+            chunks = split_into_chunks(self._extract_text(), getattr(settings, 'ANALYSIS_CHUNK_TOKENS', 2000))
+        else:
+            chunks = [_read_prefix(self._extract_text(), 8000)]
+        if not chunks or not chunks[0].strip():
+            raise ValueError("Text could not be extracted from the document.")
+        return chunks
+
+    def estimate_tokens(self) -> tuple:
+        """
+        Estimates the (prompt, completion) tokens a fresh analysis of the
+        document would use, without calling OpenAI.
+        """
+        chunks = self._chunks()
+        prompt_tokens = sum(
+            _estimate_tokens(self._chunk_prompt(chunk, i, len(chunks))) for i, chunk in enumerate(chunks)
+        )
+        completion_tokens = len(chunks) * ESTIMATED_RESPONSE_TOKENS
+        if len(chunks) > 1:
+            # The reduce step reads back one summary per chunk.
+            prompt_tokens += ESTIMATED_REDUCE_PROMPT_TOKENS + len(chunks) * ESTIMATED_SUMMARY_TOKENS
+            completion_tokens += ESTIMATED_SUMMARY_TOKENS
+        return prompt_tokens, completion_tokens
+
+    def _update_search_index(self, analysis_results: dict, chunks=()):
+        """
+        Adds the document to its owner's semantic search index. A failure here
+        is logged but does not fail the analysis.
         """
         try:
-            # The file object needs to be opened to read its content
-            with self.document.file.open('rb') as f:
-                filename = self.document.file.name
-                if filename.endswith('.txt'):
-                    return f.read().decode('utf-8')
+            index_document(self.document, analysis_results, chunks)
+        except Exception as e:
+            print(f"Error indexing document {self.document.id}: {e}")
 
+    def _previous_outcome(self):
+        """
+        The (status, sentiment, key phrases) of the document before this
+        analysis, so that a re-analysis replaces its analytics contribution.
+        """
+        analysis = DocumentAnalysis.objects.filter(document=self.document).values('sentiment', 'key_phrases').first() or {}
+        return self.document.status, analysis.get('sentiment'), analysis.get('key_phrases')
 
+    def _update_analytics(self, analysis_results=None, previous=None):
+        """
+        Applies the document's current status to the owner's daily rollup,
+        taking back `previous`. A failure here is logged but does not change
+        the outcome.
+        """
+        try:
+            record_outcome(self.document, analysis_results, previous)
         except Exception as e:
-            print(f"Error extracting text from {self.document.original_filename}: {e}")
-            return ""  # Return empty string on error
+            print(f"Error updating analytics for document {self.document.id}: {e}")
+
+    def _find_reusable_analysis(self):
+        """
+        Returns a completed analysis of another document with identical
+        content, or None if this content has never been analyzed.
+        """
+        if not self.document.content_hash:
+            return None
+        return (
+            DocumentAnalysis.objects
+            .filter(
+                document__content_hash=self.document.content_hash,
+                document__status=Document.UploadStatus.COMPLETED,
+            )
+            .exclude(document=self.document)
+            .order_by('-created_at')
+            .first()
+        )
+
+    def _trace_fields(self) -> dict:
+        return {
+            'timings': dict(self.trace.timings),
+            'prompt_tokens': self.trace.prompt_tokens,
+            'completion_tokens': self.trace.completion_tokens,
+        }
+
+    def _store_timings(self):
+        """
+        Saves the timings again once the persist stage itself is measured.
+        """
+        DocumentAnalysis.objects.filter(document=self.document).update(timings=dict(self.trace.timings))
+
+    def _finish(self, status, defaults: dict) -> bool:
+        """
+        Ends this analysis with `status` and stores `defaults` on its
+        DocumentAnalysis, in one transaction. If another analysis of the
+        document finished or took over in the meantime, nothing is written
+        and False is returned.
+        """
+        with transaction.atomic():
+            if not self.document.transition(status, expected=Document.UploadStatus.PROCESSING, token=self.token):
+                print(f"Document {self.document.id} changed status during the analysis; not marked {status}.")
+                return False
+            DocumentAnalysis.objects.update_or_create(
+                document=self.document, defaults={**defaults, **self._trace_fields()}
+            )
+        return True
+
+    def _superseded(self, message: str):
+        self.superseded = True
+        self.trace.publish('superseded')
+        return False, message
 
-    def analyze(self):
+    def analyze(self, reuse_existing: bool = True, final_attempt: bool = True, token: str = None):
         """
         Runs the document analysis process using the OpenAI API.
+        With `reuse_existing=False` the results of an identical earlier upload
+        are not copied, e.g. when re-analyzing after a prompt change.
+        With `final_attempt=False` a failure puts the document back to
+        UPLOADED instead of FAILED, as the caller will retry it.
+        The time spent per stage and the tokens used are stored with the
+        analysis and added to the process's metrics (see metrics.py).
+
+        Another analysis of the same document that starts or finishes first
+        wins: this one then writes nothing, sets `superseded` and returns
+        (False, message). So does an analysis whose document was taken away
+        from it and analyzed again meanwhile; `token` identifies this
+        analysis (see Document.transition).
         """
+        self.token = token or uuid.uuid4().hex
+        previous = self._previous_outcome()
+        # 1. Update status to PROCESSING, unless another analysis got there first
+        if Document.UploadStatus.PROCESSING not in STATUS_TRANSITIONS[self.document.status]:
+            return self._superseded(f"The document is {self.document.status} and cannot be analyzed now.")
+        if not self.document.transition(Document.UploadStatus.PROCESSING, token=self.token):
+            return self._superseded("The document's status changed before the analysis started.")
+        if previous[0] in (Document.UploadStatus.COMPLETED, Document.UploadStatus.FAILED):
+            # The rollups count the current status only, so the earlier
+            # outcome is taken back now rather than when this one ends.
+            self._update_analytics(previous=previous)
+
         try:
-            # 1. Update status to PROCESSING
-            self.document.status = Document.UploadStatus.PROCESSING
-            self.document.save()
+            # --- REUSE A PREVIOUS ANALYSIS OF THE SAME CONTENT ---
+            existing = self._find_reusable_analysis() if reuse_existing else None
+            if existing is not None:
+                results = {'summary': existing.summary, 'key_phrases': existing.key_phrases, 'sentiment': existing.sentiment}
+                with self.trace.span('persist'):
+                    if not self._finish(Document.UploadStatus.COMPLETED, {**results, 'reused_from': existing.document}):
+                        return self._superseded("Another analysis of the document finished first.")
+                    self._update_search_index(results)
+                    self._update_analytics(results)
+                self._store_timings()
+                self.trace.publish('reused')
+                print(f"Reused analysis of identical document {existing.document_id}.")
+                return True, "Analysis reused from an identical document."
 
             # --- EXTRACT TEXT FROM DOCUMENT ---
             print(f"Starting text extraction for {self.document.original_filename}...")
-            document_content = self._extract_text()
-            if not document_content or document_content.startswith("Unsupported"):
-                raise ValueError(document_content or "Text could not be extracted from the document.")
+            with self.trace.span('extract'):
+                chunks = self._chunks()
 
             # --- CALL OPENAI API FOR ANALYSIS ---
-            print("Sending content to OpenAI for analysis...")
-            prompt = f"""
-            Analyze the following document text and provide a structured JSON response.
-            The JSON object must contain three keys:
-            1. "summary": A concise summary of the document.
-            2. "key_phrases": A list of 5-10 important keywords or phrases.
-            3. "sentiment": The overall sentiment of the text (e.g., "positive", "negative", "neutral").
-
-            Document Text:
-            ---
-            {document_content[:8000]}
-            ---
-
-            Provide only the raw JSON object as your response.
-            """
-
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini", # A cost-effective and powerful model
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": "You are an expert document analyst that always responds with valid JSON."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            analysis_results = json.loads(response.choices[0].message.content)
+            print(f"Sending {len(chunks)} chunk(s) to OpenAI for analysis...")
+            analysis_results = self._map_reduce(chunks)
 
-            # 2. Store the results from OpenAI
-            DocumentAnalysis.objects.update_or_create(
-                document=self.document,
-                defaults={
+            with self.trace.span('persist'):
+                # 2. Update status to COMPLETED and store the results from OpenAI
+                results = {
                     'summary': analysis_results.get("summary", "No summary generated."),
                     'key_phrases': analysis_results.get("key_phrases", []),
                     'sentiment': analysis_results.get("sentiment", "unknown"),
+                    'reused_from': None,
                 }
-            )
-
-            # 3. Update status to COMPLETED
-            self.document.status = Document.UploadStatus.COMPLETED
-            self.document.save()
+                if not self._finish(Document.UploadStatus.COMPLETED, results):
+                    return self._superseded("Another analysis of the document finished first.")
+                self._update_search_index(analysis_results, chunks)
+                self._update_analytics(analysis_results)
+            self._store_timings()
+            self.trace.publish('completed')
             print("Analysis finished and results saved.")
             return True, "Analysis completed successfully."
 
         except Exception as e:
-            # 4. Update status to FAILED on error
-            self.document.status = Document.UploadStatus.FAILED
-            self.document.save()
+            # 3. Update status to FAILED on error
             error_message = f"An error occurred: {e}"
             print(f"Error analyzing document {self.document.id}: {error_message}")
-            # Optionally save the error to the analysis object
-            DocumentAnalysis.objects.update_or_create(
-                document=self.document,
-                defaults={'summary': f"Analysis Failed: {error_message}"}
-            )
+            if not final_attempt:
+                # Not a final outcome: users and analytics never see a
+                # FAILED that a retry turns into COMPLETED.
+                if not self.document.transition(
+                    Document.UploadStatus.UPLOADED, expected=Document.UploadStatus.PROCESSING, token=self.token
+                ):
+                    return self._superseded("Another analysis of the document finished first.")
+                self.trace.publish('retried')
+                return False, error_message
+            # Optionally save the error to the analysis object; tokens spent
+            # on a failed attempt are kept too.
+            if not self._finish(Document.UploadStatus.FAILED, {'summary': f"Analysis Failed: {error_message}"}):
+                return self._superseded("Another analysis of the document finished first.")
+            self._update_analytics()
+            self.trace.publish('failed')
             return False, error_message
 
 
+def _estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text.
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _read_prefix(texts, max_chars: int) -> str:
+    """
+    Collects the first `max_chars` characters of a stream of text pieces and
+    stops the extraction there.
+    """
+    collected, size = [], 0
+    for text in texts:
+        collected.append(text[:max_chars - size])
+        size += len(collected[-1])
+        if size >= max_chars:
+            texts.close()
+            break
+    return "".join(collected)
+
+
+def _iter_paragraphs(texts, max_chars: int):
+    """
+    Splits a stream of text pieces into paragraphs of at most `max_chars`.
+    Paragraphs that are too long on their own are cut at line, then sentence,
+    then character boundaries.
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+    for text in texts:
+        for paragraph in re.split(r'\n\s*\n', text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if len(paragraph) <= max_chars:
+                yield paragraph
+                continue
+            for part in re.split(r'(?<=[.!?])\s+|\n', paragraph):
+                while len(part) > max_chars:
+                    yield part[:max_chars]
+                    part = part[max_chars:]
+                if part.strip():
+                    yield part
+
+
+def split_into_chunks(texts, max_tokens: int) -> list:
+    """
+    Packs text into chunks of at most `max_tokens` (estimated), breaking only
+    at paragraph boundaries where possible. `texts` is a string or an iterable
+    of text pieces such as the output of the extractors, which is consumed
+    lazily and only as far as ANALYSIS_MAX_CHUNKS requires.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    max_chunks = getattr(settings, 'ANALYSIS_MAX_CHUNKS', 100)
+    pieces = _iter_paragraphs(texts, max_chars)
+
+    chunks = []
+    current, current_tokens = [], 0
+    for piece in pieces:
+        piece_tokens = _estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+            if len(chunks) == max_chunks:
+                print(f"Document exceeds {max_chunks} chunks; only the beginning is analyzed.")
+                pieces.close()
+                if hasattr(texts, 'close'):
+                    texts.close()
+                return chunks
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def get_deduplication_stats(documents=None) -> dict:
+    """
+    Counts how many completed analyses were copied from an identical upload
+    (hits) versus computed with an OpenAI call (misses).
+    """
+    analyses = DocumentAnalysis.objects.filter(document__status=Document.UploadStatus.COMPLETED)
+    if documents is not None:
+        analyses = analyses.filter(document__in=documents)
+    counts = analyses.aggregate(
+        hits=Count('id', filter=Q(reused_from__isnull=False)),
+        misses=Count('id', filter=Q(reused_from__isnull=True)),
+    )
+    total = counts['hits'] + counts['misses']
+    counts['hit_rate'] = counts['hits'] / total if total else 0.0
+    return counts
+
+
 def start_document_analysis(document_id: str):
     """
     Initiates the analysis for a given document ID.
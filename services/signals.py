@@ -0,0 +1,67 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .analytics import record_deletion, record_upload
+from .events import publish_document_event
+from .keyword_search import update_search_vector
+from .models import Document, DocumentAnalysis, DocumentStatusEvent, document_status_changed
+from .search_index import remove_document
+from .versioning import bump_document_version
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def document_changed(sender, instance, **kwargs):
+    if instance.user_id:
+        bump_document_version(instance.user_id)
+
+
+@receiver(post_save, sender=DocumentAnalysis)
+@receiver(post_delete, sender=DocumentAnalysis)
+def analysis_changed(sender, instance, **kwargs):
+    if DocumentAnalysis.document.is_cached(instance):
+        user_id = instance.document.user_id
+    else:
+        user_id = Document.objects.filter(pk=instance.document_id).values_list('user_id', flat=True).first()
+    if user_id:
+        bump_document_version(user_id)
+
+
+@receiver(post_save, sender=DocumentAnalysis)
+def analysis_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'summary', 'key_phrases'} & set(update_fields):
+        update_search_vector(instance.pk)
+
+
+@receiver(post_save, sender=Document)
+def document_saved(sender, instance, created=False, **kwargs):
+    publish_document_event(instance)
+    if created:
+        DocumentStatusEvent.objects.create(document_id=instance.pk, to_status=instance.status, at=instance.uploaded_at)
+        record_upload(instance)
+
+
+@receiver(document_status_changed, sender=Document)
+def document_status_updated(sender, instance, **kwargs):
+    if instance.user_id:
+        bump_document_version(instance.user_id)
+    publish_document_event(instance)
+
+
+@receiver(pre_delete, sender=Document)
+def document_deleting(sender, instance, **kwargs):
+    # The analysis is deleted before the document, so read the outcome now.
+    instance._rollup_outcome = (
+        Document.objects.filter(pk=instance.pk)
+        .values_list('status', 'analysis__sentiment', 'analysis__key_phrases')
+        .first()
+    )
+
+
+@receiver(post_delete, sender=Document)
+def document_deleted(sender, instance, **kwargs):
+    try:
+        remove_document(instance)
+    except Exception as e:
+        print(f"Error removing document {instance.id} from the search index: {e}")
+    record_deletion(instance, getattr(instance, '_rollup_outcome', None))
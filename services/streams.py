@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from accounts.authentication import CachedJWTAuthentication
+
+from .events import broker, ensure_listener
+
+
+def _authenticate(request):
+    """
+    Accepts the access token as a Bearer header or, because EventSource
+    cannot set headers, as a `token` query parameter.
+    """
+    authenticator = CachedJWTAuthentication()
+    raw_token = request.GET.get('token')
+    if raw_token:
+        validated_token = authenticator.get_validated_token(raw_token)
+        return authenticator.get_user(validated_token)
+    result = authenticator.authenticate(request)
+    return result[0] if result else None
+
+
+def _format_event(event: dict) -> str:
+    return f"event: document\nid: {event['id']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def document_events(request):
+    """
+    Server-Sent Events stream of the user's document status changes
+    (PROCESSING, COMPLETED with the analysis, FAILED, ...).
+
+    Serve it through the ASGI application (irs/asgi.py): an idle stream is
+    then just a parked coroutine, and events arrive without any polling.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        user = await sync_to_async(_authenticate)(request)
+    except (InvalidToken, AuthenticationFailed):
+        user = None
+    if user is None or not user.is_active:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    await sync_to_async(ensure_listener)()
+    heartbeat = getattr(settings, 'DOCUMENT_EVENTS_HEARTBEAT_SECONDS', 15)
+
+    async def stream():
+        queue = broker.subscribe(user.pk)
+        try:
+            yield f"retry: {heartbeat * 1000}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection.
+                    yield ": keepalive\n\n"
+                    continue
+                yield _format_event(event)
+        finally:
+            broker.unsubscribe(user.pk, queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,51 @@
+import uuid
+
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from services.models import Document
+
+
+class DocumentDetailETagTests(APITestCase):
+    """
+    A conditional GET of one document answers 304 only for that document,
+    and only while it exists for the requesting user.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='etags@example.com', username='etags', password='x', first_name='E', last_name='T',
+        )
+        self.client.force_authenticate(self.user)
+        self.first, self.second = [
+            Document.objects.create(
+                user=self.user, file=f'uploaded_documents/{name}', original_filename=name, filesize=1,
+            )
+            for name in ('first.txt', 'second.txt')
+        ]
+
+    def _get(self, document_id, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(f'/api/services/documents/{document_id}/', headers=headers)
+
+    def test_unchanged_document_is_not_modified(self):
+        etag = self._get(self.first.pk)['ETag']
+        self.assertEqual(self._get(self.first.pk, etag).status_code, 304)
+
+    def test_etag_of_another_document_does_not_match(self):
+        etag = self._get(self.first.pk)['ETag']
+        self.assertEqual(self._get(self.second.pk, etag).status_code, 200)
+
+    def test_missing_or_foreign_documents_are_not_found(self):
+        other = User.objects.create_user(
+            email='other@example.com', username='other', password='x', first_name='O', last_name='T',
+        )
+        foreign = Document.objects.create(
+            user=other, file='uploaded_documents/f.txt', original_filename='f.txt', filesize=1,
+        )
+        self.assertEqual(self._get(uuid.uuid4(), '*').status_code, 404)
+        self.assertEqual(self._get(foreign.pk, '*').status_code, 404)
+
+        etag = self._get(self.first.pk)['ETag']
+        Document.objects.filter(pk=self.first.pk).delete()
+        self.assertEqual(self._get(self.first.pk, etag).status_code, 404)
@@ -0,0 +1,44 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from services.models import Document, DocumentAnalysis
+
+
+class DocumentListQueryCountTests(APITestCase):
+    """
+    The document list costs the same number of queries however many
+    documents (and analyses) a page holds.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='list@example.com', username='list', password='x', first_name='List', last_name='Test',
+        )
+        self.client.force_authenticate(self.user)
+
+    def add_documents(self, count: int):
+        for i in range(count):
+            document = Document.objects.create(
+                user=self.user,
+                file='uploaded_documents/list.txt',
+                original_filename=f'list-{i}.txt',
+                filesize=i,
+                status=Document.UploadStatus.COMPLETED,
+            )
+            DocumentAnalysis.objects.create(document=document, summary='Summary', key_phrases=['a'], sentiment='neutral')
+
+    def list_queries(self, expected_rows: int) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/services/documents/', {'page_size': 200})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), expected_rows)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_documents(5)
+        small = self.list_queries(5)
+        self.add_documents(195)
+        large = self.list_queries(200)
+        self.assertEqual(small, large)
@@ -0,0 +1,50 @@
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from services.keyword_search import HEADLINE_START, HEADLINE_STOP, headline_html
+from services.models import Document, DocumentAnalysis
+
+
+class KeywordSearchHighlightTests(APITestCase):
+    """
+    Highlights are rendered as HTML, so user-controlled text in them must
+    come back escaped, with only the <mark> tags left as markup.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='search@example.com', username='search', password='x', first_name='Search', last_name='Test',
+        )
+        self.client.force_authenticate(self.user)
+        document = Document.objects.create(
+            user=self.user,
+            file='uploaded_documents/report.pdf',
+            original_filename='<img src=x onerror=alert(1)>report.pdf',
+            filesize=1,
+            status=Document.UploadStatus.COMPLETED,
+        )
+        DocumentAnalysis.objects.create(
+            document=document,
+            summary='The <script>alert(1)</script> report & its findings.',
+            key_phrases=['<b>report</b> card'],
+            sentiment='neutral',
+        )
+
+    def test_highlights_escape_markup(self):
+        response = self.client.get('/api/services/documents/search/', {'q': 'report', 'mode': 'keyword'})
+        self.assertEqual(response.status_code, 200)
+        highlights = response.data['results'][0]['highlights']
+        self.assertEqual(highlights['filename'], '&lt;img src=x onerror=alert(1)&gt;<mark>report</mark>.pdf')
+        self.assertEqual(
+            highlights['summary'],
+            'The &lt;script&gt;alert(1)&lt;/script&gt; <mark>report</mark> &amp; its findings.',
+        )
+        self.assertEqual(highlights['key_phrases'], ['&lt;b&gt;<mark>report</mark>&lt;/b&gt; card'])
+
+    def test_terms_do_not_match_inside_entities(self):
+        response = self.client.get('/api/services/documents/search/', {'q': 'amp report', 'mode': 'keyword'})
+        self.assertNotIn('&<mark>', response.data['results'][0]['highlights']['summary'])
+
+    def test_postgres_headline_is_escaped(self):
+        headline = f"<i>x</i> {HEADLINE_START}report{HEADLINE_STOP}"
+        self.assertEqual(headline_html(headline), '&lt;i&gt;x&lt;/i&gt; <mark>report</mark>')
@@ -0,0 +1,26 @@
+"""
+EXPLAINs the queries that run on every request or worker poll against
+large fixture tables and fails if any of them scans its table
+sequentially. `manage.py check_query_plans` runs the same checks against
+the configured database.
+"""
+import uuid
+
+from django.test import TestCase
+
+from services.query_plans import hot_queries, is_sequential_scan, seed_plan_fixtures
+
+
+class QueryPlanTests(TestCase):
+    ROWS = 20000
+    USERS = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_plan_fixtures(cls.ROWS, cls.USERS)
+
+    def test_hot_queries_use_an_index(self):
+        for label, table, queryset in hot_queries(self.user, uuid.uuid4().hex):
+            with self.subTest(label):
+                plan = queryset.explain()
+                self.assertFalse(is_sequential_scan(plan, table), f"{label} scans {table} sequentially:\n{plan}")
@@ -0,0 +1,62 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from accounts.models import User
+from services.analytics import record_outcome
+from services.models import DailyUserRollup, Document, DocumentAnalysis
+
+
+class RollupDeletionTests(TestCase):
+    """
+    The live rollups must match what backfill_rollups rebuilds from the
+    documents that are left, also after documents are deleted.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='rollups@example.com', username='rollups', password='x', first_name='Roll', last_name='Up',
+        )
+
+    def _document(self, name, status=None, sentiment=None, key_phrases=None):
+        document = Document.objects.create(
+            user=self.user, file=f'uploaded_documents/{name}', original_filename=name, filesize=len(name) * 100,
+        )
+        if status is None:
+            return document
+        for step in (Document.UploadStatus.UPLOADED, Document.UploadStatus.PROCESSING, status):
+            document.transition(step)
+        analysis = None
+        if status == Document.UploadStatus.COMPLETED:
+            analysis = {'sentiment': sentiment, 'key_phrases': key_phrases}
+            DocumentAnalysis.objects.create(document=document, summary='-', **analysis)
+        record_outcome(document, analysis)
+        return document
+
+    def _rollups(self):
+        return sorted(
+            DailyUserRollup.objects.filter(user=self.user).values_list(
+                'day', 'documents', 'bytes_uploaded', 'completed', 'failed', 'sentiments', 'key_phrases',
+            )
+        )
+
+    def _assert_matches_backfill(self):
+        live = self._rollups()
+        call_command('backfill_rollups', user=str(self.user.pk), stdout=StringIO())
+        self.assertEqual(live, self._rollups())
+
+    def test_deleting_documents_takes_back_their_contribution(self):
+        happy = self._document('happy.pdf', Document.UploadStatus.COMPLETED, 'Positive', ['Revenue', 'growth'])
+        self._document('sad.pdf', Document.UploadStatus.COMPLETED, 'negative', ['revenue'])
+        failed = self._document('broken.pdf', Document.UploadStatus.FAILED)
+        self._document('queued.pdf')
+
+        happy.delete()
+        failed.delete()
+        self._assert_matches_backfill()
+
+    def test_deleting_the_last_document_of_a_day_removes_the_row(self):
+        self._document('only.pdf', Document.UploadStatus.COMPLETED, 'neutral', ['one']).delete()
+        self.assertEqual(self._rollups(), [])
+        self._assert_matches_backfill()
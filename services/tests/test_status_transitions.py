@@ -0,0 +1,111 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import User
+from services.models import AnalysisJob, Document, DocumentAnalysis, DocumentStatusEvent
+from services.queue import claim_jobs, job_token, requeue_expired_leases
+from services.services import DocumentAnalysisService
+
+_Status = Document.UploadStatus
+
+
+class DocumentTransitionTests(TestCase):
+    """
+    Status changes are conditional updates: whoever changes the status
+    first wins, and only the analysis holding a PROCESSING document can
+    move it on.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='transitions@example.com', username='transitions', password='x', first_name='T', last_name='T',
+        )
+        self.document = Document.objects.create(
+            user=self.user, file='uploaded_documents/t.txt', original_filename='t.txt', filesize=1,
+            status=_Status.UPLOADED,
+        )
+
+    def test_only_the_first_of_two_transitions_wins(self):
+        stale = Document.objects.get(pk=self.document.pk)
+        self.assertTrue(self.document.transition(_Status.PROCESSING))
+        self.assertFalse(stale.transition(_Status.PROCESSING))
+        self.assertEqual(stale.status, _Status.UPLOADED)
+        self.assertEqual(
+            DocumentStatusEvent.objects.filter(document_id=self.document.pk, to_status=_Status.PROCESSING).count(), 1,
+        )
+
+    def test_disallowed_transitions_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.document.transition(_Status.COMPLETED)
+        with self.assertRaises(ValueError):
+            self.document.transition(_Status.PENDING)
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, _Status.UPLOADED)
+
+    def test_a_taken_over_analysis_cannot_finish(self):
+        self.assertTrue(self.document.transition(_Status.PROCESSING, token='first'))
+        # The first worker's lease expires; the document is analyzed again.
+        self.assertTrue(self.document.transition(_Status.UPLOADED, token='first'))
+        self.assertTrue(self.document.transition(_Status.PROCESSING, token='second'))
+
+        stale = Document.objects.get(pk=self.document.pk)
+        self.assertFalse(stale.transition(_Status.COMPLETED, expected=_Status.PROCESSING, token='first'))
+        self.assertTrue(stale.transition(_Status.COMPLETED, expected=_Status.PROCESSING, token='second'))
+        self.assertEqual(stale.processing_token, '')
+
+
+@mock.patch.object(DocumentAnalysisService, '_update_search_index', lambda *args: None)
+@mock.patch.object(DocumentAnalysisService, '_chunks', lambda self: ['Some text.'])
+class SupersededAnalysisTests(TestCase):
+    """
+    An analysis that loses its document to another one writes nothing and
+    reports itself superseded.
+    """
+
+    RESULTS = {'summary': 'Summary', 'key_phrases': ['text'], 'sentiment': 'neutral'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='superseded@example.com', username='superseded', password='x', first_name='S', last_name='S',
+        )
+        self.document = Document.objects.create(
+            user=self.user, file='uploaded_documents/s.txt', original_filename='s.txt', filesize=1,
+            status=_Status.UPLOADED,
+        )
+
+    def test_analysis_of_a_document_being_processed_is_superseded(self):
+        Document.objects.get(pk=self.document.pk).transition(_Status.PROCESSING)
+        service = DocumentAnalysisService(self.document)
+        with mock.patch.object(DocumentAnalysisService, '_map_reduce', return_value=self.RESULTS) as map_reduce:
+            succeeded, _ = service.analyze()
+        self.assertFalse(succeeded)
+        self.assertTrue(service.superseded)
+        map_reduce.assert_not_called()
+        self.assertFalse(DocumentAnalysis.objects.exists())
+
+    def test_worker_whose_lease_expired_loses_to_the_next_attempt(self):
+        AnalysisJob.objects.create(document=self.document, available_at=timezone.now())
+        [job] = claim_jobs('worker-1', 1)
+
+        def expire_and_retry(service, chunks):
+            # While the first worker is busy its lease expires, and another
+            # worker claims the job again and takes the document over.
+            AnalysisJob.objects.filter(pk=job.pk).update(leased_until=timezone.now() - timedelta(seconds=1))
+            requeue_expired_leases()
+            [retry] = claim_jobs('worker-2', 1)
+            Document.objects.get(pk=self.document.pk).transition(_Status.PROCESSING, token=job_token(retry))
+            return self.RESULTS
+
+        service = DocumentAnalysisService(self.document)
+        with mock.patch.object(DocumentAnalysisService, '_map_reduce', expire_and_retry):
+            succeeded, _ = service.analyze(token=job_token(job))
+
+        self.assertFalse(succeeded)
+        self.assertTrue(service.superseded)
+        self.assertFalse(DocumentAnalysis.objects.exists())
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, _Status.PROCESSING)
+        self.assertEqual(self.document.processing_token, job_token(AnalysisJob.objects.get(pk=job.pk)))
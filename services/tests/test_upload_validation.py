@@ -0,0 +1,33 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from services.models import Document
+
+
+class UploadContentTypeTests(APITestCase):
+    """
+    Uploads are sniffed while they stream in; content that contradicts the
+    file extension is rejected before a document is created.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='sniff@example.com', username='sniff', password='x', first_name='Sniff', last_name='Test',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _upload(self, name, content):
+        return self.client.post(
+            '/api/services/documents/', {'file': SimpleUploadedFile(name, content)}, format='multipart',
+        )
+
+    def test_mismatched_content_is_rejected(self):
+        self.assertEqual(self._upload('report.pdf', b'just some text').status_code, 400)
+        self.assertEqual(self._upload('notes.txt', b'%PDF-1.7\n...').status_code, 400)
+        self.assertFalse(Document.objects.exists())
+
+    def test_matching_content_is_accepted(self):
+        self.assertEqual(self._upload('report.pdf', b'%PDF-1.7\n...').status_code, 201)
+        # A multi-byte character cut off by the sniffed prefix is still text.
+        self.assertEqual(self._upload('notes.txt', 'é'.encode() * 40).status_code, 201)
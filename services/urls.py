@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import DocumentViewSet
+from .streams import document_events
 
 # Create a router and register our viewsets with it.
 router = DefaultRouter()
@@ -8,5 +9,7 @@ router.register(r'documents', DocumentViewSet)
 
 # The API URLs are now determined automatically by the router.
 urlpatterns = [
+    # Must come before the router, which would treat "events" as a document id.
+    path('documents/events/', document_events, name='document-events'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import DocumentListVersion
+
+
+def bump_document_version(user_id):
+    """
+    Invalidates every ETag and cached payload of the user's document API.
+    """
+    now = timezone.now()
+    updated = DocumentListVersion.objects.filter(user_id=user_id).update(
+        version=F('version') + 1, updated_at=now
+    )
+    if not updated:
+        try:
+            DocumentListVersion.objects.create(user_id=user_id, version=1, updated_at=now)
+        except IntegrityError:
+            # Someone else created it first.
+            DocumentListVersion.objects.filter(user_id=user_id).update(
+                version=F('version') + 1, updated_at=now
+            )
+
+
+def get_document_version(user_id):
+    """
+    Returns (version, last modified) for the user's documents.
+    """
+    row = DocumentListVersion.objects.filter(user_id=user_id).values_list('version', 'updated_at').first()
+    return row or (0, None)
+
+
+def _not_modified(request, etag, last_modified) -> bool:
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in candidates or etag in candidates
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if if_modified_since is not None and last_modified is not None:
+        return int(last_modified.timestamp()) <= if_modified_since
+    return False
+
+
+def conditional_document_response(view, request, produce_response, scope=None):
+    """
+    Serves a GET on the document API with ETag/Last-Modified validators.
+
+    An unchanged poll is answered with 304 after a single lookup of the
+    user's version row. Otherwise rendered JSON is served from the cache,
+    keyed by version and URL, and `produce_response` only runs on a miss.
+    `scope`, e.g. a document id, is part of the ETag so that different
+    resources never share one.
+    """
+    version, last_modified = get_document_version(request.user.pk)
+    etag = quote_etag(f"{request.user.pk}-{version}" + (f"-{scope}" if scope is not None else ''))
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # Only cache JSON; the browsable API renders per-request context.
+    cacheable = getattr(request.accepted_renderer, 'format', None) == 'json'
+    cache_key = f"documents:{request.user.pk}:{version}:{request.get_full_path()}"
+    if cacheable:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            for name, value in headers.items():
+                response[name] = value
+            return response
+
+    response = produce_response()
+    for name, value in headers.items():
+        response[name] = value
+
+    if cacheable and response.status_code == status.HTTP_200_OK:
+        # Render now so the exact bytes can be cached.
+        response = view.finalize_response(request, response)
+        response.render()
+        cache.set(
+            cache_key,
+            (response.content, response['Content-Type']),
+            getattr(settings, 'DOCUMENT_CACHE_TIMEOUT', 300),
+        )
+    return response
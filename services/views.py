@@ -1,17 +1,29 @@
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
+from django.utils.dateparse import parse_date
+from uploads.handlers import StreamingUploadMixin
 from .models import Document
+from .pagination import DocumentCursorPagination
 from .serializer import DocumentSerializer
-from .services import start_document_analysis
-import threading
+from .queue import enqueue_document_analysis
+from .analytics import get_user_analytics
+from .keyword_search import search_documents
+from .search_index import UserSearchIndex
+from .services import get_deduplication_stats
+from .versioning import conditional_document_response
 
-class DocumentViewSet(viewsets.ModelViewSet):
+class DocumentViewSet(StreamingUploadMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows documents to be viewed or uploaded.
     """
-    queryset = Document.objects.all().order_by('-uploaded_at')
+    # `id` breaks ties between documents uploaded in the same instant, which
+    # the cursor pagination relies on.
+    queryset = Document.objects.all().order_by('-uploaded_at', '-id')
     serializer_class = DocumentSerializer
+    pagination_class = DocumentCursorPagination
     permission_classes = [IsAuthenticated]
     http_method_names = ['get', 'post', 'head', 'options', 'delete'] # Disallow PUT/PATCH
 
@@ -19,28 +31,109 @@ class DocumentViewSet(viewsets.ModelViewSet):
         """
         This view should return a list of all the documents
         for the currently authenticated user.
+        The analysis and user are joined in so serializing a page costs one query.
         """
-        return self.queryset.filter(user=self.request.user)
+        return self.queryset.filter(user=self.request.user).select_related('analysis', 'user')
+
+    def list(self, request, *args, **kwargs):
+        """
+        Supports conditional GET: polls with a current ETag get a 304.
+        """
+        return conditional_document_response(self, request, lambda: super(DocumentViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Supports conditional GET like `list`. The document is looked up
+        first, so a deleted or foreign one is a 404 and never a 304.
+        """
+        document = self.get_object()
+        return conditional_document_response(
+            self, request, lambda: Response(self.get_serializer(document).data), scope=document.pk
+        )
 
     def create(self, request, *args, **kwargs):
         """
-        Handle file upload and trigger the analysis in the background.
+        Handle file upload and queue the analysis for the background workers.
         """
+        if self.upload_was_rejected(request):
+            return Response(
+                {"error": f"File size cannot exceed {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        file_obj = request.FILES.get('file')
+        type_error = file_obj and self.upload_type_error(file_obj)
+        if type_error:
+            return Response({"error": type_error}, status=status.HTTP_400_BAD_REQUEST)
+
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         # The serializer's create method handles saving the file
         # and associating the user.
         document = serializer.save()
 
-        # --- Trigger Analysis in a Background Thread ---
-        # In a production environment, you should use a proper task queue
-        # like Celery instead of a simple thread.
-        analysis_thread = threading.Thread(
-            target=start_document_analysis,
-            args=(document.id,)
-        )
-        analysis_thread.start()
-        # --- End of Background Task Trigger ---
+        # --- Queue the Analysis ---
+        # The job is picked up by `manage.py run_analysis_workers`, so the
+        # request returns immediately and survives a web worker restart.
+        enqueue_document_analysis(document.id)
 
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+    @action(detail=False, methods=['get'], url_path='dedup-stats')
+    def dedup_stats(self, request):
+        """
+        Reports how many analyses were served from identical earlier uploads.
+        Staff users see the totals for all documents.
+        """
+        documents = None if request.user.is_staff else self.get_queryset()
+        return Response(get_deduplication_stats(documents))
+
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        Daily upload and analysis totals for the user: ?since=YYYY-MM-DD&until=YYYY-MM-DD.
+        Served from the per-day rollups, never from the document tables.
+        """
+        dates = {}
+        for name in ('since', 'until'):
+            value = request.query_params.get(name)
+            if value:
+                dates[name] = parse_date(value)
+                if dates[name] is None:
+                    return Response({"error": f"{name} must be a date (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_user_analytics(request.user, **dates))
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Searches the user's analyzed documents: ?q=<text>&k=<n>&mode=<mode>.
+        `mode=semantic` (the default) ranks by meaning; `mode=keyword` matches
+        words in summaries, key phrases and filenames and returns highlights.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "The q parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = max(1, min(int(request.query_params.get('k', 10)), 50))
+        except ValueError:
+            k = 10
+        mode = request.query_params.get('mode', 'semantic')
+
+        if mode == 'keyword':
+            results = [
+                {**self.get_serializer(document).data, 'score': round(score, 4), 'highlights': highlights}
+                for document, score, highlights in search_documents(request.user, query, k)
+            ]
+            return Response({'results': results})
+        if mode != 'semantic':
+            return Response({"error": "mode must be 'semantic' or 'keyword'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        hits = UserSearchIndex(request.user.pk).query(query, k)
+        documents = self.get_queryset().in_bulk([document_id for document_id, _ in hits])
+        results = []
+        for document_id, score in hits:
+            document = documents.get(document_id)
+            if document is not None:
+                results.append({**self.get_serializer(document).data, 'score': round(score, 4)})
+        return Response({'results': results})
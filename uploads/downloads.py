@@ -0,0 +1,189 @@
+"""
+Serving uploaded media back to their owner.
+
+Responses carry an ETag and Last-Modified, so clients revalidate with a 304
+instead of downloading again, and single byte ranges are answered with a
+206 (video players seek this way). If-Range is honoured: a range is only
+served if the client's copy is still current, otherwise the whole file is.
+
+The body is a FileResponse over the open file, which WSGI servers with a
+file wrapper (e.g. gunicorn) send with sendfile(). With DOWNLOAD_OFFLOAD set,
+Django only checks access and the reverse proxy sends the file:
+
+    DOWNLOAD_OFFLOAD=x-accel-redirect   # nginx, internal location DOWNLOAD_ACCEL_REDIRECT_PREFIX
+    DOWNLOAD_OFFLOAD=x-sendfile         # Apache mod_xsendfile, lighttpd
+"""
+import io
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int):
+    """
+    The (start, end) byte positions, both inclusive, of a single-range
+    `Range` header, or None if the whole file should be sent. Malformed and
+    multi-range headers are ignored, which RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # A suffix range: the last N bytes.
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+class RangeFile:
+    """
+    Reads `length` bytes of `file` from `start`. The file position is left at
+    `start`, so a server that sends the file with sendfile() starts from
+    there and stops at the response's Content-Length.
+    """
+
+    def __init__(self, file, start: int, length: int):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        try:
+            return self.file.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            raise io.UnsupportedOperation("fileno")
+
+    def close(self):
+        self.file.close()
+
+
+def file_validators(storage, name: str, content_hash: str = ''):
+    """
+    An ETag and the modification timestamp of a stored file. The ETag is
+    the file's SHA-256 recorded at upload time; files without one get a weak
+    ETag from the modification time and size, never a hash of the file.
+    """
+    modified = storage.get_modified_time(name).timestamp()
+    if content_hash:
+        etag = f'"{content_hash}"'
+    else:
+        etag = f'W/"{int(modified * 1000000):x}-{storage.size(name):x}"'
+    return etag, modified
+
+
+def if_range_passes(request, etag: str, last_modified: float) -> bool:
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Weak validators never match (RFC 9110, 13.1.5).
+        return not if_range.startswith('W/') and if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and date == int(last_modified)
+
+
+def _offload_response(storage, name: str, content_type: str):
+    """
+    A body-less response telling the reverse proxy which file to send, or
+    None when downloads are not offloaded. The proxy handles Range itself.
+    """
+    mode = getattr(settings, 'DOWNLOAD_OFFLOAD', '')
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'DOWNLOAD_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+        return response
+    if mode == 'x-sendfile':
+        try:
+            path = storage.path(name)
+        except NotImplementedError:
+            return None
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+    return None
+
+
+def _file_response(request, storage, name: str, content_type: str, etag: str, last_modified: float):
+    size = storage.size(name)
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE', ''), size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range and not if_range_passes(request, etag, last_modified):
+        byte_range = None
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    elif byte_range:
+        response = FileResponse(RangeFile(storage.open(name, 'rb'), start, length), content_type=content_type)
+    else:
+        response = FileResponse(storage.open(name, 'rb'), content_type=content_type)
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = length
+    return response
+
+
+def serve_media(request, instance, as_attachment: bool = False):
+    """
+    The response to a GET or HEAD of `instance`'s file.
+    """
+    storage, name = instance.file.storage, instance.file.name
+    etag, last_modified = file_validators(storage, name, instance.content_hash)
+    content_type = (
+        mimetypes.guess_type(instance.original_filename)[0] or instance.content_type or 'application/octet-stream'
+    )
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _offload_response(storage, name, content_type)
+    if response is None:
+        response = _file_response(request, storage, name, content_type, etag, last_modified)
+        if response.status_code == 416:
+            return response
+    if response.status_code in (200, 206):
+        response['Content-Disposition'] = content_disposition_header(
+            as_attachment, instance.original_filename
+        )
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    # Clients keep their copy but revalidate it, since access can change.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
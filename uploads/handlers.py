@@ -0,0 +1,186 @@
+# /app/uploads/handlers.py
+
+import codecs
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+# Leading bytes of the file formats we care about, checked in order.
+FILE_SIGNATURES = [
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (4, b'ftyp', 'video/mp4'),
+    (0, b'\x1aE\xdf\xa3', 'video/webm'),
+    (0, b'ID3', 'audio/mpeg'),
+]
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# What the content of files with these extensions must sniff as. Other
+# extensions are not checked.
+EXPECTED_CONTENT_TYPES = {
+    '.pdf': 'application/pdf',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.docx': DOCX_CONTENT_TYPE,
+    '.mp4': 'video/mp4',
+    '.webm': 'video/webm',
+}
+# Text files may be in any encoding, but must not be one of the binary formats above.
+TEXT_EXTENSIONS = {'.txt', '.md', '.csv'}
+
+# Allowance for the multipart boundaries and form fields around the file.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def sniff_content_type(head: bytes, filename: str = '') -> str:
+    """
+    Guesses the content type from the first bytes of a file. DOCX files are
+    ZIP archives, so the extension is used to tell them apart.
+    """
+    for offset, signature, content_type in FILE_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if content_type == 'application/zip' and filename.lower().endswith('.docx'):
+                return DOCX_CONTENT_TYPE
+            return content_type
+    try:
+        # Incremental, so a character cut off at the end of `head` is not an error.
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+        return 'text/plain'
+    except UnicodeDecodeError:
+        return 'application/octet-stream'
+
+
+def content_type_error(filename: str, content_type: str) -> str:
+    """
+    Why a file's sniffed `content_type` does not fit its extension, or ''
+    if it does (or the extension is not checked).
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    expected = EXPECTED_CONTENT_TYPES.get(extension)
+    if expected is not None and content_type != expected:
+        return f"The file content is not {expected}, as its {extension} extension says."
+    if extension in TEXT_EXTENSIONS and content_type in EXPECTED_CONTENT_TYPES.values():
+        return f"The file content is {content_type}, not text as its {extension} extension says."
+    return ''
+
+
+def get_staging_dir() -> str:
+    """
+    Uploads are spooled next to MEDIA_ROOT so that saving them into the
+    file system storage is a rename rather than a copy.
+    """
+    staging_dir = getattr(settings, 'UPLOAD_STAGING_DIR', None) or os.path.join(
+        os.path.abspath(settings.MEDIA_ROOT), '.upload-staging'
+    )
+    os.makedirs(staging_dir, exist_ok=True)
+    return staging_dir
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """
+    A TemporaryUploadedFile spooled into the staging directory, carrying the
+    content hash and sniffed type computed while it was received.
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None, staging_dir=None):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext, dir=staging_dir or get_staging_dir())
+        super(TemporaryUploadedFile, self).__init__(file, name, content_type, size, charset, content_type_extra)
+        self.content_hash = ''
+        self.sniffed_content_type = ''
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Streams uploaded files to the staging directory while hashing them and
+    enforcing `max_bytes`.
+
+    A body that is too large is rejected before it is read (from its
+    Content-Length) or as soon as the limit is crossed. The request is then
+    marked with `upload_rejected = True` and no file is returned.
+    """
+
+    def __init__(self, request=None, max_bytes=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes or settings.MAX_UPLOAD_SIZE
+        self.received = 0
+
+    def _reject(self):
+        if self.request is not None:
+            self.request.upload_rejected = True
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > self.max_bytes + MULTIPART_OVERHEAD:
+            self._reject()
+            # Short-circuit parsing: nothing of the body is read.
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.head = b''
+        self.file = StagedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self._reject()
+            raise StopUpload(connection_reset=True)
+        if len(self.head) < 64:
+            self.head += raw_data[:64 - len(self.head)]
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.content_hash = self.sha256.hexdigest()
+        self.file.sniffed_content_type = sniff_content_type(self.head, self.file_name or '')
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            temp_location = self.file.temporary_file_path()
+            try:
+                self.file.close()
+                os.remove(temp_location)
+            except FileNotFoundError:
+                pass
+
+
+class StreamingUploadMixin:
+    """
+    Installs StreamingUploadHandler on a DRF view before the body is parsed.
+    """
+    max_upload_size = None
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [StreamingUploadHandler(request, self.max_upload_size)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def upload_was_rejected(self, request) -> bool:
+        # Reading FILES makes sure the body has been parsed.
+        request.FILES
+        return getattr(request._request, 'upload_rejected', False)
+
+    @staticmethod
+    def upload_type_error(file_obj) -> str:
+        """Checks the type sniffed by the upload handler against the file name."""
+        sniffed = getattr(file_obj, 'sniffed_content_type', '')
+        return content_type_error(file_obj.name, sniffed) if sniffed else ''
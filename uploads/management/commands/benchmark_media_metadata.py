@@ -0,0 +1,137 @@
+import os
+import resource
+import statistics
+import struct
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from uploads.metadata import probe
+
+
+def _box(kind: bytes, body: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(body), kind) + body
+
+
+def _full_box(kind: bytes, body: bytes, version: int = 0) -> bytes:
+    return _box(kind, struct.pack('>I', version << 24) + body)
+
+
+def _mp4_track(handler: bytes, codec: bytes, width: int = 0, height: int = 0) -> bytes:
+    tkhd = _full_box(b'tkhd', bytes(72) + struct.pack('>II', width << 16, height << 16))
+    hdlr = _full_box(b'hdlr', bytes(4) + handler + bytes(12) + b'\x00')
+    entry = bytes(6) + struct.pack('>H', 1) + bytes(16)
+    if handler == b'vide':
+        entry += struct.pack('>HH', width, height) + bytes(50)
+    else:
+        entry += bytes(20)
+    stsd = _full_box(b'stsd', struct.pack('>I', 1) + _box(codec, entry))
+    stbl = _box(b'stbl', stsd)
+    return _box(b'trak', tkhd + _box(b'mdia', hdlr + _box(b'minf', stbl)))
+
+
+def write_mp4(path: str, payload: int):
+    """
+    ftyp, a sparse mdat of `payload` bytes, then moov at the end (as
+    written by most recorders, and the worst case for a header parser).
+    """
+    with open(path, 'wb') as f:
+        f.write(_box(b'ftyp', b'isom' + struct.pack('>I', 512) + b'isomiso2avc1mp41'))
+        f.write(struct.pack('>I4sQ', 1, b'mdat', 16 + payload))
+        f.seek(payload, os.SEEK_CUR)
+        mvhd = _full_box(b'mvhd', bytes(8) + struct.pack('>II', 1000, 93500) + bytes(80))
+        f.write(_box(b'moov', mvhd + _mp4_track(b'vide', b'avc1', 1920, 1080) + _mp4_track(b'soun', b'mp4a')))
+
+
+def write_png(path: str, payload: int):
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(struct.pack('>I4sIIBBBBBI', 13, b'IHDR', 4000, 3000, 8, 6, 0, 0, 0, 0))
+        f.write(struct.pack('>I4s', min(payload, 2 ** 31 - 1), b'IDAT'))
+        f.seek(payload, os.SEEK_CUR)
+        f.write(struct.pack('>I4sI', 0, b'IEND', 0))
+
+
+def write_jpeg(path: str, payload: int):
+    with open(path, 'wb') as f:
+        f.write(b'\xff\xd8')
+        f.write(b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00')
+        f.write(b'\xff\xc0' + struct.pack('>HBHHB', 17, 8, 3000, 4000, 3) + bytes(9))
+        f.write(b'\xff\xda' + struct.pack('>HB', 12, 3) + bytes(9))
+        f.seek(payload, os.SEEK_CUR)
+        f.write(b'\xff\xd9')
+
+
+def write_pdf(path: str, payload: int):
+    """
+    Three pages sharing one content stream of `payload` bytes.
+    """
+    offsets = {}
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n')
+        offsets[3] = f.tell()
+        f.write(b'3 0 obj\n<< /Length %d >>\nstream\n' % payload)
+        f.seek(payload, os.SEEK_CUR)
+        f.write(b'\nendstream\nendobj\n')
+        objects = {
+            1: b'<< /Type /Catalog /Pages 2 0 R >>',
+            2: b'<< /Type /Pages /Kids [4 0 R 5 0 R 6 0 R] /Count 3 >>',
+            4: b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 3 0 R >>',
+            5: b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 3 0 R >>',
+            6: b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 3 0 R >>',
+        }
+        for number, body in objects.items():
+            offsets[number] = f.tell()
+            f.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+        xref = f.tell()
+        f.write(b'xref\n0 7\n0000000000 65535 f \n')
+        for number in range(1, 7):
+            f.write(b'%010d 00000 n \n' % offsets[number])
+        f.write(b'trailer\n<< /Size 7 /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % xref)
+
+
+WRITERS = {'mp4': write_mp4, 'png': write_png, 'jpeg': write_jpeg, 'pdf': write_pdf}
+
+
+class Command(BaseCommand):
+    help = (
+        "Times header metadata extraction on synthetic files of growing size. The files are "
+        "sparse, so large sizes cost no disk space. Time and page faults per file should stay "
+        "flat as the size grows, since only the headers are read."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,64,1024,8192', help="Comma-separated payload sizes in MB.")
+        parser.add_argument('--formats', default=','.join(WRITERS), help="Comma-separated formats.")
+        parser.add_argument('--repeat', type=int, default=200, help="Probes per file.")
+        parser.add_argument('--dir', default=None, help="Where to write the files (default: a temporary directory).")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        formats = [name.strip() for name in options['formats'].split(',')]
+        repeat = max(1, options['repeat'])
+
+        with tempfile.TemporaryDirectory(dir=options['dir']) as root:
+            self.stdout.write(f"{'format':<6} {'size':>9} {'median':>10} {'p95':>10} {'faults':>7}  result")
+            for name in formats:
+                for size in sizes:
+                    path = os.path.join(root, f"{name}-{size}mb.{name}")
+                    WRITERS[name](path, size * 1024 * 1024)
+                    result = probe(path)
+
+                    timings = []
+                    faults = resource.getrusage(resource.RUSAGE_SELF)
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        probe(path)
+                        timings.append((time.perf_counter() - started) * 1000000)
+                    after = resource.getrusage(resource.RUSAGE_SELF)
+                    faults = (after.ru_minflt + after.ru_majflt - faults.ru_minflt - faults.ru_majflt) / repeat
+                    os.remove(path)
+
+                    median = statistics.median(timings)
+                    p95 = statistics.quantiles(timings, n=20)[-1] if repeat > 1 else median
+                    self.stdout.write(
+                        f"{name:<6} {size:>6} MB {median:>7.0f} us {p95:>7.0f} us {faults:>7.1f}  {result}"
+                    )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from uploads.metadata import extract_pending
+from uploads.models import MediaMetadata
+
+
+class Command(BaseCommand):
+    help = (
+        "Extracts header metadata of media that have none yet or are still pending, "
+        "e.g. uploads from before the metadata stage or ones the background pool skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help="Also retry files that failed before.")
+        parser.add_argument('--all', action='store_true', help="Re-extract every file.")
+        parser.add_argument('--limit', type=int, default=None)
+
+    def handle(self, *args, **options):
+        statuses = [MediaMetadata.MetadataStatus.PENDING]
+        if options['retry_failed']:
+            statuses.append(MediaMetadata.MetadataStatus.FAILED)
+        if options['all']:
+            statuses = MediaMetadata.MetadataStatus.values
+        counts = extract_pending(limit=options['limit'], statuses=statuses)
+        summary = ", ".join(f"{count} {status.lower()}" for status, count in sorted(counts.items())) or "nothing to do"
+        self.stdout.write(f"Metadata extraction: {summary}.")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from uploads.storage import media_storage
+
+
+class Command(BaseCommand):
+    help = "Reports blob and reference counts of the content-addressed media storage, and the bytes deduplication saves."
+
+    def handle(self, *args, **options):
+        storage = media_storage()
+        if not hasattr(storage, 'usage'):
+            raise CommandError(f"{type(storage).__name__} does not deduplicate media files.")
+        usage = storage.usage()
+        self.stdout.write(
+            f"{usage['blobs']} blob(s) referenced by {usage['references']} file(s): "
+            f"{usage['stored_bytes']} bytes stored for {usage['referenced_bytes']} bytes referenced, "
+            f"{usage['saved_bytes']} bytes saved."
+        )
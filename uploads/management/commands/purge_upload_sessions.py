@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from uploads.resumable import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = "Deletes expired resumable upload sessions and their staging files."
+
+    def handle(self, *args, **options):
+        purged = purge_expired_sessions()
+        self.stdout.write(f"Purged {purged} expired upload session(s).")
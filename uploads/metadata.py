@@ -0,0 +1,316 @@
+"""
+Header-only metadata extraction for uploaded media.
+
+The stored file is memory-mapped and only its container headers are parsed,
+so the cost does not grow with the payload: the pages of an MP4's `mdat` or
+a PNG's image data are never touched. Supported formats:
+
+    MP4/MOV  duration (mvhd), dimensions (tkhd), video and audio codecs (stsd)
+    PNG      dimensions (IHDR)
+    GIF      dimensions (logical screen descriptor)
+    JPEG     dimensions (SOFn marker, scanning markers up to the first scan)
+    PDF      page count (the catalogue's /Pages /Count, found through the
+             cross-reference table at the end of the file)
+
+Extraction runs after the upload commits, on a small thread pool. When the
+pool is busy the row stays PENDING for `manage.py extract_media_metadata`.
+"""
+import mmap
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import MediaMetadata, media
+
+MetadataStatus = MediaMetadata.MetadataStatus
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+class MetadataError(Exception):
+    pass
+
+
+_PARSERS = []
+
+
+def register_parser(sniff):
+    """
+    Registers `parser(buf) -> dict` for files whose first bytes satisfy
+    `sniff(head)`.
+    """
+    def decorator(func):
+        _PARSERS.append((sniff, func))
+        return func
+    return decorator
+
+
+# --- MP4 / QuickTime ---
+
+def _boxes(buf, start: int, end: int):
+    """
+    Yields (type, body_start, body_end) of the boxes between start and end.
+    """
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', buf, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', buf, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def _find_box(buf, start: int, end: int, *path):
+    for kind, body_start, body_end in _boxes(buf, start, end):
+        if kind == path[0]:
+            if len(path) == 1:
+                return body_start, body_end
+            return _find_box(buf, body_start, body_end, *path[1:])
+    return None
+
+
+def _fourcc(raw: bytes) -> str:
+    return raw.decode('latin-1').strip().strip('\x00')
+
+
+def _parse_track(buf, start: int, end: int) -> dict:
+    track = {}
+    tkhd = _find_box(buf, start, end, b'tkhd')
+    if tkhd:
+        # Width and height are 16.16 fixed point at the end of the box.
+        offset = tkhd[0] + (88 if buf[tkhd[0]] == 1 else 76)
+        if offset + 8 <= tkhd[1]:
+            width, height = struct.unpack_from('>II', buf, offset)
+            track['width'], track['height'] = width >> 16, height >> 16
+    hdlr = _find_box(buf, start, end, b'mdia', b'hdlr')
+    if hdlr and hdlr[0] + 12 <= hdlr[1]:
+        track['handler'] = bytes(buf[hdlr[0] + 8:hdlr[0] + 12])
+    stsd = _find_box(buf, start, end, b'mdia', b'minf', b'stbl', b'stsd')
+    if stsd and stsd[0] + 16 <= stsd[1]:
+        # The first sample entry follows the version, flags and entry count.
+        entry = stsd[0] + 8
+        track['codec'] = _fourcc(bytes(buf[entry + 4:entry + 8]))
+        if track.get('handler') == b'vide' and entry + 36 <= stsd[1] and not track.get('width'):
+            track['width'], track['height'] = struct.unpack_from('>HH', buf, entry + 32)
+    return track
+
+
+def _is_mp4(head: bytes) -> bool:
+    return head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip')
+
+
+@register_parser(_is_mp4)
+def parse_mp4(buf) -> dict:
+    ftyp = _find_box(buf, 0, len(buf), b'ftyp')
+    brand = bytes(buf[ftyp[0]:ftyp[0] + 4]) if ftyp else b''
+    result = {'format': 'mov' if brand == b'qt  ' else 'mp4'}
+
+    # The moov box may follow mdat; the box sizes let us jump over it.
+    moov = _find_box(buf, 0, len(buf), b'moov')
+    if moov is None:
+        raise MetadataError("No moov box: the file is truncated or not a finished recording.")
+
+    for kind, start, end in _boxes(buf, *moov):
+        if kind == b'mvhd':
+            if buf[start] == 1:
+                timescale, duration = struct.unpack_from('>IQ', buf, start + 20)
+            else:
+                timescale, duration = struct.unpack_from('>II', buf, start + 12)
+            if timescale:
+                result['duration_seconds'] = duration / timescale
+        elif kind == b'trak':
+            track = _parse_track(buf, start, end)
+            if track.get('handler') == b'vide' and 'codec' not in result:
+                result['codec'] = track.get('codec', '')
+                if track.get('width'):
+                    result['width'], result['height'] = track['width'], track['height']
+            elif track.get('handler') == b'soun' and 'audio_codec' not in result:
+                result['audio_codec'] = track.get('codec', '')
+    return result
+
+
+# --- Images ---
+
+@register_parser(lambda head: head.startswith(b'\x89PNG\r\n\x1a\n'))
+def parse_png(buf) -> dict:
+    if bytes(buf[12:16]) != b'IHDR':
+        raise MetadataError("PNG without an IHDR chunk.")
+    width, height = struct.unpack_from('>II', buf, 16)
+    return {'format': 'png', 'codec': 'png', 'width': width, 'height': height}
+
+
+@register_parser(lambda head: head[:6] in (b'GIF87a', b'GIF89a'))
+def parse_gif(buf) -> dict:
+    width, height = struct.unpack_from('<HH', buf, 6)
+    return {'format': 'gif', 'codec': 'gif', 'width': width, 'height': height}
+
+
+# Start-of-frame markers; C4, C8 and CC share the range but are not frames.
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+@register_parser(lambda head: head.startswith(b'\xff\xd8'))
+def parse_jpeg(buf) -> dict:
+    offset, size = 2, len(buf)
+    while offset + 4 <= size:
+        if buf[offset] != 0xFF:
+            raise MetadataError(f"Invalid JPEG marker at byte {offset}.")
+        marker = buf[offset + 1]
+        if marker == 0xFF:
+            # Fill byte.
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length.
+            offset += 2
+            continue
+        length = struct.unpack_from('>H', buf, offset + 2)[0]
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack_from('>HH', buf, offset + 5)
+            return {
+                'format': 'jpeg',
+                'codec': 'jpeg-progressive' if marker == 0xC2 else 'jpeg',
+                'width': width,
+                'height': height,
+            }
+        if marker in (0xD9, 0xDA):
+            # End of image or start of the compressed scan data.
+            break
+        offset += 2 + length
+    raise MetadataError("No JPEG frame header before the image data.")
+
+
+# --- PDF ---
+
+@register_parser(lambda head: head.startswith(b'%PDF-'))
+def parse_pdf(buf) -> dict:
+    """
+    Reads the page count from the document catalogue. pypdf seeks to the
+    cross-reference table at the end of the file and loads only the
+    objects on the way to /Pages, not the page contents.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(buf)
+    return {'format': 'pdf', 'page_count': int(reader.trailer['/Root']['/Pages']['/Count'])}
+
+
+def probe(path: str) -> dict:
+    """
+    The metadata of the file at `path`. Raises UnsupportedFormat for files
+    no parser recognises and MetadataError for damaged ones.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise UnsupportedFormat("Empty file.")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            head = bytes(buf[:16])
+            for sniff, parser in _PARSERS:
+                if sniff(head):
+                    try:
+                        return parser(buf)
+                    except (struct.error, IndexError, ValueError) as e:
+                        raise MetadataError(f"Malformed {parser.__name__[6:].upper()} headers: {e}") from e
+    raise UnsupportedFormat("Unrecognised file format.")
+
+
+def extract_metadata(media_instance) -> MediaMetadata:
+    """
+    Probes the file of `media_instance` and stores the outcome.
+    """
+    fields = {
+        'status': MetadataStatus.COMPLETED, 'format': '', 'duration_seconds': None,
+        'width': None, 'height': None, 'codec': '', 'audio_codec': '', 'page_count': None, 'error': '',
+    }
+    try:
+        fields.update(probe(media_instance.file.path))
+    except NotImplementedError:
+        fields.update(status=MetadataStatus.UNSUPPORTED, error="The storage has no local file to map.")
+    except UnsupportedFormat as e:
+        fields.update(status=MetadataStatus.UNSUPPORTED, error=str(e))
+    except Exception as e:
+        fields.update(status=MetadataStatus.FAILED, error=f"{type(e).__name__}: {e}")
+    fields['extracted_at'] = timezone.now()
+
+    metadata, _ = MediaMetadata.objects.update_or_create(media=media_instance, defaults=fields)
+    return metadata
+
+
+def extract_pending(limit: int = None, statuses=(MetadataStatus.PENDING,)) -> dict:
+    """
+    Extracts the metadata of media without any, or whose metadata is in
+    one of `statuses`. Returns the number of files per resulting status.
+    """
+    queryset = media.objects.filter(
+        Q(metadata__isnull=True) | Q(metadata__status__in=statuses)
+    ).order_by('uploaded_at')
+    if limit:
+        queryset = queryset[:limit]
+    counts = {}
+    for media_instance in queryset.iterator(chunk_size=500):
+        status = extract_metadata(media_instance).status
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def _get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'MEDIA_METADATA_WORKERS', 2)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-metadata')
+            _slots = threading.BoundedSemaphore(getattr(settings, 'MEDIA_METADATA_MAX_PENDING', 100))
+    return _executor
+
+
+def _run(media_id):
+    close_old_connections()
+    try:
+        media_instance = media.objects.filter(pk=media_id).first()
+        if media_instance is not None:
+            extract_metadata(media_instance)
+    except Exception as e:
+        print(f"Metadata extraction failed for media {media_id}: {e}")
+    finally:
+        _slots.release()
+        close_old_connections()
+
+
+def _submit(media_id):
+    executor = _get_executor()
+    # A full backlog leaves the row PENDING for the management command
+    # rather than queueing without bound.
+    if _slots.acquire(blocking=False):
+        executor.submit(_run, media_id)
+
+
+def schedule_extraction(media_instance):
+    """
+    Records pending metadata for a new upload and extracts it in the
+    background once the upload commits.
+    """
+    MediaMetadata.objects.get_or_create(media=media_instance)
+    if getattr(settings, 'MEDIA_METADATA_WORKERS', 2) > 0:
+        media_id = media_instance.pk
+        transaction.on_commit(lambda: _submit(media_id))
@@ -3,6 +3,7 @@
 from django.db import models
 import uuid
 from django.conf import settings
+from .storage import media_storage
 
 class media(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -15,15 +16,88 @@ class media(models.Model):
 
     original_filename = models.CharField(max_length=255, default='original_filename.mp4')
     
-    file = models.FileField(upload_to='uploads/')
+    # Content-addressed by default: identical uploads share one blob.
+    file = models.FileField(upload_to='uploads/', storage=media_storage)
+    # Computed while the upload streams in; the strong ETag of downloads.
+    content_hash = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of the file content")
+    # Sniffed from the first bytes of the upload, not taken from the client.
+    content_type = models.CharField(max_length=100, blank=True, default='')
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'media'
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['user', '-uploaded_at'], name='media_user_recent_idx'),
+        ]
 
     def __str__(self):
         if self.user:
             return f"{self.user.username} - {self.original_filename}"
         return f"Anonymous - {self.original_filename}"
 
+
+class UploadSession(models.Model):
+    """
+    A resumable upload in progress. Chunks are appended to a staging file
+    until `received` reaches `total_size` and the session is finalized into
+    a media row.
+    """
+    class SessionStatus(models.TextChoices):
+        ACTIVE = 'ACTIVE', 'Active'
+        COMPLETED = 'COMPLETED', 'Completed'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    original_filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField(help_text="Size in bytes")
+    received = models.BigIntegerField(default=0, help_text="Bytes staged so far")
+    content_hash = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of the file, once complete")
+    status = models.CharField(max_length=20, choices=SessionStatus.choices, default=SessionStatus.ACTIVE)
+    media = models.ForeignKey(media, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'upload_sessions'
+        indexes = [
+            models.Index(fields=['expires_at'], name='upload_session_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"Upload session {self.id} ({self.received}/{self.total_size} bytes)"
+
+
+class MediaMetadata(models.Model):
+    """
+    Facts about a media file read from its container headers only:
+    duration, dimensions and codecs of video, dimensions of images, page
+    count of PDFs. Filled in by uploads.metadata after the upload commits.
+    """
+    class MetadataStatus(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        COMPLETED = 'COMPLETED', 'Completed'
+        UNSUPPORTED = 'UNSUPPORTED', 'Unsupported format'
+        FAILED = 'FAILED', 'Failed'
+
+    media = models.OneToOneField(media, on_delete=models.CASCADE, primary_key=True, related_name='metadata')
+    status = models.CharField(max_length=20, choices=MetadataStatus.choices, default=MetadataStatus.PENDING)
+    format = models.CharField(max_length=20, blank=True)
+    duration_seconds = models.FloatField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    codec = models.CharField(max_length=20, blank=True, help_text="Video or image codec")
+    audio_codec = models.CharField(max_length=20, blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'media_metadata'
+        indexes = [
+            models.Index(fields=['status'], name='media_metadata_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Metadata of {self.media_id} ({self.status})"
@@ -0,0 +1,232 @@
+# /app/uploads/resumable.py
+
+import fcntl
+import hashlib
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .handlers import get_staging_dir, sniff_content_type
+from .models import UploadSession, media
+
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class OffsetMismatch(Exception):
+    """The client sent a chunk for an offset other than the current one."""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected offset {offset}.")
+        self.offset = offset
+
+
+class SessionBusy(Exception):
+    """Another request is currently writing to the same session."""
+
+
+class SessionClosed(Exception):
+    """The session was finalized, discarded or expired by another request."""
+
+
+class StagedFile(File):
+    """
+    A finished staging file. It exposes `temporary_file_path` so file system
+    storage moves it into place instead of copying it.
+    """
+
+    def __init__(self, path, name, content_hash=''):
+        super().__init__(open(path, 'rb'), name=name)
+        self.size = os.path.getsize(path)
+        self.content_hash = content_hash
+        self._path = path
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def staging_path(session: UploadSession) -> str:
+    directory = os.path.join(get_staging_dir(), 'sessions')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{session.id}.part")
+
+
+def current_offset(session: UploadSession) -> int:
+    """
+    The staging file is the source of truth: a chunk cut off by a dropped
+    connection still counts for the bytes that made it to disk.
+    """
+    try:
+        return os.path.getsize(staging_path(session))
+    except FileNotFoundError:
+        return 0
+
+
+# The running SHA-256 of sessions whose chunks this process received, as
+# (bytes hashed, hash object): the last chunk then yields the file's digest
+# without reading the file again. Hash objects cannot be stored, so a chunk
+# arriving at another process rebuilds the hash from the staged bytes once.
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
+def _running_hash(session: UploadSession, path: str, received: int):
+    with _hashes_lock:
+        entry = _hashes.pop(session.id, None)
+    if entry is not None and entry[0] == received:
+        return entry[1]
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BLOCK_SIZE), b''):
+            sha256.update(block)
+    return sha256
+
+
+def _forget_hash(session: UploadSession):
+    with _hashes_lock:
+        _hashes.pop(session.id, None)
+
+
+def create_session(user, original_filename: str, total_size: int) -> UploadSession:
+    session = UploadSession.objects.create(
+        user=user,
+        original_filename=original_filename,
+        total_size=total_size,
+        expires_at=timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS),
+    )
+    open(staging_path(session), 'wb').close()
+    return session
+
+
+def append_chunk(session: UploadSession, offset: int, stream) -> int:
+    """
+    Appends the request body in `stream` to the staging file if `offset`
+    matches what has been received so far. Returns the new offset.
+    """
+    path = staging_path(session)
+    with open(path, 'ab') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise SessionBusy()
+        try:
+            received = os.fstat(f.fileno()).st_size
+            if offset != received:
+                raise OffsetMismatch(received)
+
+            sha256 = _running_hash(session, path, received)
+            hashed = received
+            remaining = session.total_size - received
+            try:
+                while remaining > 0 and stream is not None:
+                    block = stream.read(min(COPY_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    f.write(block)
+                    sha256.update(block)
+                    hashed += len(block)
+                    remaining -= len(block)
+                f.flush()
+            finally:
+                # Kept even if the client went away mid-chunk: the bytes
+                # written so far stay in the staging file.
+                with _hashes_lock:
+                    _hashes[session.id] = (hashed, sha256)
+            received = os.fstat(f.fileno()).st_size
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    changes = {}
+    if received == session.total_size and hashed == received:
+        changes['content_hash'] = session.content_hash = sha256.hexdigest()
+        _forget_hash(session)
+    UploadSession.objects.filter(pk=session.pk).update(
+        received=received,
+        updated_at=timezone.now(),
+        expires_at=timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS),
+        **changes,
+    )
+    session.received = received
+    return received
+
+
+def sniff_session(session: UploadSession) -> str:
+    """The content type of the staged file, sniffed from its first bytes."""
+    try:
+        with open(staging_path(session), 'rb') as f:
+            return sniff_content_type(f.read(64), session.original_filename)
+    except FileNotFoundError:
+        raise SessionClosed()
+
+
+def finalize_session(session: UploadSession, storage_name: str, content_type: str = '') -> media:
+    """
+    Turns a complete session into a media row. The staging file is moved
+    or linked into storage, not read again: its digest was computed as the
+    chunks arrived.
+
+    The session is claimed with a conditional update first, so of two
+    concurrent finalize requests only one creates a row; the other gets
+    SessionClosed. The claim is rolled back if the row cannot be created.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = UploadSession.objects.filter(
+            pk=session.pk,
+            status=UploadSession.SessionStatus.ACTIVE,
+            expires_at__gt=now,
+        ).update(status=UploadSession.SessionStatus.COMPLETED, updated_at=now)
+        if not claimed:
+            raise SessionClosed()
+
+        try:
+            staged = StagedFile(staging_path(session), storage_name, session.content_hash)
+        except FileNotFoundError:
+            # Discarded while we were claiming it.
+            raise SessionClosed()
+        try:
+            media_instance = media.objects.create(
+                user=session.user,
+                file=staged,
+                original_filename=session.original_filename,
+                content_hash=session.content_hash,
+                content_type=content_type,
+            )
+        finally:
+            staged.close()
+        UploadSession.objects.filter(pk=session.pk).update(media=media_instance)
+
+    # A storage that links rather than moves leaves the staging file behind.
+    try:
+        os.remove(staged.temporary_file_path())
+    except FileNotFoundError:
+        pass
+    return media_instance
+
+
+def discard_session(session: UploadSession):
+    _forget_hash(session)
+    try:
+        os.remove(staging_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def purge_expired_sessions(now=None) -> int:
+    """
+    Deletes abandoned sessions and their staging files, plus completed
+    sessions past their expiry. Returns the number of sessions removed.
+    """
+    now = now or timezone.now()
+    expired = UploadSession.objects.filter(expires_at__lt=now)
+    purged = 0
+    for session in expired.filter(status=UploadSession.SessionStatus.ACTIVE).iterator():
+        discard_session(session)
+        purged += 1
+    purged += expired.delete()[0]
+    return purged
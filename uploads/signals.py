@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .metadata import schedule_extraction
+from .models import media
+
+
+@receiver(post_delete, sender=media)
+def media_deleted(sender, instance, **kwargs):
+    """
+    Drops the file's reference once the row is gone for good; with
+    content-addressed storage the blob goes with its last reference.
+    """
+    if instance.file:
+        storage, name = instance.file.storage, instance.file.name
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(post_save, sender=media)
+def media_saved(sender, instance, created, **kwargs):
+    if created:
+        schedule_extraction(instance)
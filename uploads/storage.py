@@ -0,0 +1,167 @@
+"""
+Content-addressed file system storage for media uploads.
+
+Every distinct file content is stored once, as a blob named by its SHA-256
+and sharded two levels deep:
+
+    blobs/ab/cd/abcd1234...
+
+The name an upload is saved under (e.g. uploads/alice/clip-1700000000.mp4)
+is a hard link to its blob. The blob's link count is therefore its
+reference count, kept by the file system itself: deleting a name removes
+one link, and the blob goes with the last reference. Because every name is
+a real file, serving, `open()` and `size()` work exactly as with
+FileSystemStorage.
+"""
+import errno
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, InvalidStorageError, storages
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+# Stored on the blob inode (and so visible through every link) where the
+# file system supports user extended attributes.
+DIGEST_XATTR = 'user.sha256'
+
+
+def media_storage():
+    """
+    The storage of media files: the STORAGES['media'] backend if one is
+    configured, otherwise the default storage.
+    """
+    try:
+        return storages['media']
+    except InvalidStorageError:
+        return storages['default']
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def blob_name(self, digest: str) -> str:
+        return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}"
+
+    @staticmethod
+    def _hash_file(file) -> str:
+        sha256 = hashlib.sha256()
+        for chunk in file.chunks() if hasattr(file, 'chunks') else iter(lambda: file.read(1024 * 1024), b''):
+            sha256.update(chunk)
+        file.seek(0)
+        return sha256.hexdigest()
+
+    def _digest_of(self, path: str) -> str:
+        try:
+            return os.getxattr(path, DIGEST_XATTR).decode('ascii')
+        except (OSError, AttributeError):
+            with open(path, 'rb') as f:
+                return self._hash_file(f)
+
+    def digest(self, name: str) -> str:
+        """
+        The SHA-256 of a stored file, read from its blob where possible.
+        """
+        return self._digest_of(self.path(name))
+
+    def _write_blob(self, blob_path: str, content):
+        """
+        Creates the blob atomically. An upload already spooled to disk on
+        the same file system is linked rather than copied.
+        """
+        directory = os.path.dirname(blob_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.incoming-')
+        os.close(fd)
+        try:
+            linked = False
+            if hasattr(content, 'temporary_file_path'):
+                os.unlink(tmp_path)
+                try:
+                    os.link(content.temporary_file_path(), tmp_path)
+                    linked = True
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                        raise
+            if not linked:
+                with open(tmp_path, 'wb') as f:
+                    content.seek(0)
+                    for chunk in content.chunks():
+                        f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            try:
+                os.setxattr(tmp_path, DIGEST_XATTR, os.path.basename(blob_path).encode('ascii'))
+            except (OSError, AttributeError):
+                pass
+            try:
+                os.link(tmp_path, blob_path)
+            except FileExistsError:
+                # Another upload of the same content won the race.
+                pass
+        finally:
+            if os.path.lexists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _save(self, name, content):
+        digest = getattr(content, 'content_hash', '') or self._hash_file(content)
+        blob_path = self.path(self.blob_name(digest))
+        if not os.path.exists(blob_path):
+            self._write_blob(blob_path, content)
+
+        while True:
+            full_path = self.path(name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            try:
+                os.link(blob_path, full_path)
+                break
+            except FileExistsError:
+                name = self.get_available_name(name)
+            except FileNotFoundError:
+                # The blob lost its last reference in the meantime.
+                self._write_blob(blob_path, content)
+        return str(name).replace('\\', '/')
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        path = self.path(name)
+        try:
+            digest = self._digest_of(path)
+        except FileNotFoundError:
+            return
+        super().delete(name)
+
+        blob_path = self.path(self.blob_name(digest))
+        try:
+            # Only the blob's own link is left: no references remain. A
+            # reference created right after this check still holds the data.
+            if os.stat(blob_path).st_nlink == 1:
+                os.remove(blob_path)
+        except FileNotFoundError:
+            pass
+
+    def usage(self) -> dict:
+        """
+        Counts blobs and references, and the bytes stored versus the bytes
+        the references would take as separate files.
+        """
+        blobs = references = stored = logical = 0
+        root = self.path(BLOB_DIR)
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                if filename.startswith('.incoming-'):
+                    continue
+                stat = os.stat(os.path.join(directory, filename))
+                blobs += 1
+                references += stat.st_nlink - 1
+                stored += stat.st_size
+                logical += stat.st_size * (stat.st_nlink - 1)
+        return {
+            'blobs': blobs,
+            'references': references,
+            'stored_bytes': stored,
+            'referenced_bytes': logical,
+            'saved_bytes': max(0, logical - stored),
+        }
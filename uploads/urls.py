@@ -1,7 +1,11 @@
 # uploads/urls.py
 from django.urls import path
-from .views import FileUploadView
+from .views import FileUploadView, UploadSessionCreateView, UploadSessionView, UploadSessionFinalizeView, MediaDownloadView
 
 urlpatterns = [
     path('', FileUploadView.as_view(), name='file-upload-api'),
+    path('sessions/', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('sessions/<uuid:session_id>/', UploadSessionView.as_view(), name='upload-session'),
+    path('sessions/<uuid:session_id>/finalize/', UploadSessionFinalizeView.as_view(), name='upload-session-finalize'),
+    path('<uuid:media_id>/download/', MediaDownloadView.as_view(), name='media-download'),
 ]
\ No newline at end of file
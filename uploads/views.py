@@ -2,51 +2,195 @@ from rest_framework import status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
-from .models import media
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from .handlers import StreamingUploadMixin, content_type_error
+from .models import media, UploadSession
+from . import resumable
+from .downloads import serve_media
 import os
+import re
 import time
 
-class FileUploadView(APIView):
+
+def build_storage_name(username, original_filename):
+    filename_base, file_extension = os.path.splitext(original_filename)
+    # Get the current Unix timestamp
+    timestamp = int(time.time())
+    return f"{username}/{filename_base}-{timestamp}{file_extension}"
+
+
+class FileUploadView(StreamingUploadMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
     def post(self, request, *args, **kwargs):
-        file_obj = request.FILES.get('file')
-        if not file_obj:
-            return Response({"error": "No file provided."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        MAX_FILE_SIZE = 25 * 1024 * 1024  # 25 MB in bytes
-        if file_obj.size > MAX_FILE_SIZE:
+        # The upload handler stops reading the body once it crosses MAX_UPLOAD_SIZE.
+        if self.upload_was_rejected(request):
             return Response(
-                {"error": f"File size cannot exceed {MAX_FILE_SIZE / 1024 / 1024}MB."},
+                {"error": f"File size cannot exceed {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB."},
                 status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
             )
-        
-        username = request.user.username
+
+        file_obj = request.FILES.get('file')
+        if not file_obj:
+            return Response({"error": "No file provided."}, status=status.HTTP_400_BAD_REQUEST)
+        type_error = self.upload_type_error(file_obj)
+        if type_error:
+            return Response({"error": type_error}, status=status.HTTP_400_BAD_REQUEST)
+
         original_filename = file_obj.name
-        filename_base, file_extension = os.path.splitext(original_filename)
-        # Get the current Unix timestamp
-        timestamp = int(time.time())
-        new_file_path = f"{username}/{filename_base}-{timestamp}{file_extension}"
-        file_obj.name = new_file_path
+        file_obj.name = build_storage_name(request.user.username, original_filename)
 
         media_instance = media.objects.create(
             user=request.user,
             file=file_obj,
-            original_filename=original_filename 
+            original_filename=original_filename,
+            content_hash=getattr(file_obj, 'content_hash', ''),
+            content_type=getattr(file_obj, 'sniffed_content_type', ''),
+        )
+        # Header metadata is extracted in the background once this commits
+        # (see uploads.metadata).
+
+        return Response(
+            {"message": "File accepted and is being processed.", "id": str(media_instance.id)},
+            status=status.HTTP_202_ACCEPTED
         )
 
 
-        
-        media_instance.save()
+def _session_payload(session, offset):
+    return {
+        "id": str(session.id),
+        "original_filename": session.original_filename,
+        "total_size": session.total_size,
+        "offset": offset,
+        "status": session.status,
+        "expires_at": session.expires_at,
+    }
+
+
+def get_active_session(request, session_id):
+    """An active, unexpired session of the requesting user, or 404."""
+    return get_object_or_404(
+        UploadSession,
+        id=session_id,
+        user=request.user,
+        status=UploadSession.SessionStatus.ACTIVE,
+        expires_at__gt=timezone.now(),
+    )
+
+
+class UploadSessionCreateView(APIView):
+    """
+    Starts a resumable upload. The client then PUTs the file in chunks to the
+    session URL and finalizes it once every byte has been received.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        original_filename = os.path.basename(str(request.data.get('filename', '')).strip())
+        try:
+            total_size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            total_size = -1
+
+        if not original_filename or total_size < 0:
+            return Response({"error": "A filename and a size in bytes are required."}, status=status.HTTP_400_BAD_REQUEST)
+        if total_size > settings.MAX_RESUMABLE_UPLOAD_SIZE:
+            return Response(
+                {"error": f"File size cannot exceed {settings.MAX_RESUMABLE_UPLOAD_SIZE / 1024 / 1024}MB."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        session = resumable.create_session(request.user, original_filename, total_size)
+        return Response(_session_payload(session, 0), status=status.HTTP_201_CREATED)
+
+
+class UploadSessionView(APIView):
+    """
+    GET/HEAD reports the current offset, PUT appends a chunk at the offset
+    given in the `Upload-Offset` header (or `Content-Range`), DELETE aborts.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_session(self, request, session_id):
+        return get_active_session(request, session_id)
+
+    @staticmethod
+    def _requested_offset(request):
+        if 'HTTP_UPLOAD_OFFSET' in request.META:
+            return int(request.META['HTTP_UPLOAD_OFFSET'])
+        match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', request.META.get('HTTP_CONTENT_RANGE', ''))
+        if match:
+            return int(match.group(1))
+        raise ValueError("Missing Upload-Offset header.")
+
+    def get(self, request, session_id, *args, **kwargs):
+        session = self.get_session(request, session_id)
+        offset = resumable.current_offset(session)
+        return Response(_session_payload(session, offset), headers={'Upload-Offset': str(offset)})
+
+    def put(self, request, session_id, *args, **kwargs):
+        session = self.get_session(request, session_id)
+        try:
+            offset = self._requested_offset(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            offset = resumable.append_chunk(session, offset, request.stream)
+        except resumable.OffsetMismatch as e:
+            return Response(
+                {"error": str(e), "offset": e.offset},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Upload-Offset': str(e.offset)}
+            )
+        except resumable.SessionBusy:
+            return Response({"error": "Another chunk is being written to this session."}, status=status.HTTP_409_CONFLICT)
+
+        return Response(_session_payload(session, offset), headers={'Upload-Offset': str(offset)})
+
+    def delete(self, request, session_id, *args, **kwargs):
+        resumable.discard_session(self.get_session(request, session_id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-         # Here you would typically enqueue a background job to process the file
-         # For example:
-         # from .tasks import process_uploaded_file
-         # process_uploaded_file.delay(media_instance.id)
 
+class UploadSessionFinalizeView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, session_id, *args, **kwargs):
+        session = get_active_session(request, session_id)
+        offset = resumable.current_offset(session)
+        if offset != session.total_size:
+            return Response(
+                {"error": f"Upload incomplete: {offset} of {session.total_size} bytes received.", "offset": offset},
+                status=status.HTTP_409_CONFLICT
+            )
 
+        try:
+            content_type = resumable.sniff_session(session)
+            type_error = content_type_error(session.original_filename, content_type)
+            if type_error:
+                return Response({"error": type_error}, status=status.HTTP_400_BAD_REQUEST)
+            media_instance = resumable.finalize_session(
+                session, build_storage_name(request.user.username, session.original_filename), content_type
+            )
+        except resumable.SessionClosed:
+            return Response({"error": "This upload session is no longer active."}, status=status.HTTP_409_CONFLICT)
         return Response(
-            {"message": "File accepted and is being processed."},
+            {"message": "File accepted and is being processed.", "id": str(media_instance.id)},
             status=status.HTTP_202_ACCEPTED
         )
+
+
+class MediaDownloadView(APIView):
+    """
+    Sends an uploaded file back to its owner, with Range and conditional
+    request support. `?download=1` asks the browser to save it.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, media_id, *args, **kwargs):
+        media_instance = get_object_or_404(media, id=media_id, user=request.user)
+        return serve_media(request, media_instance, as_attachment=request.GET.get('download') == '1')